@@ -0,0 +1,7 @@
+# Package des décodeurs de capteurs : un module par modèle, chargé par scripts/decoder_registry.py
+#
+# Installé avec pip depuis la racine du dépôt (pyproject.toml), chaque décodeur est déclaré comme
+# entry point du groupe "iot_infra.decoders" : le listener, les outils de rejeu et device_manager
+# chargent les mêmes modules (et le même bytecode), quel que soit le répertoire courant.
+# Chaque module expose VERSION, la version de ses sorties (FIELDS), à incrémenter quand elles changent.
+__version__ = "1.2.0"
@@ -0,0 +1,80 @@
+# Décodage par lots : decode_many(payloads) -> colonnes {champ: séquence}
+#
+# Toutes les colonnes ont la longueur de `payloads`. La colonne "_ok" indique les
+# payloads décodés sans erreur ; une valeur absente vaut None (listes, décodage
+# générique) ou NaN (tableaux NumPy, décodeurs vectorisés).
+import base64
+
+try:
+    import numpy as np
+except ImportError:  # NumPy est optionnel : sans lui, on boucle sur decode()
+    np = None
+
+OK = "_ok"
+
+
+def decode_many_generic(decode, payloads):
+    """Repli générique : appelle decode() pour chaque payload et range le résultat en colonnes."""
+    n = len(payloads)
+    columns = {OK: [False] * n}
+    for i, payload in enumerate(payloads):
+        try:
+            decoded = decode(payload)
+        except Exception:
+            continue
+        columns[OK][i] = True
+        for key, value in decoded.items():
+            column = columns.get(key)
+            if column is None:
+                column = columns[key] = [None] * n
+            column[i] = value
+    return columns
+
+
+def stack_rows(raws, width):
+    """
+    Empile en une matrice uint8 (lignes x width) les payloads d'au moins `width` octets.
+
+    Retourne (indices des lignes retenues, matrice).
+    """
+    indices = [i for i, raw in enumerate(raws) if len(raw) >= width]
+    data = b"".join(raws[i][:width] for i in indices)
+    return np.array(indices, dtype=np.intp), np.frombuffer(data, dtype=np.uint8).reshape(len(indices), width)
+
+
+def b64decode_all(payloads):
+    raws = []
+    for payload in payloads:
+        try:
+            raws.append(base64.b64decode(payload))
+        except Exception:
+            raws.append(b"")
+    return raws
+
+
+def empty_columns(n, names):
+    columns = {OK: np.zeros(n, dtype=bool)}
+    for name in names:
+        columns[name] = np.full(n, np.nan)
+    return columns
+
+
+def rows(columns):
+    """Reconvertit des colonnes en une liste de dicts (None pour un payload en erreur)."""
+    ok = columns[OK]
+    if np is not None and isinstance(ok, np.ndarray):
+        ok = ok.tolist()
+    values = {}
+    for key, column in columns.items():
+        if key == OK:
+            continue
+        values[key] = column.tolist() if np is not None and isinstance(column, np.ndarray) else column
+    result = []
+    for i, decoded in enumerate(ok):
+        if not decoded:
+            result.append(None)
+            continue
+        # v == v écarte les NaN
+        result.append({key: column[i] for key, column in values.items()
+                       if column[i] is not None and column[i] == column[i]})
+    return result
@@ -0,0 +1,119 @@
+# Moteur TLV partagé des capteurs Milesight (AM100, AT101, WS301...)
+#
+# Une trame est une suite de canaux : [channel_id][channel_type][valeur].
+# Chaque modèle décrit ses canaux dans une table {(channel_id, channel_type): Channel}
+# compilée une fois par compile_channels() : une seule recherche dans la table par canal,
+# puis une fonction générée pour ce canal (unpack_from() d'un struct.Struct précompilé,
+# little-endian, et conversions en ligne).
+import struct
+from typing import NamedTuple, Optional
+
+
+class Channel(NamedTuple):
+    struct: struct.Struct
+    fields: tuple                  # ((nom, index dans la valeur dépaquetée, conversion), ...) cf. field()
+    history: Optional[str] = None  # si défini : les champs forment une entrée ajoutée à la liste decoded[history]
+
+
+def field(name, index=0, scale=None, factor=None, ndigits=None, flag=None, convert=None):
+    """
+    Champ produit par un canal (conversions appliquées dans cet ordre de priorité).
+
+    convert  : fonction de conversion arbitraire
+    flag     : couple (valeur si 0, valeur sinon), ex. ("close", "open")
+    scale    : diviseur appliqué à la valeur brute (ex. 10 pour des dixièmes de °C)
+    factor   : multiplicateur appliqué à la valeur brute, arrondi à ndigits si précisé
+    """
+    return (name, index, {"convert": convert, "flag": flag, "scale": scale, "factor": factor, "ndigits": ndigits})
+
+
+def channel(fmt, *fields, history=None):
+    """Canal dont la valeur suit le format struct `fmt` (sans préfixe d'ordre, little-endian imposé)."""
+    return Channel(struct.Struct("<" + fmt), tuple(fields), history)
+
+
+def _compile_channel(spec):
+    """
+    Génère la fonction de décodage d'un canal : fn(raw, i, n, result) -> index suivant, ou -1 si la
+    valeur est tronquée (moins de struct.size octets après l'en-tête).
+
+    Le code est spécialisé pour le canal (affectations directes, diviseurs en constantes,
+    lecture d'un octet sans struct pour le format "B"). La longueur est vérifiée avant la lecture :
+    une valeur tronquée ne produit aucun champ, et une exception levée par une conversion
+    (ex. code d'état hors table) n'est pas confondue avec une troncature.
+    """
+    namespace = {"_unpack_from": spec.struct.unpack_from}
+    count = len(spec.struct.unpack_from(bytes(spec.struct.size), 0))
+    values = ", ".join(f"v{k}" for k in range(count))
+    lines = [f"    if i + {spec.struct.size} > n:",
+             "        return -1"]
+    if spec.struct.format == "<B":
+        lines.append("    v0 = raw[i]")
+    else:
+        lines.append(f"    {values}, = _unpack_from(raw, i)")
+    target = "result"
+    if spec.history:
+        lines.append("    entry = {}")
+        lines.append(f"    result.setdefault({spec.history!r}, []).append(entry)")
+        target = "entry"
+    for k, (name, index, conv) in enumerate(spec.fields):
+        expr = f"v{index}"
+        if conv["convert"] is not None:
+            namespace[f"_convert{k}"] = conv["convert"]
+            expr = f"_convert{k}({expr})"
+        elif conv["flag"] is not None:
+            if_zero, otherwise = conv["flag"]
+            expr = f"({if_zero!r} if {expr} == 0 else {otherwise!r})"
+        elif conv["scale"] is not None:
+            expr = f"{expr} / {conv['scale']!r}"
+        elif conv["factor"] is not None:
+            expr = f"{expr} * {conv['factor']!r}"
+            if conv["ndigits"] is not None:
+                expr = f"round({expr}, {conv['ndigits']!r})"
+        lines.append(f"    {target}[{name!r}] = {expr}")
+    lines.append(f"    return i + {spec.struct.size}")
+    exec("def decode_channel(raw, i, n, result):\n" + "\n".join(lines), namespace)
+    return namespace["decode_channel"]
+
+
+def compile_channels(channels, unknown="stop"):
+    """
+    Compile la table d'un modèle en une fonction decode_tlv(raw) -> dict.
+
+    Chaque canal devient une fonction spécialisée, rangée dans un dict dont la clé est
+    l'entier (channel_id << 8) | channel_type : une seule recherche par canal, sans tuple.
+
+    unknown : "stop" -> un canal inconnu arrête le décodage (un en-tête tronqué lève ValueError)
+              "skip" -> un canal inconnu fait sauter un octet, un octet final isolé est ignoré
+    Une valeur tronquée (trame coupée après l'en-tête) arrête le décodage : les champs des canaux
+    précédents sont conservés. Les erreurs des conversions sont propagées.
+    """
+    table = {
+        (channel_id << 8) | channel_type: _compile_channel(spec)
+        for (channel_id, channel_type), spec in channels.items()
+    }
+    get = table.get
+    skip = unknown == "skip"
+
+    def decode_tlv(raw):
+        result = {}
+        i = 0
+        n = len(raw)
+        while i < n:
+            if i + 1 >= n:
+                if skip:
+                    break
+                raise ValueError(f"en-tête de canal tronqué à l'octet {i}")
+            decode_channel = get((raw[i] << 8) | raw[i + 1])
+            if decode_channel is None:
+                if skip:
+                    i += 3
+                    continue
+                break
+            i = decode_channel(raw, i + 2, n, result)
+            if i < 0:
+                # Valeur tronquée
+                break
+        return result
+
+    return decode_tlv
@@ -1,4 +1,15 @@
 # decoders/adeunis_ftd.py
+from ._batch import np, OK, decode_many_generic, b64decode_all, stack_rows, empty_columns
+
+VERSION = "1.0"
+
+# Champs produits par decode() : (type, unité)
+FIELDS = {
+    "temperature": (float, "°C"),
+    "rssi":        (int, "dBm"),
+    "latitude":    (float, "°"),
+    "longitude":   (float, "°"),
+}
 
 def decode(payload_b64):
     import base64
@@ -9,3 +20,20 @@ def decode(payload_b64):
         "latitude": (b[3] << 8 | b[4]) / 100,
         "longitude": (b[5] << 8 | b[6]) / 100
     }
+
+
+def decode_many(payloads):
+    """Décodage vectorisé (NumPy) d'un lot de payloads, voir decoders/_batch.py."""
+    if np is None:
+        return decode_many_generic(decode, payloads)
+    raws = b64decode_all(payloads)
+    columns = empty_columns(len(raws), FIELDS)
+    idx, b = stack_rows(raws, 7)
+    if len(idx):
+        b = b.astype(np.int64)
+        columns[OK][idx] = True
+        columns["temperature"][idx] = b[:, 0] + b[:, 1] / 100
+        columns["rssi"][idx] = b[:, 2] - 256
+        columns["latitude"][idx] = (b[:, 3] << 8 | b[:, 4]) / 100
+        columns["longitude"][idx] = (b[:, 5] << 8 | b[:, 6]) / 100
+    return columns
@@ -1,5 +1,28 @@
+# decoders/adeunis_ftd_gps.py
+# Trame native de l'Adeunis FTD (Field Test Device) : octet de statut dont chaque bit annonce un
+# bloc optionnel (température, GPS en BCD, compteurs de trames, batterie, RSSI/SNR de la voie
+# descendante). Anciennement scripts/decoders/adeunis_ftd.py, qui portait le même nom que le
+# décodeur adeunis_ftd de ce package pour un format différent.
+import base64
+
+VERSION = "1.0"
+
+# Champs produits par decode() : (type, unité)
+FIELDS = {
+    "temperature": (int, "°C"),
+    "trigger":     (str, ""),
+    "latitude":    (float, "°"),
+    "longitude":   (float, "°"),
+    "sats":        (int, ""),
+    "altitude":    (int, "m"),
+    "uplink":      (int, ""),
+    "downlink":    (int, ""),
+    "battery":     (int, "mV"),
+    "rssi":        (int, "dBm"),
+    "snr":         (int, "dB"),
+}
+
 def decode(payload_b64):
-    import base64
     b = list(base64.b64decode(payload_b64))
     decoded = {}
     offset = 0
@@ -1,73 +1,78 @@
 import base64
+from ._milesight import channel, field, compile_channels
 
+VERSION = "1.1"  # 1.1 : trame coupée au milieu d'une valeur -> champs déjà décodés (1.0 : erreur)
 
-def decode(frm_payload):
-    """
-    Decode Milesight AT101 uplink payload (Base64 encoded LoRaWAN FRM payload).
-    Returns a dict with decoded fields.
-    """
-    try:
-        raw = base64.b64decode(frm_payload)
-        decoded = {}
-        i = 0
-        while i < len(raw):
-            channel_id = raw[i]
-            channel_type = raw[i + 1]
-            i += 2
-
-            # Battery voltage (V)
-            if channel_id == 0x01 and channel_type == 0x75:
-                decoded["battery_voltage"] = raw[i] / 1000.0
-                i += 1
+# Champs produits par decode() : (type, unité)
+FIELDS = {
+    "battery_voltage":      (float, "V"),
+    "temperature":          (float, "°C"),
+    "latitude":             (float, "°"),
+    "longitude":            (float, "°"),
+    "motion_status":        (str, ""),
+    "geofence_status":      (str, ""),
+    "tamper_status":        (str, ""),
+    "temperature_abnormal": (str, ""),
+    # Positions enregistrées : chaque entrée devient un point horodaté à son "timestamp"
+    "history":              (list, "", {
+        "timestamp": (int, "s"),
+        "longitude": (float, "°"),
+        "latitude":  (float, "°"),
+    }),
+}
 
-            # Temperature (°C)
-            elif channel_id == 0x03 and channel_type == 0x67:
-                val = int.from_bytes(raw[i : i + 2], byteorder="little", signed=False)
-                decoded["temperature"] = val / 10.0
-                i += 2
+MOTION_STATUS = ["unknown", "start", "moving", "stop"]
+GEOFENCE_STATUS = ["inside", "outside", "unset", "unknown"]
 
-            # Location + motion + geofence
-            elif channel_id in (0x04, 0x84) and channel_type == 0x88:
-                # Latitude and longitude in microdegrees
-                lat_raw = int.from_bytes(raw[i : i + 4], byteorder="little", signed=True)
-                lon_raw = int.from_bytes(raw[i + 4 : i + 8], byteorder="little", signed=True)
-                status = raw[i + 8]
-                decoded["latitude"] = round(lat_raw * 1e-6, 6)
-                decoded["longitude"] = round(lon_raw * 1e-6, 6)
-                decoded["motion_status"] = ["unknown", "start", "moving", "stop"][status & 0x0F]
-                decoded["geofence_status"] = ["inside", "outside", "unset", "unknown"][status >> 4]
-                i += 9
+# Location + motion + geofence: latitude and longitude in microdegrees, then status byte
+LOCATION = channel(
+    "iiB",
+    field("latitude", 0, factor=1e-6, ndigits=6),
+    field("longitude", 1, factor=1e-6, ndigits=6),
+    field("motion_status", 2, convert=lambda v: MOTION_STATUS[v & 0x0F]),
+    field("geofence_status", 2, convert=lambda v: GEOFENCE_STATUS[v >> 4]),
+)
 
-            # Tamper status
-            elif channel_id == 0x07 and channel_type == 0x00:
-                decoded["tamper_status"] = "install" if raw[i] == 0 else "uninstall"
-                i += 1
+# AT101 channels: (channel_id, channel_type) -> value layout and produced fields
+CHANNELS = {
+    # Battery voltage (V)
+    (0x01, 0x75): channel("B", field("battery_voltage", scale=1000.0)),
+    # Temperature (°C)
+    (0x03, 0x67): channel("H", field("temperature", scale=10.0)),
+    (0x04, 0x88): LOCATION,
+    (0x84, 0x88): LOCATION,
+    # Tamper status
+    (0x07, 0x00): channel("B", field("tamper_status", flag=("install", "uninstall"))),
+    # Temperature with abnormal flag
+    (0x83, 0x67): channel(
+        "HB",
+        field("temperature", 0, scale=10.0),
+        field("temperature_abnormal", 1, flag=("normal", "abnormal")),
+    ),
+    # Historical location (one entry appended to "history" per record)
+    (0x20, 0xCE): channel(
+        "Iii",
+        field("timestamp", 0),
+        field("longitude", 1, factor=1e-6, ndigits=6),
+        field("latitude", 2, factor=1e-6, ndigits=6),
+        history="history",
+    ),
+}
 
-            # Temperature with abnormal flag
-            elif channel_id == 0x83 and channel_type == 0x67:
-                val = int.from_bytes(raw[i : i + 2], byteorder="little", signed=False)
-                decoded["temperature"] = val / 10.0
-                decoded["temperature_abnormal"] = "normal" if raw[i + 2] == 0 else "abnormal"
-                i += 3
 
-            # Historical location
-            elif channel_id == 0x20 and channel_type == 0xCE:
-                ts = int.from_bytes(raw[i : i + 4], byteorder="little", signed=False)
-                lon_raw = int.from_bytes(raw[i + 4 : i + 8], byteorder="little", signed=True)
-                lat_raw = int.from_bytes(raw[i + 8 : i + 12], byteorder="little", signed=True)
-                entry = {
-                    "timestamp": ts,
-                    "longitude": round(lon_raw * 1e-6, 6),
-                    "latitude": round(lat_raw * 1e-6, 6),
-                }
-                decoded.setdefault("history", []).append(entry)
-                i += 12
+_decode_tlv = compile_channels(CHANNELS, unknown="stop")
 
-            else:
-                # Unknown channel: stop parsing
-                break
 
-        return decoded
+def decode(frm_payload):
+    """
+    Decode Milesight AT101 uplink payload (Base64 encoded LoRaWAN FRM payload).
+    Returns a dict with decoded fields; stored positions uploaded when the tracker
+    comes back into coverage are listed under "history", one entry per record.
+    """
+    try:
+        raw = base64.b64decode(frm_payload)
+        # Unknown channel: stop parsing
+        return _decode_tlv(raw)
 
     except Exception as e:
         raise Exception(f"Erreur dans le décodeur AT101: {e}")
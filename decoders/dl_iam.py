@@ -2,49 +2,114 @@
 # Décoder DL‑IAM (Decentlab Indoor Ambiance Monitor)
 import base64
 import struct
+from ._batch import np, OK, decode_many_generic, b64decode_all, empty_columns
 
 PROTOCOL_VERSION = 2
 
+VERSION = '1.0'
+
+# Champs produits par decode() : (type, unité)
+FIELDS = {
+    'protocol_version':               (int, ''),
+    'device_id':                      (int, ''),
+    'flags':                          (int, ''),
+    'battery_voltage':                (float, 'V'),
+    'air_temperature':                (float, '°C'),
+    'air_humidity':                   (float, '%RH'),
+    'barometric_pressure':            (int, 'Pa'),
+    'ambient_light_visible_infrared': (int, ''),
+    'ambient_light_infrared':         (int, ''),
+    'illuminance':                    (float, 'lx'),
+    'co2_concentration':              (int, 'ppm'),
+    'co2_sensor_status':              (int, ''),
+    'raw_ir_reading':                 (int, ''),
+    'activity_counter':               (int, ''),
+    'total_voc':                      (int, 'ppb'),
+}
+
 # Capteurs selon le constructeur Decentlab
+# (conversions exprimées sur les mots de 16 bits x[0], x[1]... du capteur)
 SENSORS = [
     {'length': 1,
      'values': [
-         ('battery_voltage',       lambda x: x[0] / 1000)
+         ('battery_voltage',       'x[0] / 1000')
      ]},
     {'length': 2,
      'values': [
-         ('air_temperature',       lambda x: 175 * x[0] / 65535 - 45),
-         ('air_humidity',          lambda x: 100 * x[1] / 65535)
+         ('air_temperature',       '175 * x[0] / 65535 - 45'),
+         ('air_humidity',          '100 * x[1] / 65535')
      ]},
     {'length': 1,
      'values': [
-         ('barometric_pressure',   lambda x: x[0] * 2)
+         ('barometric_pressure',   'x[0] * 2')
      ]},
     {'length': 2,
      'values': [
-         ('ambient_light_visible_infrared', lambda x: x[0]),
-         ('ambient_light_infrared',         lambda x: x[1]),
-         ('illuminance',                    lambda x: max(
-             max(1.0 * x[0] - 1.64 * x[1], 0.59 * x[0] - 0.86 * x[1]),
-             0
-         ) * 1.5504)
+         ('ambient_light_visible_infrared', 'x[0]'),
+         ('ambient_light_infrared',         'x[1]'),
+         ('illuminance',                    'max('
+                                            'max(1.0 * x[0] - 1.64 * x[1], 0.59 * x[0] - 0.86 * x[1]), '
+                                            '0) * 1.5504')
      ]},
     {'length': 3,
      'values': [
-         ('co2_concentration',    lambda x: x[0] - 32768),
-         ('co2_sensor_status',    lambda x: x[1]),
-         ('raw_ir_reading',       lambda x: x[2])
+         ('co2_concentration',    'x[0] - 32768'),
+         ('co2_sensor_status',    'x[1]'),
+         ('raw_ir_reading',       'x[2]')
      ]},
     {'length': 1,
      'values': [
-         ('activity_counter',     lambda x: x[0])
+         ('activity_counter',     'x[0]')
      ]},
     {'length': 1,
      'values': [
-         ('total_voc',            lambda x: x[0])
+         ('total_voc',            'x[0]')
      ]}
 ]
 
+HEADER = struct.Struct('>BHH')
+
+# Bits de flags qui désignent un capteur (les autres n'ont pas d'effet sur le décodage)
+SENSOR_MASK = (1 << len(SENSORS)) - 1
+
+# Plans de décodage précompilés, un par combinaison de capteurs (flags & SENSOR_MASK)
+_PLANS = {}
+
+
+def _compile_plan(mask):
+    """
+    Génère pour une combinaison de capteurs une fonction plan(raw, device_id, flags) -> dict :
+    un seul unpack_from des mots présents puis les conversions en ligne droite.
+    """
+    words = 0
+    lines = []
+    for bit, sensor in enumerate(SENSORS):
+        if not (mask & (1 << bit)):
+            continue
+        for key, expr in sensor['values']:
+            for j in range(sensor['length']):
+                expr = expr.replace(f'x[{j}]', f'w{words + j}')
+            lines.append(f"        {key!r}: {expr},")
+        words += sensor['length']
+    size = 5 + 2 * words
+    unpack = "    " + "".join(f"w{k}, " for k in range(words)) + "= _unpack_from(raw, 5)\n" if words else ""
+    source = (
+        "def plan(raw, device_id, flags):\n"
+        f"    if len(raw) < {size}:\n"
+        f"        raise ValueError(f'payload trop court: {{len(raw)}} octets, {size} attendus')\n"
+        + unpack +
+        "    return {\n"
+        f"        'protocol_version': {PROTOCOL_VERSION},\n"
+        "        'device_id':        device_id,\n"
+        "        'flags':            flags,\n"
+        + "\n".join(lines) + "\n"
+        "    }\n"
+    )
+    namespace = {'_unpack_from': struct.Struct('>' + 'H' * words).unpack_from}
+    exec(source, namespace)
+    return namespace['plan']
+
+
 def decode(frm_payload):
     """
     :param frm_payload: chaîne Base64 du payload brut
@@ -52,36 +117,74 @@ def decode(frm_payload):
     """
     try:
         raw = base64.b64decode(frm_payload)
-        # protocole
-        version = raw[0]
+        # protocole, ID appareil + flags
+        version, device_id, flags = HEADER.unpack_from(raw)
         if version != PROTOCOL_VERSION:
             raise ValueError(f"Protocol version {version} inattendue, attendu {PROTOCOL_VERSION}")
-        # ID appareil + flags
-        device_id = struct.unpack('>H', raw[1:3])[0]
-        flags     = struct.unpack('>H', raw[3:5])[0]
-        # découpés en mots de 16 bits
-        words = [
-            struct.unpack('>H', raw[i:i+2])[0]
-            for i in range(5, len(raw), 2)
-        ]
-        # lecture conditionnelle via flags
-        cursor = 0
-        result = {
-            'protocol_version': version,
-            'device_id':        device_id,
-            'flags':            flags
-        }
-        for bit, sensor in enumerate(SENSORS):
-            if not (flags & (1 << bit)):
-                continue
-            chunk = words[cursor:cursor + sensor['length']]
-            cursor += sensor['length']
-            for key, conv in sensor['values']:
-                try:
-                    result[key] = conv(chunk)
-                except Exception as e:
-                    raise ValueError(f"Erreur conversion {key}: {e}")
-        return result
+        if len(raw) % 2 == 0:
+            raise ValueError("payload incomplet (mot de 16 bits tronqué)")
+        # lecture conditionnelle via flags, avec un plan compilé une fois par combinaison de capteurs
+        mask = flags & SENSOR_MASK
+        plan = _PLANS.get(mask)
+        if plan is None:
+            plan = _PLANS[mask] = _compile_plan(mask)
+        return plan(raw, device_id, flags)
 
     except Exception as e:
         raise Exception(f"Erreur dans le décodeur DL‑IAM: {e}")
+
+
+# Plans vectorisés (NumPy) pour decode_many, un par combinaison de capteurs
+_VECTOR_PLANS = {}
+
+
+def _compile_vector_plan(mask):
+    """Retourne (nombre de mots, [(champ, expression compilée sur la matrice de mots w)])."""
+    words = 0
+    exprs = []
+    for bit, sensor in enumerate(SENSORS):
+        if not (mask & (1 << bit)):
+            continue
+        for key, expr in sensor['values']:
+            for j in range(sensor['length']):
+                expr = expr.replace(f'x[{j}]', f'w[:, {words + j}]')
+            expr = expr.replace('max(', '_maximum(')
+            exprs.append((key, compile(expr, f'<dl_iam mask={mask}>', 'eval')))
+        words += sensor['length']
+    return words, exprs
+
+
+def decode_many(payloads):
+    """
+    Décodage vectorisé (NumPy) d'un lot de payloads, voir decoders/_batch.py.
+
+    Les payloads sont regroupés par (capteurs présents, longueur) : chaque groupe est une matrice
+    de mots de 16 bits sur laquelle les conversions s'appliquent colonne par colonne.
+    """
+    if np is None:
+        return decode_many_generic(decode, payloads)
+    raws = b64decode_all(payloads)
+    columns = empty_columns(len(raws), FIELDS)
+    groups = {}
+    for i, raw in enumerate(raws):
+        if len(raw) < 5 or len(raw) % 2 == 0 or raw[0] != PROTOCOL_VERSION:
+            continue
+        groups.setdefault((((raw[3] << 8) | raw[4]) & SENSOR_MASK, len(raw)), []).append(i)
+    namespace = {'_maximum': np.maximum}
+    for (mask, length), indices in groups.items():
+        plan = _VECTOR_PLANS.get(mask)
+        if plan is None:
+            plan = _VECTOR_PLANS[mask] = _compile_vector_plan(mask)
+        words, exprs = plan
+        if length < 5 + 2 * words:
+            continue
+        idx = np.array(indices, dtype=np.intp)
+        m = np.frombuffer(b"".join(raws[i] for i in indices), dtype=np.uint8).reshape(len(indices), length)
+        w = np.ascontiguousarray(m[:, 5:5 + 2 * words]).view('>u2').astype(np.int64)
+        columns[OK][idx] = True
+        columns['protocol_version'][idx] = PROTOCOL_VERSION
+        columns['device_id'][idx] = (m[:, 1].astype(np.int64) << 8) | m[:, 2]
+        columns['flags'][idx] = (m[:, 3].astype(np.int64) << 8) | m[:, 4]
+        for key, code in exprs:
+            columns[key][idx] = eval(code, namespace, {'w': w})
+    return columns
@@ -1,3 +1,15 @@
+from ._batch import np, OK, decode_many_generic, stack_rows, empty_columns
+
+VERSION = "2.0"  # 2.0 : valeurs numériques (1.x : chaînes formatées, ex. "21.50")
+
+# Champs produits par decode() : (type, unité)
+FIELDS = {
+    "temp":    (float, "°C"),
+    "hum":     (float, "%RH"),
+    "period":  (int, "s"),
+    "battery": (float, "V"),
+}
+
 def decode(payload_b64):
     """
     Décode le payload du capteur rhf1s001.
@@ -12,13 +24,14 @@ def decode(payload_b64):
     Retourne:
         Un dictionnaire de la forme :
         {
-          "temp": "XX.XX", 
-          "hum": "XX.XX",
-          "period": "XX sec",
-          "battery": "XX.XX"
+          "temp": XX.XX,      # °C, arrondi à 2 décimales
+          "hum": XX.XX,       # %RH, arrondi à 2 décimales
+          "period": XX,       # secondes
+          "battery": XX.XX    # V, arrondi à 2 décimales
         }
     
-    Remarque: Cette fonction correspond à la logique JavaScript suivante:
+    Remarque: Cette fonction correspond à la logique JavaScript suivante
+    (les valeurs sont numériques au lieu des chaînes de toFixed() et du suffixe " sec"):
     
     function Decoder(bytes, port) {
       var obj = new Object();
@@ -72,30 +85,70 @@ def decode(payload_b64):
             except Exception as e:
                 raise Exception(f"Erreur lors du décodage de la température : {e}")
             temp_decoded = (temp_encoded * 175.72 / 65536) - 46.85
-            decoded["temp"] = f"{temp_decoded:.2f}"
+            decoded["temp"] = round(temp_decoded, 2)
             offset += 1
         
         # Humidité : octet 3
         if len(b) > 3:
             hum_encoded = b[3]
             hum_decoded = (hum_encoded * 125 / 256) - 6
-            decoded["hum"] = f"{hum_decoded:.2f}"
+            decoded["hum"] = round(hum_decoded, 2)
         
         # Période : (bytes[5] << 8) | bytes[4]
         if len(b) >= 6:
             period_encoded = (b[5] << 8) | b[4]
             period_decoded = period_encoded * 2
-            decoded["period"] = f"{period_decoded} sec"
+            decoded["period"] = period_decoded
         
         # Batterie : octet 8
         if len(b) >= 9:
             battery_encoded = b[8]
             battery_decoded = (battery_encoded + 150) * 0.01
-            decoded["battery"] = f"{battery_decoded:.2f}"
+            decoded["battery"] = round(battery_decoded, 2)
     
     return decoded
 
 
+def decode_many(payloads):
+    """
+    Décodage vectorisé (NumPy) d'un lot de payloads, voir decoders/_batch.py.
+
+    np.round() peut différer de round() sur le dernier chiffre d'une valeur exactement
+    à mi-chemin (de l'ordre d'un payload sur 50 000).
+    """
+    if np is None:
+        return decode_many_generic(decode, payloads)
+    raws = [_b64decode_padded(payload) for payload in payloads]
+    columns = empty_columns(len(raws), FIELDS)
+    # decode() renvoie {} pour 0 ou 1 octet et échoue sur 2 octets (température tronquée)
+    columns[OK][:] = [raw is not None and len(raw) != 2 for raw in raws]
+    raws = [raw or b"" for raw in raws]
+    idx, b = stack_rows(raws, 3)
+    if len(idx):
+        b = b.astype(np.int64)
+        columns["temp"][idx] = np.round((b[:, 2] << 8 | b[:, 1]) * 175.72 / 65536 - 46.85, 2)
+    idx, b = stack_rows(raws, 4)
+    if len(idx):
+        columns["hum"][idx] = np.round(b[:, 3].astype(np.int64) * 125 / 256 - 6, 2)
+    idx, b = stack_rows(raws, 6)
+    if len(idx):
+        b = b.astype(np.int64)
+        columns["period"][idx] = (b[:, 5] << 8 | b[:, 4]) * 2
+    idx, b = stack_rows(raws, 9)
+    if len(idx):
+        columns["battery"][idx] = np.round((b[:, 8].astype(np.int64) + 150) * 0.01, 2)
+    return columns
+
+
+def _b64decode_padded(payload_b64):
+    import base64
+    try:
+        payload_b64 = payload_b64.strip()
+        return base64.b64decode(payload_b64 + '=' * (-len(payload_b64) % 4), validate=False)
+    except Exception:
+        return None
+
+
 # Test du décodeur (optionnel)
 if __name__ == "__main__":
     # Exemple de payload Base64 (à adapter avec un vrai exemple)
@@ -1,4 +1,27 @@
 import base64
+from ._milesight import channel, field, compile_channels
+
+VERSION = "1.1"  # 1.1 : trame coupée au milieu d'une valeur -> champs déjà décodés (1.0 : erreur)
+
+# Champs produits par decode() : (type, unité)
+FIELDS = {
+    "battery":       (int, "%"),
+    "magnet_status": (str, ""),
+    "tamper_status": (str, ""),
+}
+
+# Canaux WS301 : (channel_id, channel_type) -> format de la valeur et champs produits
+CHANNELS = {
+    # Battery (0x01, type 0x75)
+    (0x01, 0x75): channel("B", field("battery")),
+    # Door/Window state (0x03, type 0x00)
+    (0x03, 0x00): channel("B", field("magnet_status", flag=("close", "open"))),
+    # Install (tamper) state (0x04, type 0x00)
+    (0x04, 0x00): channel("B", field("tamper_status", flag=("installed", "uninstalled"))),
+}
+
+
+_decode_tlv = compile_channels(CHANNELS, unknown="stop")
 
 
 def decode(frm_payload):
@@ -9,36 +32,8 @@ def decode(frm_payload):
     try:
         # Decode base64-encoded payload to raw bytes
         payload = base64.b64decode(frm_payload)
-        index = 0
-        result = {}
-
-        # Iterate through TLV-encoded payload
-        while index < len(payload):
-            channel_id = payload[index]
-            index += 1
-            channel_type = payload[index]
-            index += 1
-
-            # Battery (0x01, type 0x75)
-            if channel_id == 0x01 and channel_type == 0x75:
-                result["battery"] = payload[index]
-                index += 1
-
-            # Door/Window state (0x03, type 0x00)
-            elif channel_id == 0x03 and channel_type == 0x00:
-                result["magnet_status"] = "close" if payload[index] == 0 else "open"
-                index += 1
-
-            # Install (tamper) state (0x04, type 0x00)
-            elif channel_id == 0x04 and channel_type == 0x00:
-                result["tamper_status"] = "installed" if payload[index] == 0 else "uninstalled"
-                index += 1
-
-            else:
-                # Unrecognized channel, stop parsing
-                break
-
-        return result
+        # Unrecognized channel: stop parsing
+        return _decode_tlv(payload)
 
     except Exception as e:
         raise Exception(f"Erreur dans le décodeur WS301: {e}")
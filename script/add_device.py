@@ -1,28 +1,33 @@
 # add_device.py
 
 #!/usr/bin/env python3
-import json
 import os
-from pathlib import Path
+import sys
 
-devices_path = Path("devices.json")
+# Modules du listener : dans scripts/ du dépôt, sinon dans /opt/iot-infra une fois déployés
+sys.path[:0] = [os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"), "/opt/iot-infra"]
+import decoder_registry
+import device_store
+import provision_devices
 
-def load_devices():
-    if devices_path.exists():
-        with open(devices_path, "r") as f:
-            return json.load(f)
-    return {}
-
-def save_devices(devices):
-    with open(devices_path, "w") as f:
-        json.dump(devices, f, indent=4)
+# Store partagé avec le listener (DEVICES_DB, /opt/iot-infra/devices.db par défaut) :
+# l'ajout est une transaction, le listener recharge sa table à chaud
+store = device_store.DeviceStore()
 
 print("➕ Ajouter un device")
 dev_eui = input("dev_eui (ex: AABBCCDDEEFF0011): ").strip()
 type_capteur = input("Type de capteur (ex: adeunis_ftd): ").strip()
 
-devices = load_devices()
-devices[dev_eui] = type_capteur
-save_devices(devices)
+# Mêmes règles que le provisionnement en masse : DevEUI sur 16 caractères hexadécimaux, décodeur connu
+decoders = decoder_registry.available_decoders()
+devices, errors = provision_devices.validate([("saisie", dev_eui, type_capteur)], set(decoders))
+if errors:
+    for error in errors:
+        print(f"❌ {error}")
+    print(f"Décodeurs disponibles : {', '.join(decoders)}")
+    sys.exit(1)
+dev_eui, type_capteur = devices[0]
+
+store.upsert(dev_eui, type_capteur)
 
-print(f"✅ Device {dev_eui} ajouté comme '{type_capteur}'")
+print(f"✅ Device {dev_eui} ajouté comme '{type_capteur}' dans {store.path}")
@@ -13,6 +13,7 @@ python3 -m venv venv
 source venv/bin/activate
 
 pip install --upgrade pip
-pip install paho-mqtt influxdb-client python-dotenv
+# influxdb-client épinglé : influx_writer.py chronomètre les écritures via une méthode interne du client
+pip install paho-mqtt "influxdb-client==1.50.0" python-dotenv
 
 echo "✅ Environnement Python prêt"
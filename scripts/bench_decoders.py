@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# Corpus de référence et micro-benchmark des décodeurs
+#
+# Le corpus est un fichier JSON par décodeur dans <decoders>/corpus/<nom>.json :
+#   [{"name": ..., "frm_payload": "<base64>", "expected": {...}}, ...]
+# Un cas dont le décodage doit échouer porte "expected_error": true à la place de "expected".
+#
+# Usage :
+#   python3 bench_decoders.py --check                    vérifie les sorties contre le corpus et le schéma FIELDS,
+#                                                        et decode_many() contre decode() cas par cas
+#   python3 bench_decoders.py --update-golden            régénère les "expected" depuis les décodeurs actuels
+#   python3 bench_decoders.py [--save-baseline f.json]   benchmark (ns/op, octets alloués/op, msg/s par cœur)
+#   python3 bench_decoders.py --baseline f.json          benchmark comparé à une référence enregistrée
+import os
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+import decoder_registry
+
+
+def corpus_path(corpus_dir, name):
+    return os.path.join(corpus_dir, f"{name}.json")
+
+
+def load_corpus(corpus_dir, name):
+    path = corpus_path(corpus_dir, name)
+    if not os.path.exists(path):
+        return []
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def normalize(value):
+    # Comparaison sur la forme JSON (tuples -> listes, clés en chaînes)
+    return json.loads(json.dumps(value))
+
+
+def schema_errors(schema, output, prefix=""):
+    """
+    Champs de la sortie absents de FIELDS ou d'un type différent (int accepté pour float).
+
+    Les entrées d'un champ historique sont vérifiées contre son sous-schéma.
+    """
+    errors = []
+    for key, value in output.items():
+        spec = schema.get(key)
+        if spec is None:
+            errors.append(f"champ '{prefix}{key}' absent de FIELDS")
+        elif not isinstance(value, spec.type) and not (spec.type is float and isinstance(value, int)):
+            errors.append(f"champ '{prefix}{key}' de type {type(value).__name__}, attendu {spec.type.__name__}")
+        elif spec.items is not None:
+            for i, entry in enumerate(value):
+                if decoder_registry.TIME_FIELD not in entry:
+                    errors.append(f"entrée '{prefix}{key}[{i}]' sans {decoder_registry.TIME_FIELD}")
+                errors.extend(schema_errors(spec.items, entry, f"{prefix}{key}[{i}]."))
+    return errors
+
+
+def check(decoders, corpus_dir):
+    """
+    Vérifie decode() contre le corpus et le schéma FIELDS, puis decode_many() (vectorisé ou générique)
+    sur tout le corpus en un lot : chaque ligne doit être identique à la sortie de decode()
+    (None pour un payload en erreur). Retourne le nombre d'échecs.
+    """
+    failures = 0
+    for name, decoder in decoders.items():
+        cases = load_corpus(corpus_dir, name)
+        if not cases:
+            print(f"⚠️ {name}: aucun cas dans le corpus")
+            continue
+        decoder_failures = 0
+        outputs = []
+        for case in cases:
+            try:
+                output = normalize(decoder.decode(case["frm_payload"]))
+                error = None
+            except Exception as e:
+                output, error = None, e
+            outputs.append(output)
+            if case.get("expected_error"):
+                ok = error is not None
+                detail = f"sortie inattendue {output}"
+            else:
+                ok = error is None and output == case["expected"]
+                detail = f"erreur {error}" if error else f"obtenu {output}, attendu {case['expected']}"
+                if ok and decoder.fields:
+                    errors = schema_errors(decoder.fields, decoder.decode(case["frm_payload"]))
+                    ok, detail = not errors, ", ".join(errors)
+            if not ok:
+                decoder_failures += 1
+                print(f"❌ {name}/{case['name']}: {detail}")
+        try:
+            batch = decoder_registry.decode_rows(decoder, [case["frm_payload"] for case in cases])
+        except Exception as e:
+            decoder_failures += 1
+            print(f"❌ {name}: decode_many() en erreur: {e}")
+        else:
+            for case, output, row in zip(cases, outputs, batch):
+                row = None if row is None else normalize(row)
+                if row != output:
+                    decoder_failures += 1
+                    print(f"❌ {name}/{case['name']}: decode_many() {row}, decode() {output}")
+        failures += decoder_failures
+        print(f"{'✅' if not decoder_failures else '  '} {name}: {len(cases)} cas")
+    return failures
+
+
+def update_golden(decoders, corpus_dir):
+    for name, decoder in decoders.items():
+        cases = load_corpus(corpus_dir, name)
+        for case in cases:
+            case.pop("expected", None)
+            case.pop("expected_error", None)
+            try:
+                case["expected"] = normalize(decoder.decode(case["frm_payload"]))
+            except Exception:
+                case["expected_error"] = True
+        if cases:
+            with open(corpus_path(corpus_dir, name), "w") as f:
+                json.dump(cases, f, indent=2, ensure_ascii=False)
+                f.write("\n")
+            print(f"{name}: {len(cases)} cas mis à jour")
+
+
+def bench_decoder(decode, payloads, min_time):
+    """Retourne (ns/op, octets alloués au pic par op) sur les payloads valides du corpus."""
+    n = len(payloads)
+    # Calibrage : nombre d'itérations pour durer au moins min_time
+    iterations = n
+    while True:
+        start = time.perf_counter_ns()
+        for i in range(iterations):
+            decode(payloads[i % n])
+        elapsed = time.perf_counter_ns() - start
+        if elapsed >= min_time * 1e9:
+            break
+        iterations *= 2
+    ns_per_op = elapsed / iterations
+
+    tracemalloc.start()
+    total = 0
+    for payload in payloads:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        decode(payload)
+        total += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    return ns_per_op, total / n
+
+
+def bench(decoders, corpus_dir, min_time):
+    results = {}
+    for name, decoder in decoders.items():
+        payloads = [c["frm_payload"] for c in load_corpus(corpus_dir, name) if not c.get("expected_error")]
+        if not payloads:
+            continue
+        ns_per_op, bytes_per_op = bench_decoder(decoder.decode, payloads, min_time)
+        results[name] = {"ns_per_op": ns_per_op, "bytes_per_op": bytes_per_op, "msgs_per_s": 1e9 / ns_per_op}
+    return results
+
+
+def report(results, baseline, max_regression):
+    regressions = 0
+    print(f"{'décodeur':12s} {'ns/op':>10s} {'B/op':>8s} {'msg/s/cœur':>12s} {'vs réf.':>9s}")
+    for name, r in results.items():
+        delta = ""
+        ref = baseline.get(name) if baseline else None
+        if ref:
+            ratio = r["ns_per_op"] / ref["ns_per_op"] - 1
+            delta = f"{ratio:+.1%}"
+            if ratio > max_regression:
+                regressions += 1
+                delta += " ❌"
+        print(f"{name:12s} {r['ns_per_op']:10.0f} {r['bytes_per_op']:8.0f} {r['msgs_per_s']:12.0f} {delta:>9s}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Corpus de référence et benchmark des décodeurs")
+    parser.add_argument("--decoders-dir", default=decoder_registry.DECODERS_DIR,
+                        help="package non installé (par défaut, décodeurs installés)")
+    parser.add_argument("--corpus-dir", help="par défaut corpus/ du package des décodeurs")
+    parser.add_argument("--only", action="append", help="limiter à ce décodeur (répétable)")
+    parser.add_argument("--check", action="store_true", help="vérifier les sorties contre le corpus")
+    parser.add_argument("--update-golden", action="store_true", help="régénérer les sorties attendues")
+    parser.add_argument("--min-time", type=float, default=0.5, help="durée minimale de mesure par décodeur (s)")
+    parser.add_argument("--baseline", help="référence JSON à laquelle comparer")
+    parser.add_argument("--save-baseline", help="enregistrer les résultats comme référence")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="ralentissement toléré (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    try:
+        decoders = decoder_registry.load_decoders(args.decoders_dir)
+    except RuntimeError as e:
+        parser.error(str(e))
+    package_dir = decoder_registry.package_dir()
+    corpus_dir = args.corpus_dir or (package_dir and os.path.join(package_dir, "corpus"))
+    if not corpus_dir or not os.path.isdir(corpus_dir):
+        parser.error(f"corpus introuvable ({corpus_dir or 'package des décodeurs inconnu'}), utiliser --corpus-dir")
+    if args.only:
+        decoders = {name: d for name, d in decoders.items() if name in args.only}
+
+    if args.update_golden:
+        update_golden(decoders, corpus_dir)
+        return 0
+    if args.check:
+        return 1 if check(decoders, corpus_dir) else 0
+
+    if check(decoders, corpus_dir):
+        print("Le corpus ne passe pas, benchmark annulé")
+        return 1
+    results = bench(decoders, corpus_dir, args.min_time)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+    regressions = report(results, baseline, args.max_regression)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
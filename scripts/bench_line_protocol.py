@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# Comparaison de l'encodeur line protocol direct (line_protocol.py) avec influxdb_client.Point
+#
+# Usage : python3 bench_line_protocol.py [--decoders-dir DIR] [--devices N] [--repeat N]
+# Les champs viennent du corpus des décodeurs, validés par Decoder.coerce() comme dans le listener.
+# Sort en erreur si une ligne diffère de celle produite par Point (référence).
+import os
+import sys
+import time
+import argparse
+from influxdb_client import Point, WritePrecision
+import decoder_registry
+import line_protocol
+from bench_decoders import load_corpus
+
+
+def reference_line(dev_eui, fields, timestamp):
+    point = Point("iot").tag("dev_eui", dev_eui).time(timestamp, WritePrecision.NS)
+    for key, value in fields.items():
+        point.field(key, value)
+    return point.to_line_protocol()
+
+
+def load_points(decoders_dir, devices):
+    decoders = decoder_registry.load_decoders(decoders_dir)
+    samples = []
+    package_dir = decoder_registry.package_dir()
+    if package_dir is None:
+        raise RuntimeError("package des décodeurs inconnu, corpus introuvable")
+    corpus_dir = os.path.join(package_dir, "corpus")
+    for name, decoder in decoders.items():
+        for case in load_corpus(corpus_dir, name):
+            if case.get("expected_error"):
+                continue
+            fields = decoder.coerce(decoder.decode(case["frm_payload"]))
+            if fields:
+                samples.append(fields)
+    timestamp = time.time_ns()
+    # Quelques DevEUI à échapper pour vérifier les préfixes
+    dev_euis = [f"24E124128C{i:06X}" for i in range(devices)] + ["A,B C=D", "FIN\\"]
+    return [(dev_euis[i % len(dev_euis)], samples[i % len(samples)], timestamp + i)
+            for i in range(max(len(samples), len(dev_euis)) * 4)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Encodeur line protocol direct contre influxdb_client.Point")
+    parser.add_argument("--decoders-dir", default=decoder_registry.DECODERS_DIR)
+    parser.add_argument("--devices", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=50000, help="nombre total de points encodés")
+    args = parser.parse_args()
+
+    try:
+        points = load_points(args.decoders_dir, args.devices)
+    except RuntimeError as e:
+        parser.error(str(e))
+    mismatches = 0
+    for point in points:
+        expected = reference_line(*point)
+        got = line_protocol.encode_line(*point)
+        if got != expected:
+            mismatches += 1
+            print(f"❌ {got!r} != {expected!r}")
+    print(f"{'✅' if not mismatches else '❌'} {len(points)} points comparés à Point, {mismatches} différence(s)")
+
+    n = len(points)
+    encoders = {
+        "point": lambda dev_eui, fields, timestamp: reference_line(dev_eui, fields, timestamp).encode(),
+        "line": line_protocol.encode,
+    }
+    for name, encode in encoders.items():
+        start = time.perf_counter()
+        for i in range(args.repeat):
+            encode(*points[i % n])
+        elapsed = time.perf_counter() - start
+        print(f"{name:6s} {elapsed / args.repeat * 1e9:8.0f} ns/point  {args.repeat / elapsed:10.0f} points/s")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# Benchmark des backends de parsing d'uplink TTN (voir uplink_parser.py)
+#
+# Usage : python3 bench_uplink_parser.py [uplinks.ndjson[.gz]] [--repeat N]
+# Sans fichier, un uplink synthétique entendu par --gateways passerelles est utilisé.
+import gzip
+import json
+import time
+import argparse
+import uplink_parser
+
+
+def synthetic_uplink(gateways):
+    rx_metadata = [{
+        "gateway_ids": {"gateway_id": f"gw-{i}", "eui": f"{i:016X}"},
+        "time": "2024-05-01T12:00:00.123456Z",
+        "timestamp": 1234567890 + i,
+        "rssi": -90 - i, "channel_rssi": -90 - i, "snr": 7.5,
+        "location": {"latitude": 46.5, "longitude": 6.6, "altitude": 400, "source": "SOURCE_REGISTRY"},
+        "uplink_token": "ChIKEAoOZ3ctMDAwMDAwMDAwMDAwEgj" + "A" * 40,
+        "received_at": "2024-05-01T12:00:00.123456Z",
+    } for i in range(gateways)]
+    return json.dumps({
+        "end_device_ids": {
+            "device_id": "eui-24e124128c012345",
+            "application_ids": {"application_id": "iot-infra"},
+            "dev_eui": "24E124128C012345",
+            "join_eui": "24E124C0002A0001",
+            "dev_addr": "260B1234",
+        },
+        "correlation_ids": ["gs:uplink:01HX0000000000000000000000"],
+        "received_at": "2024-05-01T12:00:00.223456Z",
+        "uplink_message": {
+            "session_key_id": "AYz0000000000000000000==",
+            "f_port": 85,
+            "f_cnt": 4242,
+            "frm_payload": "AXVkA2f3AARoSQV9WgQ=",
+            "rx_metadata": rx_metadata,
+            "settings": {"data_rate": {"lora": {"bandwidth": 125000, "spreading_factor": 7}},
+                         "frequency": "868100000", "timestamp": 1234567890},
+            "received_at": "2024-05-01T12:00:00.200000Z",
+            "consumed_airtime": "0.061696s",
+            "network_ids": {"net_id": "000013", "tenant_id": "ttn", "cluster_id": "eu1"},
+        },
+    }).encode()
+
+
+def load_messages(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark des backends de parsing d'uplink TTN")
+    parser.add_argument("file", nargs="?", help="uplinks TTN enregistrés (NDJSON, éventuellement gzip)")
+    parser.add_argument("--gateways", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=20000, help="nombre total de messages parsés")
+    args = parser.parse_args()
+
+    messages = load_messages(args.file) if args.file else [synthetic_uplink(args.gateways)]
+    size = sum(len(m) for m in messages) / len(messages)
+    print(f"{len(messages)} message(s), {size:.0f} octets en moyenne, {args.repeat} parsings par backend")
+
+    reference = None
+    for name in uplink_parser.available_backends():
+        _, parse = uplink_parser.get_parser(name)
+        results = [parse(m) for m in messages]
+        if reference is None:
+            reference = results
+        elif results != reference:
+            print(f"⚠️ {name}: résultats différents du premier backend")
+        n = len(messages)
+        start = time.perf_counter()
+        for i in range(args.repeat):
+            parse(messages[i % n])
+        elapsed = time.perf_counter() - start
+        print(f"{name:8s} {elapsed / args.repeat * 1e6:8.2f} µs/msg  {args.repeat / elapsed:10.0f} msg/s")
+
+
+if __name__ == "__main__":
+    main()
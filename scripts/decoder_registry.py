@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+# Registre des décodeurs : le package decoders est chargé une seule fois au démarrage
+#
+# Source des modules :
+#   - package installé (pip install depuis la racine du dépôt) : entry points du groupe
+#     "iot_infra.decoders", indépendants du répertoire courant et de sys.path (par défaut)
+#   - DECODERS_DIR : répertoire d'un package decoders non installé (développement, corpus)
+#   - sans l'un ni l'autre, repli sur le package decoders/ du dépôt (scripts lancés depuis une copie
+#     du dépôt), puis sur LEGACY_DECODERS_DIR ; si aucun ne fournit de décodeur, le chargement échoue
+#
+# Contrat de sortie : decode(frm_payload) retourne un dict décrit par l'attribut FIELDS du module.
+#   - les champs de premier niveau forment un enregistrement, horodaté à la réception de l'uplink
+#   - un champ historique, déclaré (list, "", {sous-schéma}), contient d'autres enregistrements,
+#     chacun horodaté par son TIME_FIELD (secondes Unix), ex. les positions stockées d'un AT101
+# Decoder.points() en tire la liste des points de l'uplink, écrits ensemble en une seule écriture.
+import os
+import sys
+import pkgutil
+import logging
+import functools
+from importlib import metadata
+from dataclasses import dataclass, field
+from importlib import import_module
+from typing import NamedTuple
+
+DECODERS_DIR = os.getenv("DECODERS_DIR", "")                 # vide : package installé (entry points)
+# Replis sans package installé : decoders/ à la racine du dépôt, puis l'ancien emplacement déployé
+REPO_DECODERS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "decoders")
+LEGACY_DECODERS_DIR = "/opt/iot-infra/decoders"
+ENTRY_POINT_GROUP = "iot_infra.decoders"
+
+
+# Types de champs écrits dans InfluxDB (les autres, ex. états texte, ne le sont pas)
+NUMERIC_TYPES = (int, float, bool)
+# Horodatage (secondes Unix) des entrées d'un champ historique
+TIME_FIELD = "timestamp"
+
+
+class FieldSpec(NamedTuple):
+    type: type
+    unit: str = ""
+    items: dict = None  # champ historique (type list) : schéma de chaque entrée, avec TIME_FIELD
+
+
+def parse_fields(fields: dict):
+    """
+    Normalise l'attribut FIELDS d'un module -> {nom: FieldSpec}.
+
+    Formes acceptées : {nom: type}, {nom: (type, unité)} et, pour un historique,
+    {nom: (list, "", {sous-schéma des entrées})}.
+    """
+    schema = {}
+    for name, spec in fields.items():
+        if isinstance(spec, tuple):
+            spec = FieldSpec(*spec)
+            if spec.items is not None:
+                spec = spec._replace(items=parse_fields(spec.items))
+            schema[name] = spec
+        else:
+            schema[name] = FieldSpec(spec)
+    return schema
+
+
+def numeric_fields(schema: dict):
+    """Champs numériques d'un schéma, triés par nom (ordre du line protocol)."""
+    return tuple(sorted(n for n, spec in schema.items() if spec.type in NUMERIC_TYPES and n != TIME_FIELD))
+
+
+@dataclass(frozen=True)
+class Decoder:
+    name: str
+    decode: object                              # fonction decode(frm_payload) déjà résolue
+    decode_many: object = None                  # decode_many(payloads) -> colonnes (cf. decoders/_batch.py)
+    fields: dict = field(default_factory=dict)  # nom du champ -> FieldSpec (attribut FIELDS du module)
+    doc: str = ""
+    version: str = ""                           # attribut VERSION du module
+    numeric: tuple = ()                         # champs numériques du schéma, triés par nom (cf. line_protocol)
+    history: tuple = ()                         # ((champ historique, ses champs numériques), ...)
+
+    def coerce(self, decoded: dict):
+        """
+        Valide une sortie de decode() contre le schéma et retourne {champ: float}.
+
+        Seuls les champs numériques du schéma sont gardés, convertis en float (type des
+        champs déjà présents dans InfluxDB) ; une valeur absente, NaN ou non convertible
+        est écartée. Sans schéma, repli sur les valeurs int/float de la sortie.
+        """
+        if not self.fields:
+            return {key: float(value) for key, value in decoded.items() if isinstance(value, (int, float))}
+        return self._coerce(decoded, self.numeric)
+
+    def _coerce(self, decoded, numeric):
+        fields = {}
+        for name in numeric:
+            value = decoded.get(name)
+            if value is None:
+                continue
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                logging.warning(f"Champ '{name}' non numérique pour le décodeur '{self.name}': {value!r}")
+                continue
+            if value == value:
+                fields[name] = value
+        return fields
+
+    def points(self, decoded: dict, timestamp_ns: int):
+        """
+        Points à écrire pour une sortie de decode() : [(timestamp_ns, {champ: float}), ...].
+
+        Les champs de premier niveau sont horodatés à timestamp_ns (réception de l'uplink),
+        chaque entrée d'un champ historique devient un point à son propre TIME_FIELD.
+        """
+        points = []
+        fields = self.coerce(decoded)
+        if fields:
+            points.append((timestamp_ns, fields))
+        for name, numeric in self.history:
+            for entry in decoded.get(name) or ():
+                try:
+                    entry_ns = int(entry[TIME_FIELD]) * 1_000_000_000
+                except (KeyError, TypeError, ValueError):
+                    logging.warning(f"Entrée '{name}' sans horodatage valide pour le décodeur '{self.name}': {entry!r}")
+                    continue
+                fields = self._coerce(entry, numeric)
+                if fields:
+                    points.append((entry_ns, fields))
+        return points
+
+
+_registry = None
+_batch = None  # module <package>._batch, importé par load_decoders()
+
+
+def _dir_modules(decoders_dir):
+    """[(nom, fonction d'import)] des modules d'un répertoire de package decoders."""
+    parent = os.path.dirname(os.path.abspath(decoders_dir))
+    if parent not in sys.path:
+        sys.path.insert(0, parent)
+    package = os.path.basename(os.path.abspath(decoders_dir))
+    return [(m.name, functools.partial(import_module, f"{package}.{m.name}"))
+            for m in pkgutil.iter_modules([decoders_dir])]
+
+
+def _entry_point_modules():
+    """[(nom, fonction d'import)] des décodeurs déclarés par les packages installés."""
+    entry_points = metadata.entry_points()
+    if hasattr(entry_points, "select"):
+        entry_points = entry_points.select(group=ENTRY_POINT_GROUP)
+    else:
+        # Python < 3.10 : dict {groupe: [EntryPoint]}
+        entry_points = entry_points.get(ENTRY_POINT_GROUP, ())
+    return [(ep.name, ep.load) for ep in entry_points]
+
+
+def _find_modules(decoders_dir):
+    """Retourne (source, [(nom, fonction d'import)]) ; lève RuntimeError si aucune source ne convient."""
+    if decoders_dir:
+        if not os.path.isfile(os.path.join(decoders_dir, "__init__.py")):
+            raise RuntimeError(f"DECODERS_DIR={decoders_dir} n'est pas un package decoders (__init__.py absent)")
+        return decoders_dir, _dir_modules(decoders_dir)
+    modules = _entry_point_modules()
+    if modules:
+        return f"entry points {ENTRY_POINT_GROUP}", modules
+    for directory in (REPO_DECODERS_DIR, LEGACY_DECODERS_DIR):
+        if os.path.isfile(os.path.join(directory, "__init__.py")):
+            logging.warning(f"Aucun décodeur installé ({ENTRY_POINT_GROUP}), repli sur {directory}")
+            return directory, _dir_modules(directory)
+    raise RuntimeError(f"Aucun décodeur trouvé : ni entry point {ENTRY_POINT_GROUP} (pip install depuis la racine "
+                       f"du dépôt), ni DECODERS_DIR, ni package dans {REPO_DECODERS_DIR} ou {LEGACY_DECODERS_DIR}")
+
+
+def load_decoders(decoders_dir: str = DECODERS_DIR):
+    """
+    Importe tous les décodeurs et retourne {nom: Decoder}.
+
+    Sans decoders_dir, les décodeurs sont ceux des entry points installés (ou, à défaut, ceux
+    de REPO_DECODERS_DIR puis LEGACY_DECODERS_DIR). Un module qui ne s'importe pas ou qui
+    n'expose pas de fonction decode() est signalé dans les logs dès le démarrage et ignoré.
+    Lève RuntimeError si aucun décodeur n'a pu être chargé.
+    """
+    source, modules = _find_modules(decoders_dir)
+
+    global _batch
+    registry = {}
+    for name, load in sorted(modules):
+        if name.startswith("_"):
+            # Modules internes partagés par les décodeurs (ex. _milesight)
+            continue
+        try:
+            module = load()
+        except Exception as e:
+            logging.error(f"Impossible d'importer le décodeur '{name}': {e}")
+            continue
+        decode = getattr(module, "decode", None)
+        if not callable(decode):
+            logging.error(f"Le module '{name}' n'expose pas de fonction decode(), ignoré")
+            continue
+        # Outils de lot du package du décodeur (decode_many_generic, rows)
+        batch = _batch = import_module(f"{module.__package__}._batch")
+        doc = (decode.__doc__ or module.__doc__ or "").strip()
+        # Sans decode_many() vectorisé, repli sur une boucle sur decode()
+        decode_many = getattr(module, "decode_many", None)
+        if not callable(decode_many):
+            decode_many = functools.partial(batch.decode_many_generic, decode)
+        try:
+            fields = parse_fields(getattr(module, "FIELDS", {}))
+        except TypeError as e:
+            logging.error(f"Schéma FIELDS invalide pour le décodeur '{name}': {e}")
+            continue
+        if not fields:
+            logging.warning(f"Le décodeur '{name}' ne déclare pas FIELDS : champs filtrés par type à chaque message")
+        registry[name] = Decoder(
+            name=name,
+            decode=decode,
+            decode_many=decode_many,
+            fields=fields,
+            doc=doc.splitlines()[0] if doc else "",
+            version=str(getattr(module, "VERSION", "")),
+            numeric=numeric_fields(fields),
+            history=tuple((n, numeric_fields(spec.items)) for n, spec in fields.items() if spec.items),
+        )
+    if not registry:
+        raise RuntimeError(f"Aucun décodeur utilisable dans {source}")
+    logging.info(f"Décodeurs chargés depuis {source}: "
+                 f"{', '.join(f'{n} {d.version}'.strip() for n, d in sorted(registry.items()))}")
+    return registry
+
+
+def package_dir():
+    """Répertoire du package decoders chargé par load_decoders() (corpus de référence dans <répertoire>/corpus)."""
+    return os.path.dirname(os.path.abspath(_batch.__file__)) if _batch else None
+
+
+def get_decoders():
+    """Retourne le registre du processus (chargé au premier appel)."""
+    global _registry
+    if _registry is None:
+        _registry = load_decoders()
+    return _registry
+
+
+def decode_rows(decoder, payloads):
+    """
+    Décode un lot de payloads avec decoder.decode_many().
+
+    Retourne une liste alignée sur payloads : dict décodé, ou None si le payload est en erreur.
+    """
+    return _batch.rows(decoder.decode_many(payloads))
+
+
+def available_decoders():
+    return sorted(get_decoders())
+
+
+def resolve_devices(devices: dict):
+    """
+    Associe chaque DevEUI directement à son Decoder.
+
+    Les devices dont le décodeur est inconnu sont signalés et exclus de la table.
+    """
+    registry = get_decoders()
+    table = {}
+    for dev_eui, decoder_name in devices.items():
+        decoder = registry.get(decoder_name)
+        if decoder is None:
+            logging.error(f"Décodeur '{decoder_name}' introuvable pour {dev_eui}")
+            continue
+        table[dev_eui] = decoder
+    return table
@@ -1,24 +1,39 @@
-from flask import Flask, render_template_string, request, redirect, url_for
+from flask import Flask, render_template_string, request, redirect, url_for, jsonify
 import os
-import json
+import time
+import functools
+import logging
+import threading
 import subprocess
-from importlib import import_module
 from influxdb_client import InfluxDBClient
 from dotenv import load_dotenv
+import decoder_registry
+import device_state
+import device_store
+import provision_devices
 
 load_dotenv("/opt/iot-infra/.env")
 
 app = Flask(__name__)
 
-DEVICES_FILE = "/opt/iot-infra/devices.json"
-DECODERS_DIR = "/opt/iot-infra/decoders"
 INFLUX_URL = os.getenv("INFLUX_URL")
 INFLUX_TOKEN = os.getenv("INFLUX_TOKEN")
 INFLUX_ORG = os.getenv("INFLUX_ORG")
+# Statistiques InfluxDB de /status : une requête d'agrégat par bucket, recalculée au plus toutes les
+# STATUS_CACHE_TTL secondes en arrière-plan (la page affiche la dernière valeur connue)
+STATUS_CACHE_TTL = float(os.getenv("STATUS_CACHE_TTL", "300"))
+STATUS_COUNT_RANGE = os.getenv("STATUS_COUNT_RANGE", "30d")
+# Un device sans message depuis ce délai est compté comme silencieux
+STATUS_ACTIVE_SECONDS = float(os.getenv("STATUS_ACTIVE_SECONDS", "3600"))
+# Liste des capteurs paginée côté serveur
+DEVICES_PER_PAGE = int(os.getenv("DEVICES_PER_PAGE", "100"))
+# Champ affiché dans la colonne batterie, le premier présent dans le schéma du décodeur
+BATTERY_FIELDS = ("battery", "battery_voltage")
 
 NAVBAR = """
 <nav>
   <a href="/">Gérer les capteurs</a> |
+  <a href="/import">Import en masse</a> |
   <a href="/status">Etat système</a> |
   <a href="/restart-listener">🔄 Redémarrer listener</a>
 </nav>
@@ -54,17 +69,35 @@ INDEX_TEMPLATE = """
         </select>
         <button type="submit">Ajouter</button>
     </form>
-    <h2>Liste des capteurs</h2>
+    <h2>Liste des capteurs ({{ total }})</h2>
+    <form method="get">
+        <label for="type">Filtrer par type:</label>
+        <select name="type" onchange="this.form.submit()">
+            <option value="">Tous</option>
+            {% for decoder in decoders %}
+            <option value="{{ decoder }}" {% if decoder == type_filter %}selected{% endif %}>{{ decoder }}</option>
+            {% endfor %}
+        </select>
+    </form>
     <table>
-        <tr><th>DevEUI</th><th>Type</th><th>Action</th></tr>
-        {% for dev_eui, decoder in devices.items() %}
+        <tr><th>DevEUI</th><th>Type</th><th>Dernier message</th><th>RSSI</th><th>Batterie</th><th>Messages 24 h</th><th>Action</th></tr>
+        {% for row in rows %}
         <tr>
-            <td>{{ dev_eui }}</td>
-            <td>{{ decoder }}</td>
-            <td><a href="/delete/{{ dev_eui }}">Supprimer</a></td>
+            <td>{{ row.dev_eui }}</td>
+            <td>{{ row.decoder }}</td>
+            <td>{{ row.last_seen }}</td>
+            <td>{{ row.rssi }}</td>
+            <td>{{ row.battery }}</td>
+            <td>{{ row.messages_24h }}</td>
+            <td><a href="/delete/{{ row.dev_eui }}">Supprimer</a></td>
         </tr>
         {% endfor %}
     </table>
+    <p>
+        {% if page > 1 %}<a href="{{ url_for('index', type=type_filter, page=page - 1) }}">← Précédent</a>{% endif %}
+        Page {{ page }} / {{ pages }}
+        {% if page < pages %}<a href="{{ url_for('index', type=type_filter, page=page + 1) }}">Suivant →</a>{% endif %}
+    </p>
 </body>
 </html>
 """
@@ -86,45 +119,155 @@ STATUS_TEMPLATE = """
     <h1>✨ État du système</h1>
     <h2>🔌 Service MQTT Listener</h2>
     <pre>{{ mqtt_status }}</pre>
+    <h2>📡 Capteurs</h2>
+    <pre>{{ devices_status }}</pre>
     <h2>📊 InfluxDB</h2>
     <pre>{{ influx_status }}</pre>
 </body>
 </html>
 """
 
+IMPORT_TEMPLATE = """
+<!DOCTYPE html>
+<html lang="fr">
+<head>
+    <meta charset="UTF-8">
+    <title>Import de capteurs</title>
+    <style>
+        body { font-family: Arial, sans-serif; padding: 20px; }
+        textarea, input, select, button { padding: 8px; margin: 4px 0; width: 100%; box-sizing: border-box; }
+        form { max-width: 600px; margin-bottom: 30px; }
+        pre { background: #f0f0f0; padding: 10px; border-radius: 5px; }
+    </style>
+</head>
+<body>
+    {{ navbar|safe }}
+    <h1>📥 Import de capteurs en masse</h1>
+    {% if result %}
+    <pre>{% if result.errors %}❌ Lot refusé, aucun capteur modifié :
+{{ result.errors|join("\n") }}{% elif result.dry_run %}✅ {{ result.devices }} capteur(s) valides (rien n'a été écrit){% else %}✅ {{ result.devices }} capteur(s) dans le lot, {{ result.changed }} modification(s){% endif %}</pre>
+    {% endif %}
+    <form method="post" enctype="multipart/form-data">
+        <label for="file">Fichier CSV (dev_eui,decoder) ou JSON (format devices.json):</label>
+        <input type="file" name="file" accept=".csv,.json,.txt">
+        <label for="data">ou contenu collé:</label>
+        <textarea name="data" rows="10" placeholder="dev_eui,decoder&#10;0018B200000023E6,adeunis_ftd">{{ data }}</textarea>
+        <label><input type="checkbox" name="dry_run" value="1" style="width:auto"> Valider seulement</label>
+        <label><input type="checkbox" name="replace" value="1" style="width:auto"> Remplacer la table (supprime les capteurs absents du lot)</label>
+        <button type="submit">Importer</button>
+    </form>
+    <p>Types disponibles : {{ decoders|join(", ") }}</p>
+</body>
+</html>
+"""
+
+# Store des devices (DEVICES_DB) : écritures transactionnelles, partagé avec le listener
+STORE = device_store.DeviceStore()
+
 def load_devices():
-    if os.path.exists(DEVICES_FILE):
-        with open(DEVICES_FILE, "r") as f:
-            return json.load(f)
-    return {}
+    return STORE.all()
 
-def save_devices(devices):
-    with open(DEVICES_FILE, "w") as f:
-        json.dump(devices, f, indent=2)
+def load_state():
+    # Table publiée par le listener (device_state) : aucune requête InfluxDB
+    return device_state.read_state().get("devices", {})
+
+def format_age(timestamp_ns):
+    if not timestamp_ns:
+        return "jamais"
+    seconds = max(0, time.time() - timestamp_ns / 1e9)
+    if seconds < 120:
+        return f"il y a {seconds:.0f} s"
+    if seconds < 7200:
+        return f"il y a {seconds / 60:.0f} min"
+    if seconds < 172800:
+        return f"il y a {seconds / 3600:.0f} h"
+    return f"il y a {seconds / 86400:.0f} j"
+
+@functools.lru_cache(maxsize=None)
+def battery_field(decoder_name):
+    # (nom du champ, unité) de la batterie dans le schéma du décodeur, None s'il n'en déclare pas
+    decoder = decoder_registry.get_decoders().get(decoder_name)
+    for name in BATTERY_FIELDS:
+        if decoder is not None and name in decoder.fields:
+            return name, decoder.fields[name].unit
+    return None
+
+def device_row(dev_eui, decoder, entry, now_ns):
+    # Colonnes d'une ligne de la liste, calculées depuis le résumé publié par le listener (temps constant)
+    battery = "–"
+    spec = battery_field(decoder)
+    if spec is not None and spec[0] in entry.get("values", {}):
+        battery = f"{entry['values'][spec[0]]:g} {spec[1]}".strip()
+    rssi = entry.get("rssi")
+    return {
+        "dev_eui": dev_eui,
+        "decoder": decoder,
+        "last_seen": format_age(entry.get("seen")),
+        "rssi": f"{rssi:g} dBm" if rssi is not None else "–",
+        "battery": battery,
+        "messages_24h": device_state.messages_24h(entry, now_ns) if entry else 0,
+    }
 
 def get_available_decoders():
-    return [f.replace(".py", "") for f in os.listdir(DECODERS_DIR) if f.endswith(".py")]
+    # Le registre est chargé une seule fois par processus
+    return decoder_registry.available_decoders()
 
 @app.route("/", methods=["GET", "POST"])
 def index():
-    devices = load_devices()
     if request.method == "POST":
-        dev_eui = request.form["dev_eui"].upper()
-        decoder = request.form["decoder"]
-        devices[dev_eui] = decoder
-        save_devices(devices)
+        # Mêmes contrôles que l'import en masse (DevEUI hexadécimal sur 16 caractères, décodeur connu)
+        devices, errors = provision_devices.validate(
+            [("formulaire", request.form.get("dev_eui", ""), request.form.get("decoder", ""))],
+            set(get_available_decoders()))
+        if errors:
+            return "\n".join(errors), 400
+        STORE.upsert(*devices[0])
         return redirect(url_for("index"))
     decoders = get_available_decoders()
-    return render_template_string(INDEX_TEMPLATE, devices=devices, decoders=decoders, navbar=NAVBAR)
+    # Filtrage et pagination côté serveur (index du store sur le décodeur) : seules les lignes de la page sont lues
+    type_filter = request.args.get("type", "")
+    total = STORE.count(type_filter)
+    pages = max(1, -(-total // DEVICES_PER_PAGE))
+    page = min(max(request.args.get("page", 1, type=int), 1), pages)
+    state = load_state()
+    now_ns = time.time_ns()
+    rows = [device_row(dev_eui, decoder, state.get(dev_eui, {}), now_ns)
+            for dev_eui, decoder in STORE.list(type_filter, DEVICES_PER_PAGE, (page - 1) * DEVICES_PER_PAGE)]
+    return render_template_string(INDEX_TEMPLATE, rows=rows, total=total, page=page, pages=pages,
+                                  type_filter=type_filter, decoders=decoders, navbar=NAVBAR)
 
 @app.route("/delete/<dev_eui>")
 def delete(dev_eui):
-    devices = load_devices()
-    if dev_eui in devices:
-        del devices[dev_eui]
-        save_devices(devices)
+    STORE.delete(dev_eui)
     return redirect(url_for("index"))
 
+# Import en masse : formulaire, ou API avec le lot brut dans le corps de la requête, ex.
+#   curl -X POST -H "Content-Type: text/csv" --data-binary @batiment-b.csv "http://host:5000/import?dry_run=1"
+# Le lot est validé en entier puis appliqué en une transaction (réponse 400 et rien d'écrit en cas d'erreur)
+@app.route("/import", methods=["GET", "POST"])
+def import_devices():
+    decoders = get_available_decoders()
+    if request.method == "GET":
+        return render_template_string(IMPORT_TEMPLATE, result=None, data="", decoders=decoders, navbar=NAVBAR)
+    replace = request.values.get("replace") == "1"
+    dry_run = request.values.get("dry_run") == "1"
+    from_form = request.mimetype in ("multipart/form-data", "application/x-www-form-urlencoded")
+    upload = request.files.get("file")
+    if upload and upload.filename:
+        text = upload.read().decode("utf-8-sig")
+    elif from_form:
+        text = request.form.get("data", "")
+    else:
+        text = request.get_data(as_text=True).lstrip("\ufeff")
+    fmt = {"application/json": "json", "text/csv": "csv"}.get(request.mimetype)
+    changed, devices, errors = provision_devices.provision(STORE, text, fmt, replace=replace, dry_run=dry_run)
+    result = {"devices": len(devices), "changed": changed, "errors": errors, "dry_run": dry_run}
+    status = 400 if errors else 200
+    if from_form:
+        return render_template_string(IMPORT_TEMPLATE, result=result, data=text if errors else "",
+                                      decoders=decoders, navbar=NAVBAR), status
+    return jsonify(result), status
+
 @app.route("/restart-listener")
 def restart_listener():
     try:
@@ -145,24 +288,102 @@ def get_mqtt_status():
     except Exception as e:
         return f"Erreur: {e}"
 
+def get_devices_status():
+    state = device_state.read_state()
+    if not state:
+        return f"Aucun état publié par le listener ({device_state.DEVICE_STATE_FILE})"
+    devices = load_devices()
+    entries = state.get("devices", {})
+    limit = time.time_ns() - int(STATUS_ACTIVE_SECONDS * 1e9)
+    active = sum(1 for dev_eui in devices if entries.get(dev_eui, {}).get("seen", 0) >= limit)
+    never = sum(1 for dev_eui in devices if dev_eui not in entries)
+    messages = sum(entry.get("count", 0) for entry in entries.values())
+    return (f"État publié {format_age(state.get('updated'))}\n"
+            f"Capteurs déclarés: {len(devices)}\n"
+            f"Actifs (< {STATUS_ACTIVE_SECONDS / 60:.0f} min): {active}\n"
+            f"Silencieux: {len(devices) - active - never}\n"
+            f"Jamais vus: {never}\n"
+            f"Messages reçus: {messages}")
+
+_influx_client = None
+
+def get_influx_client():
+    # Client partagé par les requêtes (plus de connexion ouverte à chaque affichage)
+    global _influx_client
+    if _influx_client is None:
+        _influx_client = InfluxDBClient(url=INFLUX_URL, token=INFLUX_TOKEN, org=INFLUX_ORG)
+    return _influx_client
+
+def query_influx_stats():
+    client = get_influx_client()
+    buckets = client.buckets_api().find_buckets().buckets
+    query_api = client.query_api()
+    stats = []
+    for b in buckets:
+        if b.name.startswith("_"):
+            # Buckets système (_monitoring, _tasks)
+            continue
+        retention = b.retention_rules[0].every_seconds if b.retention_rules else 0
+        # count() est exécuté par le moteur de stockage : seul un total par série est renvoyé
+        query = f'''from(bucket: "{b.name}") |> range(start: -{STATUS_COUNT_RANGE}) |> count()'''
+        tables = query_api.query(query, org=INFLUX_ORG)
+        points = sum(row.get_value() for table in tables for row in table.records)
+        stats.append((b.name, retention, b.id, points))
+    return stats
+
+class InfluxStatsCache:
+    """Dernier résultat de query_influx_stats(), rafraîchi en arrière-plan quand il a expiré."""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._stats = None
+        self._error = None
+        self._updated = 0.0
+        self._refreshing = False
+
+    def get(self):
+        with self._lock:
+            if time.time() - self._updated >= self.ttl and not self._refreshing:
+                self._refreshing = True
+                threading.Thread(target=self._refresh, name="influx-stats", daemon=True).start()
+            return self._stats, self._error, self._updated
+
+    def _refresh(self):
+        try:
+            stats, error = query_influx_stats(), None
+        except Exception as e:
+            logging.error(f"Statistiques InfluxDB indisponibles: {e}")
+            stats, error = None, str(e)
+        with self._lock:
+            if stats is not None:
+                self._stats = stats
+            self._error = error
+            # Horodaté même en cas d'erreur : pas de nouvelle tentative avant la fin du TTL
+            self._updated = time.time()
+            self._refreshing = False
+
+INFLUX_STATS = InfluxStatsCache(STATUS_CACHE_TTL)
+
 def get_influx_status():
-    try:
-        with InfluxDBClient(url=INFLUX_URL, token=INFLUX_TOKEN, org=INFLUX_ORG) as client:
-            buckets = client.buckets_api().find_buckets().buckets
-            bucket_info = [f"{b.name} - {b.retention_rules[0].every_seconds}s - ID: {b.id}" for b in buckets]
-            query = f'''from(bucket: "{buckets[0].name}") |> range(start: -30d) |> count()'''
-            query_api = client.query_api()
-            tables = query_api.query(query, org=INFLUX_ORG)
-            total_points = sum(row.get_value() for table in tables for row in table.records)
-            return f"Buckets:\n" + "\n".join(bucket_info) + f"\n\nNombre total de points: {total_points}"
-    except Exception as e:
-        return f"Erreur: {e}"
+    stats, error, updated = INFLUX_STATS.get()
+    if stats is None:
+        return f"Erreur: {error}" if error else "Statistiques en cours de calcul, rechargez la page dans un instant."
+    bucket_info = [f"{name} - {retention}s - ID: {bucket_id} - {points} points" for name, retention, bucket_id, points in stats]
+    total_points = sum(points for *_, points in stats)
+    text = (f"Buckets:\n" + "\n".join(bucket_info)
+            + f"\n\nNombre total de points ({STATUS_COUNT_RANGE}): {total_points}"
+            + f"\nCalculé {format_age(int(updated * 1e9))}")
+    if error:
+        text += f"\nDernière mise à jour en échec: {error}"
+    return text
 
 @app.route("/status")
 def status():
     mqtt_status = get_mqtt_status()
     influx_status = get_influx_status()
-    return render_template_string(STATUS_TEMPLATE, mqtt_status=mqtt_status, influx_status=influx_status, navbar=NAVBAR)
+    return render_template_string(STATUS_TEMPLATE, mqtt_status=mqtt_status, devices_status=get_devices_status(),
+                                  influx_status=influx_status, navbar=NAVBAR)
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=True)
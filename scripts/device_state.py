@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# État courant par DevEUI tenu par le listener : dernier message reçu, dernières valeurs décodées,
+# meilleur RSSI du dernier message, nombre de messages (total et par heure sur 24 h). Mis à jour
+# en mémoire à chaque uplink décodé, en temps constant, publié toutes les
+# DEVICE_STATE_INTERVAL secondes dans DEVICE_STATE_FILE (JSON, écriture atomique) :
+# device_manager lit ce fichier pour la liste des capteurs et /status, sans requête InfluxDB.
+#
+# Format publié :
+#   {"updated": ns, "devices": {"<DevEUI>": {"decoder": "rhf1s001", "count": 1234,
+#                                            "seen": ns, "time": ns, "values": {"temp": 21.5, ...},
+#                                            "rssi": -97, "hour": 498000, "hourly": [24 compteurs]}}}
+# seen : réception par le listener, time : horodatage TTN des valeurs (un message rejoué ou en
+# retard ne remplace pas des valeurs plus récentes). hourly : messages reçus par heure, indexés par
+# heure epoch modulo 24 ; hour est la dernière heure comptée (voir messages_24h()).
+import os
+import json
+import time
+import logging
+import threading
+
+DEVICE_STATE_FILE     = os.getenv("DEVICE_STATE_FILE", "/opt/iot-infra/device_state.json")
+DEVICE_STATE_INTERVAL = float(os.getenv("DEVICE_STATE_INTERVAL", "10"))  # secondes
+
+HOUR_NS = 3600 * 1_000_000_000
+HOURS = 24
+
+
+class DeviceState:
+    def __init__(self, path=DEVICE_STATE_FILE, interval=DEVICE_STATE_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self._devices = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def update(self, dev_eui, decoder_name, points, rssi=None):
+        """Enregistre un uplink décodé. points : [(timestamp_ns, {nom: float}), ...] (Decoder.points())."""
+        timestamp_ns, values = max(points, key=lambda point: point[0])
+        seen = time.time_ns()
+        hour = seen // HOUR_NS
+        with self._lock:
+            entry = self._devices.get(dev_eui)
+            if entry is None:
+                entry = self._devices[dev_eui] = {"decoder": decoder_name, "count": 0, "seen": 0, "time": 0,
+                                                  "values": {}, "rssi": None, "hour": hour, "hourly": [0] * HOURS}
+            entry["decoder"] = decoder_name
+            entry["count"] += 1
+            entry["seen"] = seen
+            entry["rssi"] = rssi
+            if timestamp_ns >= entry["time"]:
+                entry["time"] = timestamp_ns
+                entry["values"] = values
+            hourly = entry["hourly"]
+            if hour > entry["hour"]:
+                # Heures écoulées sans message remises à zéro (au plus 24 cases)
+                for h in range(max(entry["hour"] + 1, hour - HOURS + 1), hour + 1):
+                    hourly[h % HOURS] = 0
+                entry["hour"] = hour
+            hourly[hour % HOURS] += 1
+            self._dirty = True
+
+    def load(self):
+        """Reprend l'état publié par l'instance précédente (compteurs conservés au redémarrage)."""
+        devices = read_state(self.path).get("devices", {})
+        with self._lock:
+            for dev_eui, entry in devices.items():
+                # État publié par une version précédente, sans compteurs horaires
+                entry.setdefault("rssi", None)
+                entry.setdefault("hour", entry.get("seen", 0) // HOUR_NS)
+                entry.setdefault("hourly", [0] * HOURS)
+                self._devices.setdefault(dev_eui, entry)
+        if devices:
+            logging.info(f"État de {len(devices)} device(s) repris depuis {self.path}")
+
+    def snapshot(self):
+        with self._lock:
+            # Les dictionnaires de valeurs sont remplacés, jamais modifiés : seuls les compteurs horaires
+            # sont copiés en plus de l'entrée
+            return {dev_eui: dict(entry, hourly=list(entry["hourly"])) for dev_eui, entry in self._devices.items()}
+
+    def publish(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+        state = {"updated": time.time_ns(), "devices": self.snapshot()}
+        tmp_file = f"{self.path}.tmp"
+        try:
+            with open(tmp_file, "w") as f:
+                json.dump(state, f, separators=(",", ":"))
+            os.replace(tmp_file, self.path)
+        except OSError as e:
+            logging.error(f"Publication de l'état des devices impossible ({self.path}): {e}")
+            self._dirty = True
+
+    def start(self):
+        self.load()
+        self._thread = threading.Thread(target=self._run, name="device-state", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        self.publish()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.publish()
+
+
+def messages_24h(entry, now_ns=None):
+    """Messages reçus sur les 24 dernières heures (heure en cours comprise) d'après les compteurs horaires."""
+    hourly = entry.get("hourly")
+    if not hourly:
+        return 0
+    now = (now_ns or time.time_ns()) // HOUR_NS
+    last = entry["hour"]
+    if now - last >= HOURS:
+        return 0
+    return sum(hourly[h % HOURS] for h in range(now - HOURS + 1, last + 1))
+
+
+_read_cache = (None, {})   # ((mtime_ns, taille), état) du dernier fichier lu
+
+
+def read_state(path=DEVICE_STATE_FILE):
+    """État publié par le listener ({} si absent ou illisible), relu seulement si le fichier a changé."""
+    global _read_cache
+    try:
+        st = os.stat(path)
+        version = (st.st_mtime_ns, st.st_size)
+        if version == _read_cache[0]:
+            return _read_cache[1]
+        with open(path, "r") as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logging.warning(f"État des devices illisible ({path}): {e}")
+        return {}
+    _read_cache = (version, state)
+    return state
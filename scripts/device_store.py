@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# Store des devices (DevEUI -> décodeur) partagé par le listener, device_manager et add_device.py
+#
+# SQLite en mode WAL : les lectures ne bloquent pas les écritures, chaque modification est une
+# transaction (BEGIN IMMEDIATE, plus d'écritures concurrentes perdues) et incrémente un compteur de
+# version que le listener interroge pour recharger sa table à chaud (une lecture d'une ligne).
+# Le répertoire du fichier doit être accessible en écriture aux utilisateurs du listener et de
+# device_manager (fichiers -wal et -shm).
+#
+# devices.json reste le format d'import/export ; il est importé automatiquement à la création du store.
+#
+# Usage :
+#   python3 device_store.py import devices.json [--replace]
+#   python3 device_store.py export devices.json
+#   python3 device_store.py version
+import os
+import sys
+import json
+import sqlite3
+import logging
+import argparse
+import threading
+from contextlib import contextmanager
+
+DEVICES_DB   = os.getenv("DEVICES_DB", "/opt/iot-infra/devices.db")
+DEVICES_FILE = os.getenv("DEVICES_FILE", "/opt/iot-infra/devices.json")   # import initial / export
+DEVICES_DB_TIMEOUT = float(os.getenv("DEVICES_DB_TIMEOUT", "10"))          # attente du verrou d'écriture (s)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS devices (
+    dev_eui    TEXT PRIMARY KEY,
+    decoder    TEXT NOT NULL CHECK (decoder <> ''),
+    updated_at INTEGER NOT NULL DEFAULT (strftime('%s', 'now'))
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS devices_decoder ON devices (decoder, dev_eui);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+"""
+
+UPSERT = """
+INSERT INTO devices (dev_eui, decoder) VALUES (?, ?)
+ON CONFLICT (dev_eui) DO UPDATE SET decoder = excluded.decoder, updated_at = strftime('%s', 'now')
+WHERE decoder <> excluded.decoder
+"""
+
+
+class DeviceStore:
+    def __init__(self, path=DEVICES_DB, seed_file=DEVICES_FILE):
+        self.path = path
+        self._local = threading.local()   # une connexion par thread (sqlite3 ne les partage pas)
+        conn = self._connection()
+        conn.executescript(SCHEMA)
+        if seed_file:
+            self._seed(seed_file)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None : transactions explicites (BEGIN IMMEDIATE / COMMIT)
+            conn = sqlite3.connect(self.path, timeout=DEVICES_DB_TIMEOUT, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _write(self):
+        """Transaction d'écriture ; la version est incrémentée si des lignes ont changé."""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            before = conn.total_changes
+            yield conn
+            if conn.total_changes != before:
+                conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    @contextmanager
+    def _read(self):
+        """Transaction de lecture : version et contenu issus du même instantané."""
+        conn = self._connection()
+        conn.execute("BEGIN")
+        try:
+            yield conn
+        finally:
+            conn.execute("COMMIT")
+
+    def _seed(self, path):
+        """Import de devices.json dans un store qui n'a encore jamais été modifié."""
+        if not os.path.exists(path) or self.version() != 0:
+            return
+        devices = read_json(path)
+        with self._write() as conn:
+            # Vérifié sous verrou : un autre processus a pu faire l'import entre-temps
+            if conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0] != 0:
+                return
+            conn.executemany(UPSERT, devices.items())
+        logging.info(f"{len(devices)} device(s) importés depuis {path} dans {self.path}")
+
+    def version(self):
+        """Compteur incrémenté à chaque modification (lecture d'une ligne, à interroger périodiquement)."""
+        return self._connection().execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+
+    def snapshot(self):
+        """Retourne (version, {dev_eui: decoder}) lus dans la même transaction."""
+        with self._read() as conn:
+            version = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+            devices = dict(conn.execute("SELECT dev_eui, decoder FROM devices"))
+        return version, devices
+
+    def all(self):
+        return self.snapshot()[1]
+
+    def get(self, dev_eui):
+        row = self._connection().execute("SELECT decoder FROM devices WHERE dev_eui = ?", (dev_eui,)).fetchone()
+        return row[0] if row else None
+
+    def count(self, decoder=None):
+        if decoder:
+            query, args = "SELECT count(*) FROM devices WHERE decoder = ?", (decoder,)
+        else:
+            query, args = "SELECT count(*) FROM devices", ()
+        return self._connection().execute(query, args).fetchone()[0]
+
+    def list(self, decoder=None, limit=-1, offset=0):
+        """[(dev_eui, decoder), ...] triés par DevEUI, éventuellement filtrés par décodeur (index)."""
+        if decoder:
+            query = "SELECT dev_eui, decoder FROM devices WHERE decoder = ? ORDER BY dev_eui LIMIT ? OFFSET ?"
+            args = (decoder, limit, offset)
+        else:
+            query = "SELECT dev_eui, decoder FROM devices ORDER BY dev_eui LIMIT ? OFFSET ?"
+            args = (limit, offset)
+        return self._connection().execute(query, args).fetchall()
+
+    def upsert(self, dev_eui, decoder):
+        return self.upsert_many([(dev_eui, decoder)])
+
+    def upsert_many(self, items, replace=False):
+        """
+        Ajoute ou met à jour des (dev_eui, decoder) en une seule transaction.
+
+        replace=True supprime en plus les devices absents de items (import d'une table complète).
+        Retourne le nombre de lignes modifiées.
+        """
+        items = list(items)
+        with self._write() as conn:
+            before = conn.total_changes
+            if replace:
+                keep = {dev_eui for dev_eui, _ in items}
+                removed = [(dev_eui,) for (dev_eui,) in conn.execute("SELECT dev_eui FROM devices")
+                           if dev_eui not in keep]
+                conn.executemany("DELETE FROM devices WHERE dev_eui = ?", removed)
+            conn.executemany(UPSERT, items)
+            return conn.total_changes - before
+
+    def delete(self, dev_eui):
+        with self._write() as conn:
+            return conn.execute("DELETE FROM devices WHERE dev_eui = ?", (dev_eui,)).rowcount > 0
+
+    def import_json(self, path, replace=False):
+        return self.upsert_many(read_json(path).items(), replace=replace)
+
+    def export_json(self, path):
+        devices = dict(sorted(self.all().items()))
+        # Écriture atomique, même format que devices.json
+        tmp_file = f"{path}.tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(devices, f, indent=2)
+        os.replace(tmp_file, path)
+        return len(devices)
+
+
+def read_json(path):
+    """Lit une table {dev_eui: decoder} au format devices.json. Lève ValueError si elle est mal formée."""
+    with open(path, "r") as f:
+        try:
+            devices = json.load(f)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"JSON invalide: {e}")
+    if not isinstance(devices, dict):
+        raise ValueError("le contenu doit être un objet {dev_eui: decoder}")
+    for dev_eui, decoder_name in devices.items():
+        if not isinstance(decoder_name, str) or not decoder_name:
+            raise ValueError(f"décodeur invalide pour {dev_eui}: {decoder_name!r}")
+    return devices
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import/export du store des devices")
+    parser.add_argument("--db", default=DEVICES_DB)
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("import", help="importe un fichier au format devices.json")
+    p.add_argument("path")
+    p.add_argument("--replace", action="store_true", help="supprime les devices absents du fichier")
+    p = sub.add_parser("export", help="exporte le store au format devices.json")
+    p.add_argument("path")
+    sub.add_parser("version", help="affiche le compteur de version")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    store = DeviceStore(args.db, seed_file=None)
+    if args.command == "import":
+        changed = store.import_json(args.path, replace=args.replace)
+        print(f"✅ {changed} device(s) modifiés, version {store.version()}")
+    elif args.command == "export":
+        print(f"✅ {store.export_json(args.path)} device(s) exportés dans {args.path}")
+    else:
+        print(store.version())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# Table DevEUI -> décodeur du listener, rechargée à chaud quand le store des devices change
+# (compteur de version de device_store, interrogé toutes les DEVICES_POLL_INTERVAL secondes)
+import os
+import time
+import sqlite3
+import threading
+import logging
+from dataclasses import dataclass, field
+import decoder_registry
+import device_store
+
+DEVICES_DB            = device_store.DEVICES_DB
+DEVICES_POLL_INTERVAL = float(os.getenv("DEVICES_POLL_INTERVAL", "5"))  # secondes
+
+
+@dataclass(frozen=True)
+class DeviceTable:
+    devices: dict = field(default_factory=dict)   # DevEUI -> nom du décodeur
+    decoders: dict = field(default_factory=dict)  # DevEUI -> Decoder résolu
+    version: int = None                           # version du store chargée
+
+
+# Instantané courant : remplacé d'un bloc, jamais modifié sur place
+_current = DeviceTable()
+_stores = {}   # chemin -> DeviceStore ouvert par ce processus
+
+
+def current():
+    """Retourne la table en vigueur (à lire une seule fois par message)."""
+    return _current
+
+
+def get_store(path: str = DEVICES_DB):
+    store = _stores.get(path)
+    if store is None:
+        store = _stores[path] = device_store.DeviceStore(path)
+    return store
+
+
+def load_table(path: str = DEVICES_DB):
+    """Lit le store (version et devices du même instantané) et résout les décodeurs."""
+    version, devices = get_store(path).snapshot()
+    return DeviceTable(devices=devices, decoders=decoder_registry.resolve_devices(devices), version=version)
+
+
+def reload(path: str = DEVICES_DB):
+    """
+    Recharge la table si le store a changé. Retourne True si une nouvelle table est en place.
+
+    En cas de store illisible, la table précédente reste en vigueur.
+    """
+    global _current
+    try:
+        if get_store(path).version() == _current.version:
+            return False
+        table = load_table(path)
+    except (sqlite3.Error, OSError, ValueError) as e:
+        logging.error(f"Erreur lors de la lecture de {path}, table précédente conservée: {e}")
+        return False
+    _current = table
+    logging.info(f"Devices chargés depuis {path} (version {table.version}): {len(table.devices)} device(s)")
+    return True
+
+
+def start_watcher(path: str = DEVICES_DB, interval: float = DEVICES_POLL_INTERVAL):
+    """Démarre un thread qui surveille la version du store et recharge la table à chaud."""
+    def watch():
+        while True:
+            time.sleep(interval)
+            reload(path)
+
+    thread = threading.Thread(target=watch, name="devices-watcher", daemon=True)
+    thread.start()
+    logging.info(f"Surveillance de {path} toutes les {interval}s")
+    return thread
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+# Writer InfluxDB partagé : un seul client et une seule write_api (mode batching) par processus
+import os
+import time
+import threading
+import logging
+import influxdb_client
+from influxdb_client import InfluxDBClient, WriteOptions
+from influxdb_client.client.exceptions import InfluxDBError
+from influxdb_client.client.write_api import SYNCHRONOUS
+from dotenv import load_dotenv
+from spool import Spool, PermanentWriteError
+import metrics
+
+load_dotenv("/opt/iot-infra/.env")
+
+INFLUX_URL    = os.getenv("INFLUX_URL")
+INFLUX_TOKEN  = os.getenv("INFLUX_TOKEN")
+INFLUX_ORG    = os.getenv("INFLUX_ORG")
+
+# Paramètres du batching (intervalles en millisecondes, comme WriteOptions)
+INFLUX_BATCH_SIZE       = int(os.getenv("INFLUX_BATCH_SIZE", "500"))
+INFLUX_FLUSH_INTERVAL   = int(os.getenv("INFLUX_FLUSH_INTERVAL", "1000"))
+INFLUX_JITTER_INTERVAL  = int(os.getenv("INFLUX_JITTER_INTERVAL", "0"))
+INFLUX_RETRY_INTERVAL   = int(os.getenv("INFLUX_RETRY_INTERVAL", "5000"))
+INFLUX_MAX_RETRIES      = int(os.getenv("INFLUX_MAX_RETRIES", "5"))
+INFLUX_MAX_RETRY_DELAY  = int(os.getenv("INFLUX_MAX_RETRY_DELAY", "125000"))
+INFLUX_EXPONENTIAL_BASE = int(os.getenv("INFLUX_EXPONENTIAL_BASE", "2"))
+INFLUX_MAX_CLOSE_WAIT   = int(os.getenv("INFLUX_MAX_CLOSE_WAIT", "30000"))
+
+# Version du client pour laquelle le chronométrage des requêtes du batching est vérifié (voir _timed)
+INFLUX_CLIENT_VERSION = "1.50.0"
+
+# Les lots en échec sont conservés sur disque puis rejoués (voir spool.py)
+SPOOL_ENABLED = os.getenv("SPOOL_ENABLED", "1") == "1"
+
+_lock = threading.Lock()
+# Verrou propre au spool : get_spool() est appelé par les callbacks d'erreur du client, y compris
+# pendant le flush de close(), qui ne doit donc jamais se faire sous _lock
+_spool_lock = threading.Lock()
+_client = None
+_write_api = None
+_sync_write_api = None
+_spool = None
+
+# Cache des buckets dont on sait qu'ils existent (noms), partagé par tout le processus
+_known_buckets = set()
+_bucket_locks = {}
+_bucket_locks_lock = threading.Lock()
+# Verrou propre au spool : get_spool() est appelé par les callbacks d'erreur du client, y compris
+# pendant le flush de close(), qui ne doit donc jamais se faire sous _lock
+_spool_lock = threading.Lock()
+
+
+def _on_success(conf, data):
+    bucket, _org, _precision = conf
+    metrics.INFLUX_BATCHES.labels("success").inc()
+    metrics.INFLUX_BATCH_POINTS.observe(data.count(b"\n") + 1)
+    logging.debug("Batch écrit dans le bucket '%s' (%d octets)", bucket, len(data))
+
+
+def _on_error(conf, data, exception):
+    bucket, _org, precision = conf
+    spool_failed_batch(bucket, precision, data, exception)
+
+
+def spool_failed_batch(bucket, precision, data, exception):
+    """
+    Traite un lot définitivement en échec (essais épuisés) : conservé dans le spool pour rejeu.
+
+    data : line protocol (bytes ou str). Utilisé aussi par le listener asyncio, qui a sa propre write API.
+    """
+    metrics.INFLUX_BATCHES.labels("error").inc()
+    logging.error(f"Erreur lors de l'écriture dans InfluxDB (bucket '{bucket}'): {exception}")
+    spool = get_spool()
+    if spool is not None:
+        spool.append(bucket, precision, data)
+        logging.warning(f"Lot du bucket '{bucket}' conservé dans le spool pour rejeu")
+    # Bucket supprimé entre-temps : on l'oublie pour qu'il soit recréé au prochain message
+    if http_status(exception) == 404:
+        invalidate_bucket(bucket)
+
+
+def http_status(exception):
+    """Code HTTP d'une erreur InfluxDB (None pour une erreur de connexion ou sans réponse)."""
+    if not isinstance(exception, InfluxDBError):
+        return None
+    status = getattr(exception, "status", None)
+    if status is None and exception.response is not None:
+        status = getattr(exception.response, "status", None)
+    return status
+
+
+def _on_retry(conf, data, exception):
+    bucket, _org, _precision = conf
+    metrics.INFLUX_BATCHES.labels("retry").inc()
+    logging.warning(f"Nouvel essai d'écriture dans le bucket '{bucket}': {exception}")
+
+
+def _timed(write_api):
+    """
+    Mesure la durée de chaque requête d'écriture du mode batching (histogramme iot_influx_write_seconds).
+
+    Les callbacks publics (succès, erreur, nouvel essai) ne reçoivent pas l'instant d'envoi du lot :
+    la durée n'est mesurable qu'autour de _post_write(), méthode interne appelée une fois par requête
+    HTTP. Vérifié avec influxdb-client INFLUX_CLIENT_VERSION (version installée par
+    install_python_env.sh) ; si une autre version ne l'a plus, les écritures fonctionnent, seul
+    l'histogramme reste vide.
+    """
+    if not hasattr(write_api, "_post_write"):
+        logging.warning(f"influxdb-client {influxdb_client.__version__}: WriteApi._post_write() absent, "
+                        f"durée des écritures non mesurée (version vérifiée : {INFLUX_CLIENT_VERSION})")
+        return write_api
+    post_write = write_api._post_write
+
+    def timed_post_write(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return post_write(*args, **kwargs)
+        finally:
+            metrics.INFLUX_WRITE_SECONDS.observe(time.perf_counter() - start)
+    write_api._post_write = timed_post_write
+    return write_api
+
+
+def get_client():
+    """Retourne le client InfluxDB du processus (créé au premier appel)."""
+    global _client
+    with _lock:
+        if _client is None:
+            _client = InfluxDBClient(url=INFLUX_URL, token=INFLUX_TOKEN, org=INFLUX_ORG)
+        return _client
+
+
+def get_write_api():
+    """
+    Retourne la write_api partagée.
+
+    Les points sont accumulés puis envoyés par lots (taille ou intervalle atteint,
+    le premier des deux). Le client regroupe lui-même chaque lot par bucket,
+    une requête HTTP est donc émise par bucket et par lot.
+    """
+    global _write_api
+    client = get_client()
+    # Spool créé avant la write_api : prêt pour le premier lot en échec
+    get_spool()
+    with _lock:
+        if _write_api is None:
+            options = WriteOptions(
+                batch_size=INFLUX_BATCH_SIZE,
+                flush_interval=INFLUX_FLUSH_INTERVAL,
+                jitter_interval=INFLUX_JITTER_INTERVAL,
+                retry_interval=INFLUX_RETRY_INTERVAL,
+                max_retries=INFLUX_MAX_RETRIES,
+                max_retry_delay=INFLUX_MAX_RETRY_DELAY,
+                exponential_base=INFLUX_EXPONENTIAL_BASE,
+                max_close_wait=INFLUX_MAX_CLOSE_WAIT,
+            )
+            _write_api = _timed(client.write_api(
+                write_options=options,
+                success_callback=_on_success,
+                error_callback=_on_error,
+                retry_callback=_on_retry,
+            ))
+        return _write_api
+
+
+def get_spool():
+    """Retourne le spool disque du processus (None s'il est désactivé)."""
+    global _spool
+    if not SPOOL_ENABLED:
+        return None
+    with _spool_lock:
+        if _spool is None:
+            _spool = Spool()
+        return _spool
+
+
+def write_now(bucket, record, precision="ns"):
+    """
+    Écriture synchrone, hors batching (rejeu du spool, réinjection en masse).
+
+    Crée le bucket si besoin ; une exception signale l'échec de l'écriture.
+    """
+    global _sync_write_api
+    client = get_client()
+    with _lock:
+        if _sync_write_api is None:
+            _sync_write_api = client.write_api(write_options=SYNCHRONOUS)
+    if bucket not in _known_buckets:
+        ensure_bucket(bucket)
+    # Écriture synchrone : une requête par appel, chronométrée directement
+    start = time.perf_counter()
+    try:
+        _sync_write_api.write(bucket=bucket, org=INFLUX_ORG, record=record, write_precision=precision)
+    finally:
+        metrics.INFLUX_WRITE_SECONDS.observe(time.perf_counter() - start)
+
+
+def _replay_write(bucket, precision, data):
+    # Erreurs transitoires (connexion, 429, 5xx, bucket supprimé puis recréé au prochain essai) :
+    # l'exception interrompt le rejeu, qui reprendra. Autre refus 4xx : le lot ne passera jamais.
+    try:
+        write_now(bucket, data, precision)
+    except InfluxDBError as e:
+        status = http_status(e)
+        if status == 404:
+            invalidate_bucket(bucket)
+        elif status is not None and 400 <= status < 500 and status != 429:
+            raise PermanentWriteError(f"HTTP {status} (bucket '{bucket}'): {e}") from e
+        raise
+
+
+def start_spool_replay():
+    """Démarre le rejeu périodique du spool (lots en échec, y compris ceux d'un précédent processus)."""
+    spool = get_spool()
+    if spool is not None:
+        spool.start_replayer(_replay_write)
+
+
+def warm_bucket_cache():
+    """Charge en une fois la liste des buckets existants de l'organisation."""
+    names = set()
+    after = None
+    try:
+        buckets_api = get_client().buckets_api()
+        while True:
+            kwargs = {"org": INFLUX_ORG, "limit": 100}
+            if after:
+                kwargs["after"] = after
+            page = buckets_api.find_buckets(**kwargs).buckets or []
+            names.update(b.name for b in page)
+            if len(page) < 100:
+                break
+            after = page[-1].id
+    except Exception as e:
+        logging.error(f"❌ Impossible de lister les buckets InfluxDB: {e}")
+        return
+    _known_buckets.update(names)
+    logging.info(f"ℹ️ {len(names)} bucket(s) existant(s) en cache: {sorted(names)}")
+
+
+def is_known_bucket(bucket_name: str):
+    return bucket_name in _known_buckets
+
+
+def ensure_bucket(bucket_name: str):
+    """
+    Retourne le nom du bucket après s'être assuré qu'il existe.
+
+    Un bucket déjà connu ne coûte aucune requête. Sinon, un verrou par nom garantit
+    qu'un seul thread le recherche/crée quand plusieurs messages arrivent en même temps.
+    Lève InfluxDBError en cas d'échec.
+    """
+    if bucket_name in _known_buckets:
+        return bucket_name
+    with _bucket_locks_lock:
+        lock = _bucket_locks.setdefault(bucket_name, threading.Lock())
+    with lock:
+        if bucket_name in _known_buckets:
+            return bucket_name
+        buckets_api = get_client().buckets_api()
+        bucket = buckets_api.find_bucket_by_name(bucket_name)
+        if bucket is None:
+            buckets_api.create_bucket(bucket_name=bucket_name, org=INFLUX_ORG)
+            logging.info(f"✅ Bucket '{bucket_name}' créé.")
+        else:
+            logging.info(f"ℹ️ Bucket '{bucket_name}' déjà existant.")
+        _known_buckets.add(bucket_name)
+        return bucket_name
+
+
+def invalidate_bucket(bucket_name: str = None):
+    """Retire un bucket du cache (ou vide tout le cache si aucun nom n'est donné)."""
+    if bucket_name is None:
+        _known_buckets.clear()
+    else:
+        _known_buckets.discard(bucket_name)
+    logging.info(f"Cache des buckets invalidé: {bucket_name or 'tous'}")
+
+
+def write(bucket, record, precision="ns"):
+    """
+    Ajoute un ou plusieurs points au lot en cours pour ce bucket (non bloquant).
+
+    precision : précision des horodatages des lignes encodées (ignorée pour un Point, qui porte la sienne).
+    """
+    get_write_api().write(bucket=bucket, org=INFLUX_ORG, record=record, write_precision=precision)
+
+
+def close():
+    """
+    Vide les lots en attente puis ferme les write_api, le spool et le client.
+
+    Le flush se fait hors de _lock : les lots en échec pendant le flush passent par _on_error et sont
+    ajoutés au spool, qui n'est fermé qu'une fois la write_api vidée.
+    """
+    global _client, _write_api, _sync_write_api
+    with _lock:
+        write_api, _write_api = _write_api, None
+        sync_write_api, _sync_write_api = _sync_write_api, None
+        client, _client = _client, None
+    if write_api is not None:
+        logging.info("Flush des points InfluxDB en attente...")
+        write_api.close()
+    if sync_write_api is not None:
+        sync_write_api.close()
+    with _spool_lock:
+        if _spool is not None:
+            _spool.close()
+    if client is not None:
+        client.close()
@@ -17,7 +17,13 @@ python3 -m venv venv
 source venv/bin/activate
 
 pip install --upgrade pip
-pip install paho-mqtt influxdb-client python-dotenv
+# influxdb-client épinglé : influx_writer.py chronomètre les écritures via une méthode interne du client
+pip install paho-mqtt "influxdb-client==1.50.0" python-dotenv
+# Accélérateurs optionnels du parsing des uplinks TTN (voir uplink_parser.py)
+pip install msgspec orjson || echo "⚠️ msgspec/orjson non installés, parsing avec json"
+# Package des décodeurs (racine du dépôt), chargé par le listener via ses entry points ;
+# à réinstaller après chaque modification d'un décodeur
+pip install "$(dirname "$(readlink -f "$0")")/..[numpy]"
 
 echo "✅ Environnement Python prêt"
 
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# Encodeur line protocol direct pour la forme fixe de nos points :
+#   iot,dev_eui=<DevEUI> champ1=1.5,champ2=3 <timestamp>
+#
+# Les préfixes "mesure,tag " sont échappés une fois par device et mis en cache, les clés de
+# champ une fois par nom. Les valeurs arrivent déjà en float (Decoder.coerce()) : pas de
+# test de type par champ. La sortie est identique à celle de influxdb_client.Point
+# (champs triés par nom, ".0" final retiré, valeurs non finies ignorées), qui reste
+# disponible comme implémentation de référence (INFLUX_ENCODER=point, bench_line_protocol.py).
+import os
+import math
+import functools
+
+MEASUREMENT = "iot"
+# Nombre de préfixes de devices gardés en cache
+LINE_PROTOCOL_CACHE_SIZE = int(os.getenv("LINE_PROTOCOL_CACHE_SIZE", "65536"))
+
+# Mêmes tables d'échappement que influxdb_client
+_ESCAPE_MEASUREMENT = str.maketrans({",": r"\,", " ": r"\ ", "\n": r"\n", "\t": r"\t", "\r": r"\r"})
+_ESCAPE_KEY = str.maketrans({",": r"\,", "=": r"\=", " ": r"\ ", "\n": r"\n", "\t": r"\t", "\r": r"\r"})
+
+_isfinite = math.isfinite
+
+
+def escape_tag_value(value):
+    escaped = str(value).translate(_ESCAPE_KEY)
+    # Un "\" final échapperait l'espace qui suit le dernier tag
+    if escaped.endswith("\\"):
+        escaped += " "
+    return escaped
+
+
+@functools.lru_cache(maxsize=LINE_PROTOCOL_CACHE_SIZE)
+def tag_prefix(dev_eui):
+    """Préfixe "iot,dev_eui=<DevEUI échappé> " d'un device."""
+    return f"{MEASUREMENT.translate(_ESCAPE_MEASUREMENT)},dev_eui={escape_tag_value(dev_eui)} "
+
+
+@functools.lru_cache(maxsize=1024)
+def field_key(name):
+    """Clé de champ échappée, suivie de "="."""
+    return f"{name.translate(_ESCAPE_KEY)}="
+
+
+def format_float(value):
+    text = repr(value)
+    return text[:-2] if text.endswith(".0") else text
+
+
+def encode_line(dev_eui, fields, timestamp):
+    """
+    Ligne (str, sans "\\n") d'un point ; "" si aucun champ n'est écrivable.
+
+    fields : {nom: float} trié par nom (ordre de Decoder.coerce()), timestamp : entier
+    dans la précision d'écriture.
+    """
+    parts = [field_key(key) + format_float(value) for key, value in fields.items() if _isfinite(value)]
+    if not parts:
+        return ""
+    return f"{tag_prefix(dev_eui)}{','.join(parts)} {timestamp}"
+
+
+def encode(dev_eui, fields, timestamp):
+    """Point encodé en bytes, prêt à être concaténé dans le corps d'un lot."""
+    return encode_line(dev_eui, fields, timestamp).encode()
+
+
+def encode_batch(points):
+    """Corps d'écriture pour une suite de (dev_eui, fields, timestamp), une ligne par point."""
+    lines = [encode_line(dev_eui, fields, timestamp) for dev_eui, fields, timestamp in points]
+    return "\n".join(line for line in lines if line).encode()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# Journalisation du listener : résumé d'une ligne par message, détails échantillonnés par device
+#
+# Modes (LOG_MODE, modifiable à chaud via LOG_CONTROL_FILE) :
+#   verbose : message brut, frm_payload et données décodées pour chaque message (ancien comportement)
+#   compact : une ligne key=value par message, détails au plus une fois par device et par
+#             LOG_DEVICE_INTERVAL secondes (plus un échantillon aléatoire LOG_SAMPLE_RATE)
+#   quiet   : uniquement les avertissements et erreurs
+import os
+import json
+import time
+import random
+import threading
+import logging
+
+LOG_CONTROL_FILE  = os.getenv("LOG_CONTROL_FILE", "/opt/iot-infra/logging.json")
+LOG_POLL_INTERVAL = float(os.getenv("LOG_POLL_INTERVAL", "5"))  # secondes
+
+MODES = ("verbose", "compact", "quiet")
+
+DEFAULTS = {
+    "mode": os.getenv("LOG_MODE", "compact"),
+    "level": os.getenv("LOG_LEVEL", "INFO"),
+    "device_interval": float(os.getenv("LOG_DEVICE_INTERVAL", "300")),
+    "sample_rate": float(os.getenv("LOG_SAMPLE_RATE", "0")),
+}
+
+_settings = dict(DEFAULTS)
+_last_detail = {}   # dev_eui -> instant du dernier log détaillé
+
+
+def settings():
+    return dict(_settings)
+
+
+def apply(new_settings: dict):
+    """Applique un nouveau réglage (clés de DEFAULTS). Lève ValueError si invalide."""
+    global _settings
+    merged = dict(DEFAULTS)
+    merged.update(new_settings)
+    if merged["mode"] not in MODES:
+        raise ValueError(f"mode inconnu: {merged['mode']}")
+    level = logging.getLevelName(str(merged["level"]).upper())
+    if not isinstance(level, int):
+        raise ValueError(f"niveau inconnu: {merged['level']}")
+    merged["device_interval"] = float(merged["device_interval"])
+    merged["sample_rate"] = float(merged["sample_rate"])
+    logging.getLogger().setLevel(level)
+    _settings = merged
+    _last_detail.clear()
+
+
+def detail_enabled(dev_eui):
+    """Indique si les lignes détaillées doivent être journalisées pour ce message."""
+    mode = _settings["mode"]
+    if mode == "verbose":
+        return True
+    if mode == "quiet" or not logging.getLogger().isEnabledFor(logging.INFO):
+        return False
+    if _settings["sample_rate"] and random.random() < _settings["sample_rate"]:
+        return True
+    interval = _settings["device_interval"]
+    if interval <= 0:
+        return False
+    now = time.monotonic()
+    last = _last_detail.get(dev_eui)
+    if last is None or now - last >= interval:
+        _last_detail[dev_eui] = now
+        return True
+    return False
+
+
+def summary(dev_eui, decoder_name, f_port, decoded):
+    """Ligne unique par message en mode compact (formatage différé par logging)."""
+    if _settings["mode"] != "compact":
+        return
+    logging.info("uplink dev_eui=%s decoder=%s f_port=%s fields=%d", dev_eui, decoder_name, f_port, len(decoded))
+
+
+def _load_control_file(path):
+    with open(path, "r") as f:
+        data = json.load(f)
+    if not isinstance(data, dict):
+        raise ValueError("le contenu doit être un objet JSON")
+    return data
+
+
+def start_watcher(path: str = LOG_CONTROL_FILE, interval: float = LOG_POLL_INTERVAL):
+    """
+    Surveille le fichier de contrôle (ex. {"mode": "verbose"}) et applique ses réglages à chaud.
+
+    Un fichier invalide laisse le réglage courant en place ; sa suppression rétablit les valeurs par défaut.
+    """
+    def watch():
+        version = None
+        while True:
+            try:
+                st = os.stat(path)
+                current = (st.st_mtime_ns, st.st_size)
+            except FileNotFoundError:
+                current = None
+            if current != version:
+                version = current
+                try:
+                    apply(_load_control_file(path) if current else {})
+                    logging.warning(f"Journalisation: {_settings}")
+                except (OSError, ValueError) as e:
+                    logging.error(f"Erreur lors de la lecture de {path}, réglage conservé: {e}")
+            time.sleep(interval)
+
+    thread = threading.Thread(target=watch, name="log-watcher", daemon=True)
+    thread.start()
+    return thread
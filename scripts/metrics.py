@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# Métriques Prometheus du listener, exposées sur http://METRICS_ADDR:METRICS_PORT/metrics
+#
+# Implémentation minimale sans dépendance (format texte 0.0.4) : un compteur ou un histogramme
+# coûte un verrou et une addition par observation, les jauges sont lues au moment du scrape.
+import os
+import bisect
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))   # 0 = endpoint désactivé
+METRICS_ADDR = os.getenv("METRICS_ADDR", "127.0.0.1")
+
+# Bornes en secondes, de la milliseconde (décodage) à la dizaine de secondes (écriture avec retries)
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (1, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+_metrics = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    return str(value) if isinstance(value, int) else repr(float(value))
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name, doc, labels=()):
+        self.name = name
+        self.doc = doc
+        self.label_names = tuple(labels)
+        self._children = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+        if not self.label_names:
+            # Série sans label exposée dès le démarrage, à zéro
+            self.labels()
+
+    def labels(self, *values):
+        """Série correspondant aux valeurs de labels (créée au premier appel)."""
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._child())
+        return child
+
+    def _child(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.type}"]
+        for values, child in sorted(self._children.items()):
+            lines.extend(child.render(self.name, self.label_names, values))
+        return lines
+
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def render(self, name, label_names, values):
+        return [f"{name}{_format_labels(label_names, values)} {_format_value(self.value)}"]
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def _child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "_lock")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    def render(self, name, label_names, values):
+        with self._lock:
+            counts = list(self.counts)
+            total = self.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(float(bound))
+            labels = _format_labels(label_names, values, 'le="' + le + '"')
+            lines.append(f"{name}_bucket{labels} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(label_names, values)} {repr(total)}")
+        lines.append(f"{name}_count{_format_labels(label_names, values)} {cumulative}")
+        return lines
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, doc, labels=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, doc, labels)
+
+    def _child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+
+class _GaugeChild:
+    __slots__ = ("function",)
+
+    def __init__(self):
+        self.function = None
+
+    def set_function(self, function):
+        self.function = function
+
+    def render(self, name, label_names, values):
+        if self.function is None:
+            return []
+        try:
+            value = self.function()
+        except Exception as e:
+            logging.debug("Jauge %s illisible: %s", name, e)
+            return []
+        return [f"{name}{_format_labels(label_names, values)} {_format_value(value)}"]
+
+
+class Gauge(_Metric):
+    """Jauge lue au scrape via une fonction (profondeur de file, etc.)."""
+    type = "gauge"
+
+    def _child(self):
+        return _GaugeChild()
+
+    def set_function(self, function):
+        self.labels().set_function(function)
+
+
+def render():
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# Catalogue des métriques du listener
+MESSAGES_RECEIVED = Counter("iot_messages_received_total", "Messages MQTT reçus")
+UNKNOWN_DEVEUI = Counter("iot_unknown_deveui_total", "Messages d'un DevEUI absent de la table des devices")
+MESSAGES_DECODED = Counter("iot_messages_decoded_total", "Messages décodés avec succès", ("decoder",))
+DECODER_FAILURES = Counter("iot_decoder_failures_total", "Échecs de décodage", ("decoder",))
+STAGE_SECONDS = Histogram("iot_pipeline_stage_seconds",
+                          "Latence par étape du pipeline (attente en file, décodage, écriture)", ("stage",))
+QUEUE_DEPTH = Gauge("iot_pipeline_queue_depth", "Messages en attente par file du pipeline", ("queue",))
+PIPELINE_DROPPED = Gauge("iot_pipeline_dropped", "Messages jetés par la contre-pression (drop_oldest)")
+PIPELINE_SPILLED = Gauge("iot_pipeline_spilled", "Messages en attente dans le débordement disque")
+PIPELINE_BATCH_FAILURES = Counter("iot_pipeline_batch_decode_failures_total",
+                                  "Lots dont le décodage groupé a échoué (messages redécodés un par un)")
+INFLUX_WRITE_SECONDS = Histogram("iot_influx_write_seconds", "Durée des requêtes d'écriture InfluxDB")
+INFLUX_BATCH_POINTS = Histogram("iot_influx_batch_points", "Points par lot écrit dans InfluxDB",
+                                buckets=SIZE_BUCKETS)
+INFLUX_BATCHES = Counter("iot_influx_batches_total", "Lots InfluxDB par résultat", ("result",))
+MQTT_CONNECTS = Counter("iot_mqtt_connects_total", "Connexions MQTT établies (reconnexions comprises)")
+MQTT_DISCONNECTS = Counter("iot_mqtt_unexpected_disconnects_total", "Déconnexions MQTT inattendues")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(port: int = METRICS_PORT, addr: str = METRICS_ADDR):
+    """Démarre l'endpoint /metrics sur un thread (rien si port vaut 0)."""
+    if not port:
+        return None
+    try:
+        server = ThreadingHTTPServer((addr, port), _Handler)
+    except OSError as e:
+        logging.error(f"Endpoint de métriques indisponible sur {addr}:{port}: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logging.info(f"Métriques Prometheus sur http://{addr}:{port}/metrics")
+    return server
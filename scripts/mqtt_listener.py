@@ -1,15 +1,23 @@
 #!/usr/bin/env python3
 import os
-import json
+import signal
 import paho.mqtt.client as mqtt
-from influxdb_client import InfluxDBClient, Point, WriteOptions
 from influxdb_client.client.exceptions import InfluxDBError
 from dotenv import load_dotenv
-from importlib import import_module
 import logging
+import influx_writer
+import device_table
+import listener_log
+import uplink_parser
+import uplink_decoding
+import uplink_archive
+import metrics
+import device_state
+from pipeline import Pipeline
 
 # Configuration du logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+listener_log.apply({})
 
 # Charger les variables d'environnement depuis /opt/iot-infra/.env
 load_dotenv("/opt/iot-infra/.env")
@@ -18,97 +26,63 @@ MQTT_HOST    = os.getenv("MQTT_HOST")
 TTN_USERNAME = os.getenv("TTN_USERNAME")
 TTN_PASSWORD = os.getenv("TTN_PASSWORD")
 
-INFLUX_URL    = os.getenv("INFLUX_URL")
-INFLUX_TOKEN  = os.getenv("INFLUX_TOKEN")
 INFLUX_ORG    = os.getenv("INFLUX_ORG")
 # INFLUX_BUCKET n'est plus utilisé, car on crée un bucket par type de capteur
+# Sérialisation des points : "line" (encodeur direct, bytes) ou "point" (influxdb_client.Point, référence)
+INFLUX_ENCODER = os.getenv("INFLUX_ENCODER", "line")
+# Précision des horodatages écrits : ns, us, ms ou s
+INFLUX_PRECISION = os.getenv("INFLUX_PRECISION", "ns")
+if INFLUX_ENCODER not in uplink_decoding.ENCODERS:
+    raise ValueError(f"INFLUX_ENCODER invalide: {INFLUX_ENCODER}")
+if INFLUX_PRECISION not in uplink_decoding.PRECISION_DIVISORS:
+    raise ValueError(f"INFLUX_PRECISION invalide: {INFLUX_PRECISION}")
 
-# Charger les devices connus depuis /opt/iot-infra/devices.json
-DEVICES_FILE  = "/opt/iot-infra/devices.json"
-if os.path.exists(DEVICES_FILE):
-    try:
-        with open(DEVICES_FILE, "r") as f:
-            DEVICES = json.load(f)
-        logging.info(f"Devices chargés depuis {DEVICES_FILE}: {DEVICES}")
-    except json.JSONDecodeError as e:
-        logging.error(f"Erreur lors de la lecture de {DEVICES_FILE}: {e}")
-        DEVICES = {}
-else:
-    logging.warning(f"Fichier de devices non trouvé: {DEVICES_FILE}")
-    DEVICES = {}
+# Charger les devices connus depuis le store /opt/iot-infra/devices.db (devices.json importé à sa création)
+# (la table est ensuite rechargée à chaud par device_table quand le store change)
+device_table.reload()
 
 # Fonction pour obtenir (et créer si nécessaire) un bucket dans InfluxDB pour un type de capteur
+# (le cache du writer évite toute requête quand le bucket est déjà connu)
 def get_or_create_bucket(bucket_name: str):
     try:
-        with InfluxDBClient(url=INFLUX_URL, token=INFLUX_TOKEN, org=INFLUX_ORG) as client:
-            buckets_api = client.buckets_api()
-            bucket = buckets_api.find_bucket_by_name(bucket_name)
-            if bucket is None:
-                bucket = buckets_api.create_bucket(bucket_name=bucket_name, org=INFLUX_ORG)
-                logging.info(f"✅ Bucket '{bucket_name}' créé.")
-            else:
-                logging.info(f"ℹ️ Bucket '{bucket_name}' déjà existant.")
-            return bucket.name
+        return influx_writer.ensure_bucket(bucket_name)
     except InfluxDBError as e:
         logging.error(f"❌ Erreur lors de la création/récupération du bucket '{bucket_name}': {e}")
         return None
 
-# Callback de réception MQTT
+# Écriture d'un message décodé (exécutée par le thread writer du pipeline)
+def write_decoded(result):
+    dev_eui, points, decoder_name = result
+    # Écrire les données dans InfluxDB dans le bucket associé au type de capteur
+    write_points(dev_eui, points, sensor_type=decoder_name)
+
+# Résumé par DevEUI (DEVICE_STATE_FILE), mis à jour à chaque uplink décodé
+STATE = device_state.DeviceState()
+# Décodage des messages bruts (exécuté par les workers du pipeline, voir uplink_decoding)
+DECODING = uplink_decoding.UplinkDecoder(on_decoded=STATE.update)
+decode_message = DECODING.decode_message
+decode_messages = DECODING.decode_messages
+
+PIPELINE = Pipeline(decode_message, write_decoded, batch_decode_fn=decode_messages)
+# Archive des uplinks bruts (optionnelle, ARCHIVE_ENABLED=1), écrite par son propre thread
+ARCHIVE = uplink_archive.UplinkArchive() if uplink_archive.ARCHIVE_ENABLED else None
+
+# Callback de réception MQTT : exécuté sur le thread réseau de paho, il se contente de mettre en file
 def on_message(client, userdata, msg):
-    try:
-        raw_msg = msg.payload.decode()
-        logging.info(f"Message MQTT reçu sur le topic '{msg.topic}':\n{raw_msg}")
-        payload = json.loads(raw_msg)
-        dev_eui = payload["end_device_ids"]["dev_eui"]
-        uplink = payload["uplink_message"]
-        frm_payload = uplink.get("frm_payload")
-        
-        # Filtrage par f_port (ici on traite uniquement les messages sur le port 1)
-        #fport = uplink.get("f_port", 0)
-        #if fport != 1:
-        #    logging.info(f"Ignoré message sur le port {fport} pour {dev_eui}")
-        #    return
-        
-        if dev_eui not in DEVICES:
-            logging.warning(f"DevEUI inconnu : {dev_eui}")
-            return
-        
-        # Importer dynamiquement le module de décodage correspondant au type de capteur
-        decoder_name = DEVICES[dev_eui]
-        try:
-            decoder_module = import_module(f"decoders.{decoder_name}")
-        except ImportError as e:
-            logging.error(f"Impossible d'importer le décodeur '{decoder_name}' pour {dev_eui}: {e}")
-            return
-        
-        if not frm_payload:
-            logging.warning(f"frm_payload vide ou manquant pour {dev_eui}")
-            return
-        
-        logging.info(f"frm_payload reçu pour {dev_eui}: {frm_payload}")
-        
-        # Ici, on ne fait **pas** de décodage Base64 : on passe la chaîne directement au décodeur
-        try:
-            decoded = decoder_module.decode(frm_payload)
-        except Exception as e:
-            logging.error(f"Erreur lors de l'exécution du décodeur '{decoder_name}' pour {dev_eui}: {e}")
-            return
-        
-        if not decoded:
-            logging.warning(f"Aucun champ décodé pour {dev_eui}")
-            return
-        
-        logging.info(f"Données décodées pour {dev_eui} → {decoded}")
-        
-        # Écrire les données dans InfluxDB dans le bucket associé au type de capteur
-        write_points(dev_eui, decoded)
-        
-    except Exception as e:
-        logging.error(f"Erreur dans on_message: {e}")
+    metrics.MESSAGES_RECEIVED.inc()
+    if ARCHIVE is not None:
+        ARCHIVE.append(msg.payload)
+    PIPELINE.submit(msg.topic, msg.payload)
+
+# Enregistrement à passer à la write API pour tous les points d'un uplink (voir uplink_decoding),
+# selon INFLUX_ENCODER et INFLUX_PRECISION
+def encode_record(dev_eui, points):
+    return uplink_decoding.encode_record(dev_eui, points, INFLUX_ENCODER, INFLUX_PRECISION)
 
 # Fonction d'écriture dans InfluxDB dans le bucket associé au type de capteur
-def write_points(dev_eui, fields):
-    sensor_type = DEVICES.get(dev_eui)
+# points : [(timestamp_ns, {nom: float}), ...] (voir Decoder.points())
+def write_points(dev_eui, points, sensor_type=None):
+    sensor_type = sensor_type or device_table.current().devices.get(dev_eui)
     if not sensor_type:
         logging.error(f"Type de capteur non trouvé pour {dev_eui}")
         return
@@ -117,31 +91,92 @@ def write_points(dev_eui, fields):
         logging.error(f"Impossible d'obtenir ou de créer le bucket pour {sensor_type}")
         return
     try:
-        with InfluxDBClient(url=INFLUX_URL, token=INFLUX_TOKEN, org=INFLUX_ORG) as client:
-            write_api = client.write_api(write_options=WriteOptions(batch_size=1))
-            point = Point("iot").tag("dev_eui", dev_eui)
-            for key, value in fields.items():
-                if isinstance(value, (int, float)):
-                    point.field(key, float(value))
-            write_api.write(bucket=bucket_name, record=point)
-            logging.info(f"Données écrites dans le bucket '{bucket_name}' pour {dev_eui}: {fields}")
+        record = encode_record(dev_eui, points)
+        if record is None:
+            return
+        # Ajout au lot en cours (un seul élément, même pour un historique de plusieurs points) :
+        # l'envoi se fait en arrière-plan par le writer partagé
+        influx_writer.write(bucket_name, record, INFLUX_PRECISION)
+        logging.debug("Données mises en file pour le bucket '%s' pour %s: %s", bucket_name, dev_eui, points)
     except Exception as e:
         logging.error(f"Erreur lors de l'écriture dans InfluxDB: {e}")
 
-# Initialisation MQTT
-client = mqtt.Client()
-client.username_pw_set(TTN_USERNAME, TTN_PASSWORD)
-client.on_message = on_message
+def main():
+    # Initialisation MQTT
+    client = mqtt.Client()
+    client.username_pw_set(TTN_USERNAME, TTN_PASSWORD)
+    client.on_message = on_message
+
+    topic = f"v3/{TTN_USERNAME}/devices/+/up"
 
-logging.info(f"Connexion MQTT à {MQTT_HOST}...")
-try:
-    client.connect(MQTT_HOST, 1883, 60)
-except Exception as e:
-    logging.error(f"Erreur de connexion MQTT: {e}")
-    exit(1)
+    # (Ré)abonnement à chaque connexion : paho ne restaure pas les abonnements après une reconnexion
+    def on_connect(client, userdata, flags, rc):
+        if rc != 0:
+            logging.error(f"Connexion MQTT refusée (code {rc})")
+            return
+        metrics.MQTT_CONNECTS.inc()
+        logging.info(f"Abonnement au topic: {topic}")
+        client.subscribe(topic)
+
+    def on_disconnect(client, userdata, rc):
+        if rc != 0:
+            metrics.MQTT_DISCONNECTS.inc()
+            logging.warning(f"Déconnexion MQTT inattendue (code {rc}), reconnexion...")
+
+    client.on_connect = on_connect
+    client.on_disconnect = on_disconnect
+
+    # Arrêt propre sur SIGTERM (systemctl stop/restart) : on coupe MQTT puis on vide les lots en attente
+    def on_sigterm(signum, frame):
+        logging.info(f"Signal {signum} reçu, arrêt du listener...")
+        client.disconnect()
+    signal.signal(signal.SIGTERM, on_sigterm)
+    signal.signal(signal.SIGINT, on_sigterm)
+
+    logging.info(f"Parser d'uplink: {uplink_parser.PARSER_NAME} (horodatage {uplink_parser.UPLINK_TIME_SOURCE}), "
+                 f"encodeur InfluxDB: {INFLUX_ENCODER}, précision {INFLUX_PRECISION}")
+
+    # Réglage de la journalisation modifiable à chaud (LOG_CONTROL_FILE)
+    listener_log.start_watcher()
+
+    # Rechargement à chaud du store des devices (plus besoin de redémarrer le service)
+    device_table.start_watcher()
 
-topic = f"v3/{TTN_USERNAME}/devices/+/up"
-logging.info(f"Abonnement au topic: {topic}")
-client.subscribe(topic)
+    # Préchargement des buckets existants (un seul appel au démarrage)
+    influx_writer.warm_bucket_cache()
+
+    # Rejeu des lots conservés sur disque quand InfluxDB était indisponible
+    influx_writer.start_spool_replay()
+
+    # Endpoint Prometheus /metrics (METRICS_PORT, 0 pour le désactiver)
+    metrics.QUEUE_DEPTH.labels("decode").set_function(PIPELINE.inbox.qsize)
+    metrics.QUEUE_DEPTH.labels("write").set_function(PIPELINE.outbox.qsize)
+    metrics.PIPELINE_DROPPED.set_function(lambda: PIPELINE.inbox.dropped)
+    metrics.PIPELINE_SPILLED.set_function(lambda: PIPELINE.inbox.spilled)
+    if ARCHIVE is not None:
+        metrics.QUEUE_DEPTH.labels("archive").set_function(ARCHIVE.qsize)
+    metrics.start_server()
+
+    logging.info(f"Connexion MQTT à {MQTT_HOST}...")
+    try:
+        client.connect(MQTT_HOST, 1883, 60)
+    except Exception as e:
+        logging.error(f"Erreur de connexion MQTT: {e}")
+        exit(1)
+
+    if ARCHIVE is not None:
+        ARCHIVE.start()
+    STATE.start()
+    PIPELINE.start()
+    try:
+        client.loop_forever()
+    finally:
+        PIPELINE.stop()
+        STATE.close()
+        if ARCHIVE is not None:
+            ARCHIVE.close()
+        influx_writer.close()
+        logging.info("Listener arrêté.")
 
-client.loop_forever()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+# Variante asyncio du listener : plusieurs applications TTN et des milliers d'écritures
+# en vol dans un seul processus, sans thread par tâche.
+#
+# MQTT : paho branché sur la boucle asyncio (intégration par socket externe)
+# InfluxDB : write API asynchrone (nécessite `pip install "influxdb-client[async]"`)
+#
+# Le décodage et l'encodage des points sont ceux de mqtt_listener.py (voir uplink_decoding.py).
+import os
+import time
+import asyncio
+import signal
+import socket
+import logging
+import threading
+import paho.mqtt.client as mqtt
+from influxdb_client.client.influxdb_client_async import InfluxDBClientAsync
+import influx_writer
+import device_table
+import mqtt_listener
+import metrics
+from mqtt_listener import MQTT_HOST, TTN_USERNAME, TTN_PASSWORD, INFLUX_ORG
+
+# Applications TTN à écouter : "user1:cle1,user2:cle2" (par défaut TTN_USERNAME/TTN_PASSWORD)
+TTN_APPLICATIONS = os.getenv("TTN_APPLICATIONS", "")
+# Nombre maximal de requêtes d'écriture InfluxDB simultanées
+ASYNC_MAX_INFLIGHT = int(os.getenv("ASYNC_MAX_INFLIGHT", "1000"))
+# Décodage dans un pool de threads plutôt que directement sur la boucle
+ASYNC_DECODE_EXECUTOR = os.getenv("ASYNC_DECODE_EXECUTOR", "0") == "1"
+# Messages reçus en attente de traitement au-delà desquels la lecture des sockets MQTT est suspendue
+ASYNC_MAX_PENDING = int(os.getenv("ASYNC_MAX_PENDING", "10000"))
+# Nombre de tâches qui traitent la file des messages reçus
+ASYNC_WORKERS = int(os.getenv("ASYNC_WORKERS", "64"))
+# Délai entre deux tentatives de reconnexion MQTT, doublé à chaque échec (secondes)
+MQTT_RECONNECT_MIN_DELAY = float(os.getenv("MQTT_RECONNECT_MIN_DELAY", "1"))
+MQTT_RECONNECT_MAX_DELAY = float(os.getenv("MQTT_RECONNECT_MAX_DELAY", "120"))
+
+
+def parse_applications():
+    if not TTN_APPLICATIONS:
+        return [(TTN_USERNAME, TTN_PASSWORD)]
+    applications = []
+    for entry in TTN_APPLICATIONS.split(","):
+        username, _, password = entry.strip().partition(":")
+        applications.append((username, password))
+    return applications
+
+
+class AsyncioHelper:
+    """
+    Branche les sockets d'un client paho sur la boucle asyncio (loop_read/loop_write/loop_misc).
+
+    Sans loop_forever(), paho ne se reconnecte pas seul : après une déconnexion inattendue (ou un
+    échec de la connexion initiale), reconnect() est retenté avec un délai doublé à chaque échec,
+    remis au minimum par connected() une fois la connexion acceptée par le broker.
+
+    reconnect() (résolution DNS, connexion TCP) tourne dans le pool de threads : les callbacks de
+    socket appelés par paho depuis ce thread sont renvoyés sur la boucle (call_soon_threadsafe),
+    avec le descripteur relevé au moment de l'appel (paho ferme le socket juste après on_socket_close).
+    pause_reading()/resume_reading() suspendent la lecture du socket quand la file des messages est pleine.
+    """
+
+    def __init__(self, loop, client):
+        self.loop = loop
+        self.client = client
+        self.thread = threading.get_ident()
+        self.fd = None
+        self.paused = False
+        self.misc = None
+        self.reconnecting = None
+        self.delay = MQTT_RECONNECT_MIN_DELAY
+        client.on_disconnect = self.on_disconnect
+        client.on_socket_open = self.on_socket_open
+        client.on_socket_close = self.on_socket_close
+        client.on_socket_register_write = self.on_socket_register_write
+        client.on_socket_unregister_write = self.on_socket_unregister_write
+
+    def on_loop(self, callback, *args):
+        # Appel direct depuis la boucle, différé (dans l'ordre) depuis le thread de reconnect()
+        if threading.get_ident() == self.thread:
+            callback(*args)
+        else:
+            self.loop.call_soon_threadsafe(callback, *args)
+
+    def on_socket_open(self, client, userdata, sock):
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 2048)
+        self.on_loop(self.socket_opened, sock.fileno())
+
+    def on_socket_close(self, client, userdata, sock):
+        self.on_loop(self.socket_closed, sock.fileno())
+
+    def on_socket_register_write(self, client, userdata, sock):
+        self.on_loop(self.loop.add_writer, sock.fileno(), client.loop_write)
+
+    def on_socket_unregister_write(self, client, userdata, sock):
+        self.on_loop(self.loop.remove_writer, sock.fileno())
+
+    def socket_opened(self, fd):
+        self.fd = fd
+        if not self.paused:
+            self.loop.add_reader(fd, self.client.loop_read)
+        self.misc = self.loop.create_task(self.misc_loop())
+
+    def socket_closed(self, fd):
+        self.loop.remove_reader(fd)
+        if self.fd == fd:
+            self.fd = None
+        if self.misc:
+            self.misc.cancel()
+
+    def pause_reading(self):
+        if not self.paused:
+            self.paused = True
+            if self.fd is not None:
+                self.loop.remove_reader(self.fd)
+
+    def resume_reading(self):
+        if self.paused:
+            self.paused = False
+            if self.fd is not None:
+                self.loop.add_reader(self.fd, self.client.loop_read)
+
+    async def misc_loop(self):
+        # Keepalive : ce que fait loop_forever() hors lecture/écriture (la reconnexion est à part)
+        while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                break
+
+    def on_disconnect(self, client, userdata, rc):
+        if rc == 0:
+            # disconnect() demandé (arrêt du listener)
+            return
+        metrics.MQTT_DISCONNECTS.inc()
+        logging.warning(f"Déconnexion MQTT inattendue (code {rc}), reconnexion...")
+        self.schedule_reconnect()
+
+    def connected(self):
+        self.delay = MQTT_RECONNECT_MIN_DELAY
+
+    def schedule_reconnect(self):
+        if self.reconnecting is None or self.reconnecting.done():
+            self.reconnecting = self.loop.create_task(self.reconnect_loop())
+
+    async def reconnect_loop(self):
+        while True:
+            await asyncio.sleep(self.delay)
+            self.delay = min(self.delay * 2, MQTT_RECONNECT_MAX_DELAY)
+            try:
+                # Appel bloquant, hors de la boucle ; un refus du broker (CONNACK) passe
+                # par on_disconnect et relance ce cycle avec le délai déjà augmenté
+                await self.loop.run_in_executor(None, self.client.reconnect)
+                return
+            except Exception as e:
+                logging.warning(f"Reconnexion MQTT impossible ({e}), nouvel essai dans {self.delay:g} s")
+
+    def stop(self):
+        if self.reconnecting is not None:
+            self.reconnecting.cancel()
+
+
+class AsyncWriter:
+    """
+    Accumule les points par bucket et les envoie par lots via la write API asynchrone.
+
+    Les lignes déjà encodées (bytes, cf. line_protocol) sont concaténées en un seul corps.
+    Un lot en échec est conservé dans le spool disque d'influx_writer et rejoué par son thread.
+    """
+
+    def __init__(self, client):
+        self.write_api = client.write_api()
+        self.batches = {}
+        self.inflight = asyncio.Semaphore(ASYNC_MAX_INFLIGHT)
+        self.tasks = set()
+
+    async def add(self, bucket, record):
+        """record : lignes d'un uplink (bytes) ou liste de Point (cf. mqtt_listener.encode_record)."""
+        batch = self.batches.setdefault(bucket, [])
+        if isinstance(record, list):
+            batch.extend(record)
+        else:
+            batch.append(record)
+        if len(batch) >= influx_writer.INFLUX_BATCH_SIZE:
+            await self.flush_bucket(bucket)
+
+    async def flush_bucket(self, bucket):
+        points = self.batches.pop(bucket, None)
+        if not points:
+            return
+        await self.inflight.acquire()
+        task = asyncio.create_task(self._write(bucket, points))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _write(self, bucket, points):
+        record = b"\n".join(points) if isinstance(points[0], bytes) else points
+        start = time.perf_counter()
+        try:
+            await self.write_api.write(bucket=bucket, org=INFLUX_ORG, record=record,
+                                       write_precision=mqtt_listener.INFLUX_PRECISION)
+            metrics.INFLUX_BATCHES.labels("success").inc()
+            metrics.INFLUX_BATCH_POINTS.observe(record.count(b"\n") + 1 if isinstance(record, bytes) else len(record))
+            logging.debug(f"{len(points)} point(s) écrits dans le bucket '{bucket}'")
+        except Exception as e:
+            # Même traitement que les lots en échec du writer synchrone : spool disque, rejoué ensuite
+            if not isinstance(record, bytes):
+                record = "\n".join(point.to_line_protocol() for point in record)
+            await asyncio.get_running_loop().run_in_executor(
+                None, influx_writer.spool_failed_batch, bucket, mqtt_listener.INFLUX_PRECISION, record, e)
+        finally:
+            metrics.INFLUX_WRITE_SECONDS.observe(time.perf_counter() - start)
+            self.inflight.release()
+
+    async def flush_loop(self, stop):
+        interval = influx_writer.INFLUX_FLUSH_INTERVAL / 1000
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            for bucket in list(self.batches):
+                await self.flush_bucket(bucket)
+
+    async def close(self):
+        for bucket in list(self.batches):
+            await self.flush_bucket(bucket)
+        if self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+
+
+async def handle_message(loop, writer, topic, payload):
+    if ASYNC_DECODE_EXECUTOR:
+        result = await loop.run_in_executor(None, mqtt_listener.decode_message, topic, payload)
+    else:
+        result = mqtt_listener.decode_message(topic, payload)
+    if result is None:
+        return
+    dev_eui, points, sensor_type = result
+    bucket_name = sensor_type
+    if not influx_writer.is_known_bucket(bucket_name):
+        # Seul un bucket encore inconnu coûte un appel (bloquant) à l'API, hors de la boucle
+        bucket_name = await loop.run_in_executor(None, mqtt_listener.get_or_create_bucket, sensor_type)
+        if not bucket_name:
+            logging.error(f"Impossible d'obtenir ou de créer le bucket pour {sensor_type}")
+            return
+    record = mqtt_listener.encode_record(dev_eui, points)
+    if record is not None:
+        await writer.add(bucket_name, record)
+
+
+async def message_worker(loop, writer, queue, helpers):
+    while True:
+        topic, payload = await queue.get()
+        try:
+            await handle_message(loop, writer, topic, payload)
+        except Exception as e:
+            logging.error(f"Erreur lors du traitement du message reçu sur '{topic}': {e}")
+        finally:
+            queue.task_done()
+        # Lecture MQTT reprise une fois la file redescendue à moitié
+        if queue.qsize() <= ASYNC_MAX_PENDING // 2:
+            for helper in helpers:
+                helper.resume_reading()
+
+
+async def main():
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    loop.add_signal_handler(signal.SIGTERM, stop.set)
+    loop.add_signal_handler(signal.SIGINT, stop.set)
+
+    device_table.start_watcher()
+    metrics.start_server()
+    mqtt_listener.STATE.start()
+    await loop.run_in_executor(None, influx_writer.warm_bucket_cache)
+    # Rejeu (synchrone, dans son thread) des lots conservés sur disque quand InfluxDB était indisponible
+    influx_writer.start_spool_replay()
+
+    async with InfluxDBClientAsync(url=influx_writer.INFLUX_URL, token=influx_writer.INFLUX_TOKEN,
+                                   org=INFLUX_ORG) as influx:
+        writer = AsyncWriter(influx)
+        # File bornée par ASYNC_MAX_PENDING : au-delà, les sockets MQTT ne sont plus lus (le broker
+        # retient les messages) jusqu'à ce que les workers l'aient vidée de moitié. Pas de maxsize :
+        # un loop_read() peut livrer plusieurs messages, aucun ne doit être refusé par put_nowait()
+        queue = asyncio.Queue()
+        helpers = []
+
+        def on_message(client, userdata, msg):
+            metrics.MESSAGES_RECEIVED.inc()
+            queue.put_nowait((msg.topic, msg.payload))
+            if queue.qsize() >= ASYNC_MAX_PENDING:
+                for helper in helpers:
+                    helper.pause_reading()
+
+        clients = []
+        for username, password in parse_applications():
+            client = mqtt.Client()
+            client.username_pw_set(username, password)
+            client.on_message = on_message
+            topic = f"v3/{username}/devices/+/up"
+            helper = AsyncioHelper(loop, client)
+            helpers.append(helper)
+
+            # (Ré)abonnement à chaque connexion acceptée : paho ne restaure pas les abonnements
+            def on_connect(c, userdata, flags, rc, topic=topic, username=username, helper=helper):
+                if rc != 0:
+                    logging.error(f"Connexion MQTT refusée pour {username} (code {rc})")
+                    return
+                helper.connected()
+                metrics.MQTT_CONNECTS.inc()
+                logging.info(f"Abonnement au topic: {topic}")
+                c.subscribe(topic)
+            client.on_connect = on_connect
+            logging.info(f"Connexion MQTT à {MQTT_HOST} pour {username} (topic {topic})...")
+            try:
+                client.connect(MQTT_HOST, 1883, 60)
+            except Exception as e:
+                logging.error(f"Erreur de connexion MQTT pour {username}: {e}, nouvel essai en arrière-plan")
+                helper.schedule_reconnect()
+            clients.append((client, helper))
+
+        workers = [asyncio.create_task(message_worker(loop, writer, queue, helpers))
+                   for _ in range(ASYNC_WORKERS)]
+        flusher = asyncio.create_task(writer.flush_loop(stop))
+        await stop.wait()
+        logging.info("Arrêt du listener asyncio...")
+        for client, helper in clients:
+            helper.stop()
+            client.disconnect()
+        await queue.join()
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        await flusher
+        await writer.close()
+    mqtt_listener.STATE.close()
+    influx_writer.close()
+    logging.info("Listener arrêté.")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(asyncio.run(main()))
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+# Pipeline réception MQTT -> décodage -> écriture, découplé par des files bornées
+import os
+import json
+import time
+import queue
+import threading
+import logging
+import metrics
+
+PIPELINE_QUEUE_SIZE       = int(os.getenv("PIPELINE_QUEUE_SIZE", "10000"))
+PIPELINE_WRITE_QUEUE_SIZE = int(os.getenv("PIPELINE_WRITE_QUEUE_SIZE", "10000"))
+PIPELINE_DECODE_WORKERS   = int(os.getenv("PIPELINE_DECODE_WORKERS", "2"))
+# Politique quand la file d'entrée est pleine : block, drop_oldest ou spill (débordement sur disque)
+PIPELINE_BACKPRESSURE     = os.getenv("PIPELINE_BACKPRESSURE", "block")
+PIPELINE_SPILL_FILE       = os.getenv("PIPELINE_SPILL_FILE", "/opt/iot-infra/spool/pipeline_spill.ndjson")
+# Nombre maximal de messages décodés ensemble par un worker (si la pipeline a un batch_decode_fn)
+PIPELINE_DECODE_BATCH     = int(os.getenv("PIPELINE_DECODE_BATCH", "64"))
+PIPELINE_STATS_INTERVAL   = float(os.getenv("PIPELINE_STATS_INTERVAL", "60"))  # secondes, 0 = désactivé
+
+BACKPRESSURE_POLICIES = ("block", "drop_oldest", "spill")
+
+_STOP = object()
+
+
+class StageStats:
+    """Compteur et latences (moyenne, max) d'une étape du pipeline, reportées dans l'histogramme Prometheus."""
+
+    def __init__(self, name):
+        self.name = name
+        self._histogram = metrics.STAGE_SECONDS.labels(name)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self._histogram.observe(seconds)
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def snapshot(self, reset_max=False):
+        with self._lock:
+            avg = self.total / self.count if self.count else 0.0
+            snap = {"count": self.count, "avg_ms": avg * 1000, "max_ms": self.max * 1000}
+            if reset_max:
+                self.max = 0.0
+            return snap
+
+
+class BoundedQueue:
+    """
+    File bornée avec politique de contre-pression configurable.
+
+    - block       : put() attend qu'une place se libère
+    - drop_oldest : le plus ancien élément est jeté pour faire de la place
+    - spill       : le surplus est ajouté à un fichier NDJSON puis relu dans l'ordre
+                    quand la file se vide (le fichier survit à un redémarrage)
+
+    La position de relecture du débordement est conservée dans `<fichier>.pos` (comme spool.py) :
+    après un redémarrage, les messages déjà relus ne sont pas traités une deuxième fois.
+    """
+
+    def __init__(self, name, maxsize, policy="block", spill_file=None, encode=None, decode=None):
+        if policy not in BACKPRESSURE_POLICIES:
+            raise ValueError(f"Politique de contre-pression inconnue: {policy}")
+        if policy == "spill" and not (spill_file and encode and decode):
+            raise ValueError("La politique 'spill' nécessite un fichier et des fonctions encode/decode")
+        self.name = name
+        self.maxsize = maxsize
+        self.policy = policy
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._spill_file = spill_file
+        self._encode = encode
+        self._decode = decode
+        self._spill_lock = threading.Lock()
+        self._spilled = 0
+        self._spill_pos = 0
+        self._pos_file = f"{spill_file}.pos" if spill_file else None
+        self._closing = False
+        if policy == "spill":
+            os.makedirs(os.path.dirname(spill_file), exist_ok=True)
+            if os.path.exists(spill_file):
+                if os.path.exists(self._pos_file):
+                    with open(self._pos_file) as f:
+                        self._spill_pos = int(f.read().strip() or 0)
+                    if self._spill_pos > os.path.getsize(spill_file):
+                        # Débordement remplacé depuis : relu depuis le début
+                        self._spill_pos = 0
+                with open(spill_file, "r") as f:
+                    f.seek(self._spill_pos)
+                    self._spilled = sum(1 for _ in f)
+                if self._spilled:
+                    logging.info(f"{self._spilled} message(s) en attente dans {spill_file}")
+
+    def qsize(self):
+        return self._queue.qsize()
+
+    @property
+    def spilled(self):
+        return self._spilled
+
+    def put(self, item):
+        if self.policy == "block":
+            self._queue.put(item)
+        elif self.policy == "drop_oldest":
+            while True:
+                try:
+                    self._queue.put_nowait(item)
+                    return
+                except queue.Full:
+                    try:
+                        self._queue.get_nowait()
+                        self.dropped += 1
+                    except queue.Empty:
+                        pass
+        else:
+            with self._spill_lock:
+                # Tant que le fichier n'est pas vidé, tout y passe pour garder l'ordre d'arrivée
+                if not self._spilled:
+                    try:
+                        self._queue.put_nowait(item)
+                        return
+                    except queue.Full:
+                        pass
+                with open(self._spill_file, "a") as f:
+                    f.write(json.dumps(self._encode(item)) + "\n")
+                self._spilled += 1
+
+    def put_control(self, item):
+        """Insère un élément de contrôle (arrêt) sans appliquer la politique."""
+        # À l'arrêt, le débordement disque n'est plus relu : il sera repris au prochain démarrage
+        self._closing = True
+        self._queue.put(item)
+
+    def get(self, block=True):
+        """Retourne l'élément suivant ; avec block=False, lève queue.Empty si la file est vide."""
+        if self._spilled and not self._closing and self._queue.qsize() < max(1, self.maxsize // 2):
+            self._refill()
+        return self._queue.get(block)
+
+    def _refill(self):
+        with self._spill_lock:
+            if not self._spilled:
+                return
+            with open(self._spill_file, "r") as f:
+                f.seek(self._spill_pos)
+                while self._spilled:
+                    line = f.readline()
+                    if not line:
+                        self._spilled = 0
+                        break
+                    try:
+                        self._queue.put_nowait(self._decode(json.loads(line)))
+                    except queue.Full:
+                        break
+                    except ValueError as e:
+                        logging.error(f"Ligne illisible ignorée dans {self._spill_file}: {e}")
+                    self._spill_pos = f.tell()
+                    self._spilled -= 1
+            if not self._spilled:
+                open(self._spill_file, "w").close()
+                self._spill_pos = 0
+                if os.path.exists(self._pos_file):
+                    os.remove(self._pos_file)
+            else:
+                with open(self._pos_file, "w") as pos_file:
+                    pos_file.write(str(self._spill_pos))
+
+
+class Pipeline:
+    """
+    on_message -> [file d'entrée] -> N workers de décodage -> [file d'écriture] -> writer.
+
+    decode_fn(topic, payload) retourne un élément à écrire (ou None pour l'ignorer),
+    write_fn(element) l'envoie vers InfluxDB.
+
+    batch_decode_fn([(topic, payload), ...]) (optionnel) décode d'un coup les messages
+    déjà en attente, jusqu'à decode_batch, et retourne une liste alignée de résultats.
+    S'il lève une exception, les messages du lot sont redécodés un par un par decode_fn.
+    Un message seul dans la file passe toujours par decode_fn : pas d'attente pour remplir un lot.
+    """
+
+    def __init__(self, decode_fn, write_fn,
+                 queue_size=PIPELINE_QUEUE_SIZE,
+                 write_queue_size=PIPELINE_WRITE_QUEUE_SIZE,
+                 workers=PIPELINE_DECODE_WORKERS,
+                 policy=PIPELINE_BACKPRESSURE,
+                 spill_file=PIPELINE_SPILL_FILE,
+                 stats_interval=PIPELINE_STATS_INTERVAL,
+                 batch_decode_fn=None,
+                 decode_batch=PIPELINE_DECODE_BATCH):
+        self.decode_fn = decode_fn
+        self.write_fn = write_fn
+        self.batch_decode_fn = batch_decode_fn
+        self.decode_batch = max(1, decode_batch) if batch_decode_fn else 1
+        self.workers = workers
+        self.stats_interval = stats_interval
+        self.inbox = BoundedQueue(
+            "decode", queue_size, policy, spill_file,
+            encode=lambda item: [item[0], item[1].decode("utf-8", "replace"), item[2]],
+            decode=lambda rec: (rec[0], rec[1].encode(), rec[2]),
+        )
+        self.outbox = BoundedQueue("write", write_queue_size, "block")
+        self.stats = {
+            "queue_wait": StageStats("queue_wait"),
+            "decode": StageStats("decode"),
+            "write_wait": StageStats("write_wait"),
+            "write": StageStats("write"),
+        }
+        self._threads = []
+        self._stopping = threading.Event()
+
+    def submit(self, topic, payload):
+        """Appelé depuis on_message : ne fait que mettre le message brut en file."""
+        self.inbox.put((topic, payload, time.time()))
+
+    def start(self):
+        for i in range(self.workers):
+            self._threads.append(threading.Thread(target=self._decode_loop, name=f"decode-{i}", daemon=True))
+        self._writer = threading.Thread(target=self._write_loop, name="writer", daemon=True)
+        for thread in self._threads + [self._writer]:
+            thread.start()
+        if self.stats_interval > 0:
+            threading.Thread(target=self._stats_loop, name="pipeline-stats", daemon=True).start()
+        logging.info(f"Pipeline démarré: {self.workers} worker(s) de décodage (lots de {self.decode_batch} max), "
+                     f"file {self.inbox.maxsize} ({self.inbox.policy}), file d'écriture {self.outbox.maxsize}")
+
+    def stop(self):
+        """Vide les files (hors débordement disque) puis arrête les threads."""
+        self._stopping.set()
+        for _ in self._threads:
+            self.inbox.put_control(_STOP)
+        for thread in self._threads:
+            thread.join()
+        self.outbox.put_control(_STOP)
+        self._writer.join()
+        logging.info("Pipeline arrêté.")
+
+    def _next_batch(self):
+        """Attend un message puis prend, sans attendre, ceux déjà en file (jusqu'à decode_batch)."""
+        batch = [self.inbox.get()]
+        while len(batch) < self.decode_batch and batch[-1] is not _STOP:
+            try:
+                batch.append(self.inbox.get(block=False))
+            except queue.Empty:
+                break
+        return batch
+
+    def _decode_loop(self):
+        while True:
+            batch = self._next_batch()
+            stop = batch[-1] is _STOP
+            if stop:
+                batch.pop()
+            if batch:
+                self._decode_batch(batch)
+            if stop:
+                return
+
+    def _decode_batch(self, batch):
+        start = time.time()
+        for _, _, received in batch:
+            self.stats["queue_wait"].observe(start - received)
+        if len(batch) == 1:
+            topic, payload, _ = batch[0]
+            results = [self._decode_one(topic, payload)]
+        else:
+            try:
+                results = self.batch_decode_fn([(topic, payload) for topic, payload, _ in batch])
+            except Exception as e:
+                # Un lot en échec n'est pas perdu : chaque message est redécodé seul
+                metrics.PIPELINE_BATCH_FAILURES.inc()
+                logging.error(f"Erreur lors du décodage groupé de {len(batch)} messages, décodage un par un: {e}")
+                results = [self._decode_one(topic, payload) for topic, payload, _ in batch]
+        end = time.time()
+        # Latence de décodage ramenée au message pour rester comparable d'un lot à l'autre
+        per_message = (end - start) / len(batch)
+        for _ in batch:
+            self.stats["decode"].observe(per_message)
+        for result in results:
+            if result is not None:
+                self.outbox.put((result, end))
+
+    def _decode_one(self, topic, payload):
+        try:
+            return self.decode_fn(topic, payload)
+        except Exception as e:
+            logging.error(f"Erreur lors du décodage d'un message reçu sur '{topic}': {e}")
+
+    def _write_loop(self):
+        while True:
+            item = self.outbox.get()
+            if item is _STOP:
+                return
+            result, queued = item
+            start = time.time()
+            self.stats["write_wait"].observe(start - queued)
+            try:
+                self.write_fn(result)
+            except Exception as e:
+                logging.error(f"Erreur lors de l'écriture dans InfluxDB: {e}")
+            self.stats["write"].observe(time.time() - start)
+
+    def snapshot(self):
+        """Profondeur des files, messages jetés/débordés et latences par étape."""
+        return {
+            "decode_queue": self.inbox.qsize(),
+            "write_queue": self.outbox.qsize(),
+            "dropped": self.inbox.dropped,
+            "spilled": self.inbox.spilled,
+            "stages": {name: stats.snapshot() for name, stats in self.stats.items()},
+        }
+
+    def _stats_loop(self):
+        while not self._stopping.wait(self.stats_interval):
+            stages = ", ".join(
+                f"{name} moy {snap['avg_ms']:.1f}ms max {snap['max_ms']:.1f}ms"
+                for name, snap in ((name, stats.snapshot(reset_max=True)) for name, stats in self.stats.items())
+            )
+            logging.info(f"Pipeline: file décodage {self.inbox.qsize()}, file écriture {self.outbox.qsize()}, "
+                         f"jetés {self.inbox.dropped}, sur disque {self.inbox.spilled} | {stages}")
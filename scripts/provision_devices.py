@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# Provisionnement en masse des devices (mise en service d'un bâtiment) : CSV ou JSON
+#
+# Formats acceptés :
+#   CSV  : une ligne "dev_eui,decoder" par device (séparateur , ou ;), en-tête et lignes "#" ignorés
+#   JSON : {"<DevEUI>": "<décodeur>", ...} (format devices.json) ou [{"dev_eui": ..., "decoder": ...}, ...]
+#
+# Tout le lot est validé (DevEUI sur 16 caractères hexadécimaux, décodeur connu du registre) avant
+# d'être appliqué en une seule transaction du store : une erreur et rien n'est écrit, sinon le
+# listener recharge sa table une seule fois pour tout le lot.
+#
+# Usage :
+#   python3 provision_devices.py batiment-b.csv [--replace] [--dry-run]
+#   cat devices.json | python3 provision_devices.py - --format json
+import re
+import io
+import sys
+import csv
+import json
+import argparse
+import decoder_registry
+import device_store
+
+DEV_EUI_RE = re.compile(r"[0-9A-F]{16}")
+FORMATS = ("csv", "json")
+
+
+def detect_format(text):
+    return "json" if text.lstrip()[:1] in ("{", "[") else "csv"
+
+
+def parse_csv(text):
+    """Lignes du CSV -> [("ligne N", dev_eui, decoder)], erreurs de structure."""
+    lines = text.splitlines()
+    sample = next((line for line in lines if line.strip() and not line.lstrip().startswith("#")), "")
+    delimiter = ";" if ";" in sample and "," not in sample else ","
+    entries, errors = [], []
+    for number, row in enumerate(csv.reader(io.StringIO(text), delimiter=delimiter), start=1):
+        row = [cell.strip() for cell in row]
+        if not any(row) or row[0].startswith("#"):
+            continue
+        if not entries and not errors and row[0].lower() in ("dev_eui", "deveui"):
+            # En-tête
+            continue
+        if len(row) != 2:
+            errors.append(f"ligne {number}: 2 colonnes attendues (dev_eui, decoder), {len(row)} trouvée(s)")
+            continue
+        entries.append((f"ligne {number}", row[0], row[1]))
+    return entries, errors
+
+
+def parse_json(text):
+    """Objet {dev_eui: decoder} ou liste d'objets -> [("élément N", dev_eui, decoder)], erreurs de structure."""
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError as e:
+        return [], [f"JSON invalide: {e}"]
+    if isinstance(data, dict):
+        return [(f"élément {position}", dev_eui, decoder)
+                for position, (dev_eui, decoder) in enumerate(data.items(), start=1)], []
+    if not isinstance(data, list):
+        return [], ["le contenu doit être un objet {dev_eui: decoder} ou une liste d'objets"]
+    entries, errors = [], []
+    for position, item in enumerate(data, start=1):
+        if not isinstance(item, dict) or "dev_eui" not in item or "decoder" not in item:
+            errors.append(f"élément {position}: objet {{\"dev_eui\": ..., \"decoder\": ...}} attendu")
+            continue
+        entries.append((f"élément {position}", item["dev_eui"], item["decoder"]))
+    return entries, errors
+
+
+def validate(entries, decoders):
+    """
+    Normalise et valide les entrées. Retourne ([(dev_eui, decoder), ...], erreurs).
+
+    Les DevEUI sont passés en majuscules ; un DevEUI répété avec deux décodeurs différents est une erreur.
+    """
+    devices, errors = {}, []
+    for where, dev_eui, decoder in entries:
+        dev_eui = dev_eui.strip().upper() if isinstance(dev_eui, str) else dev_eui
+        decoder = decoder.strip() if isinstance(decoder, str) else decoder
+        if not isinstance(dev_eui, str) or not DEV_EUI_RE.fullmatch(dev_eui):
+            errors.append(f"{where}: DevEUI invalide {dev_eui!r} (16 caractères hexadécimaux)")
+            continue
+        if decoder not in decoders:
+            errors.append(f"{where}: décodeur inconnu {decoder!r} pour {dev_eui}")
+            continue
+        if devices.get(dev_eui, decoder) != decoder:
+            errors.append(f"{where}: {dev_eui} déjà associé à '{devices[dev_eui]}' dans le lot")
+            continue
+        devices[dev_eui] = decoder
+    return list(devices.items()), errors
+
+
+def provision(store, text, fmt=None, replace=False, dry_run=False):
+    """
+    Valide puis applique un lot en une transaction.
+
+    Retourne (nombre de devices modifiés, devices du lot, erreurs) ; rien n'est écrit s'il y a des erreurs.
+    """
+    fmt = fmt or detect_format(text)
+    if fmt not in FORMATS:
+        raise ValueError(f"Format inconnu: {fmt}")
+    entries, errors = parse_json(text) if fmt == "json" else parse_csv(text)
+    devices, invalid = validate(entries, set(decoder_registry.available_decoders()))
+    errors += invalid
+    if not devices and not errors:
+        errors.append("aucun device dans le lot")
+    if errors or dry_run:
+        return 0, devices, errors
+    return store.upsert_many(devices, replace=replace), devices, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Provisionnement en masse des devices (CSV ou JSON)")
+    parser.add_argument("path", help="fichier CSV/JSON, - pour l'entrée standard")
+    parser.add_argument("--format", choices=FORMATS, help="format (par défaut détecté)")
+    parser.add_argument("--db", default=device_store.DEVICES_DB)
+    parser.add_argument("--replace", action="store_true", help="supprime les devices absents du lot")
+    parser.add_argument("--dry-run", action="store_true", help="valider sans écrire")
+    args = parser.parse_args()
+
+    if args.path == "-":
+        text = sys.stdin.read()
+    else:
+        with open(args.path, "r", encoding="utf-8-sig") as f:
+            text = f.read()
+    store = device_store.DeviceStore(args.db)
+    changed, devices, errors = provision(store, text, args.format, args.replace, args.dry_run)
+    if errors:
+        for error in errors:
+            print(f"❌ {error}", file=sys.stderr)
+        print(f"Lot refusé ({len(errors)} erreur(s)), aucun device modifié", file=sys.stderr)
+        return 1
+    if args.dry_run:
+        print(f"✅ {len(devices)} device(s) valides (rien n'a été écrit)")
+    else:
+        print(f"✅ {len(devices)} device(s) dans le lot, {changed} modification(s), version {store.version()}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+# Réinjection hors ligne d'uplinks TTN enregistrés dans InfluxDB (reconstruction de buckets
+# après correction d'un décodeur ou changement de schéma)
+#
+# Même chaîne que le listener (table des devices -> décodeur -> points horodatés par received_at),
+# sans passer par MQTT : les fichiers NDJSON (éventuellement gzip, un uplink TTN par ligne) sont
+# lus en flux, le décodage est réparti sur plusieurs processus par paquets de messages et les
+# points sont écrits de façon synchrone par gros lots, un bucket par type de capteur.
+#
+# Usage :
+#   python3 replay_uplinks.py uplinks-2024-05-*.ndjson.gz [--devices devices.json|devices.db] [--workers 4]
+#   python3 replay_uplinks.py /opt/iot-infra/archive --dry-run      décode sans écrire (débit seul)
+import os
+import sys
+import gzip
+import time
+import shutil
+import tempfile
+import logging
+import argparse
+import threading
+from dotenv import load_dotenv
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+REPLAY_WORKERS       = int(os.getenv("REPLAY_WORKERS", str(os.cpu_count() or 1)))
+REPLAY_CHUNK_SIZE    = int(os.getenv("REPLAY_CHUNK_SIZE", "2000"))     # messages par tâche de décodage
+REPLAY_BATCH_POINTS  = int(os.getenv("REPLAY_BATCH_POINTS", "20000"))  # points par requête d'écriture
+REPLAY_WRITE_THREADS = int(os.getenv("REPLAY_WRITE_THREADS", "4"))
+REPLAY_WRITE_RETRIES = int(os.getenv("REPLAY_WRITE_RETRIES", "3"))
+
+EXTENSIONS = (".ndjson", ".ndjson.gz", ".jsonl", ".jsonl.gz", ".json.gz")
+
+decoding = None   # uplink_decoding.UplinkDecoder, créé après configuration de DECODERS_DIR / DEVICES_DB
+precision = "ns"
+
+
+def iter_files(paths):
+    """Fichiers à rejouer : ceux donnés, et ceux des répertoires donnés (triés par nom)."""
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _dirs, names in sorted(os.walk(path)):
+                for name in sorted(names):
+                    if name.endswith(EXTENSIONS):
+                        yield os.path.join(root, name)
+        else:
+            yield path
+
+
+def iter_lines(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield line
+
+
+def iter_chunks(paths, size):
+    chunk = []
+    for path in iter_files(paths):
+        logging.info(f"Lecture de {path}")
+        for line in iter_lines(path):
+            chunk.append(line)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+def load_decoding(influx_precision):
+    """
+    Charge la table des devices et prépare le décodage (mêmes modules que le listener, sans son état).
+
+    Un uplink rejoué sans horodatage TTN est rejeté : l'heure locale du rejeu n'a aucun sens.
+    """
+    global decoding, precision
+    import device_table
+    import uplink_decoding
+    device_table.reload()
+    decoding = uplink_decoding.UplinkDecoder(require_time=True)
+    precision = influx_precision
+    return device_table
+
+
+def init_worker(influx_precision, verbose):
+    """Initialisation d'un processus de décodage : seules les erreurs sont journalisées par défaut."""
+    import listener_log
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    listener_log.apply({} if verbose else {"mode": "quiet", "level": "ERROR"})
+    load_decoding(influx_precision)
+
+
+def decode_chunk(lines):
+    """
+    Décode un paquet d'uplinks bruts.
+
+    Retourne ({bucket: [lignes encodées d'un uplink, ...]}, {bucket: nombre de points}, messages ignorés,
+    messages rejetés faute d'horodatage).
+    """
+    import uplink_decoding
+    bodies = {}
+    counts = {}
+    skipped = 0
+    untimed = decoding.untimed
+    for result in decoding.decode_messages([("replay", line) for line in lines]):
+        if result is None:
+            skipped += 1
+            continue
+        dev_eui, points, sensor_type = result
+        # Lignes encodées en bytes : renvoyées telles quelles au processus principal
+        record = uplink_decoding.encode_record(dev_eui, points, "line", precision)
+        if record is None:
+            skipped += 1
+            continue
+        bodies.setdefault(sensor_type, []).append(record)
+        counts[sensor_type] = counts.get(sensor_type, 0) + len(points)
+    untimed = decoding.untimed - untimed
+    return bodies, counts, skipped - untimed, untimed
+
+
+class BatchWriter:
+    """Regroupe les lignes par bucket et envoie des lots de batch_points points via des threads d'écriture."""
+
+    def __init__(self, precision, batch_points, threads, dry_run=False):
+        import influx_writer
+        self.influx_writer = influx_writer
+        self.precision = precision
+        self.batch_points = batch_points
+        self.dry_run = dry_run
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="replay-write")
+        self.slots = threading.BoundedSemaphore(threads * 2)
+        self.buffers = {}
+        self.sizes = {}
+        self.lock = threading.Lock()
+        self.written = 0
+        self.failed = 0
+
+    def add(self, bucket, records, points):
+        self.buffers.setdefault(bucket, []).extend(records)
+        self.sizes[bucket] = self.sizes.get(bucket, 0) + points
+        if self.sizes[bucket] >= self.batch_points:
+            self.flush(bucket)
+
+    def flush(self, bucket):
+        records = self.buffers.pop(bucket, None)
+        points = self.sizes.pop(bucket, 0)
+        if not records:
+            return
+        if self.dry_run:
+            self.written += points
+            return
+        # Contre-pression : le décodage attend si trop de lots sont déjà en cours d'écriture
+        self.slots.acquire()
+        self.pool.submit(self._write, bucket, b"\n".join(records), points)
+
+    def _write(self, bucket, body, points):
+        try:
+            for attempt in range(1, REPLAY_WRITE_RETRIES + 1):
+                try:
+                    self.influx_writer.write_now(bucket, body, self.precision)
+                    with self.lock:
+                        self.written += points
+                    return
+                except Exception as e:
+                    logging.warning(f"Écriture de {points} point(s) dans '{bucket}' en échec "
+                                    f"(essai {attempt}/{REPLAY_WRITE_RETRIES}): {e}")
+                    if attempt < REPLAY_WRITE_RETRIES:
+                        time.sleep(2 ** attempt)
+            with self.lock:
+                self.failed += points
+            logging.error(f"❌ {points} point(s) non écrits dans '{bucket}'")
+        finally:
+            self.slots.release()
+
+    def close(self):
+        for bucket in list(self.buffers):
+            self.flush(bucket)
+        self.pool.shutdown(wait=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Réinjection d'uplinks TTN enregistrés dans InfluxDB")
+    parser.add_argument("paths", nargs="+", help="fichiers NDJSON (.gz accepté) ou répertoires")
+    parser.add_argument("--devices", help="store (.db) ou table au format devices.json (par défaut DEVICES_DB du listener)")
+    parser.add_argument("--decoders-dir", help="package des décodeurs non installé (par défaut, décodeurs installés)")
+    parser.add_argument("--workers", type=int, default=REPLAY_WORKERS, help="processus de décodage")
+    parser.add_argument("--chunk-size", type=int, default=REPLAY_CHUNK_SIZE, help="messages par tâche")
+    parser.add_argument("--batch-points", type=int, default=REPLAY_BATCH_POINTS, help="points par écriture")
+    parser.add_argument("--write-threads", type=int, default=REPLAY_WRITE_THREADS)
+    parser.add_argument("--progress", type=float, default=10, help="intervalle du suivi (s)")
+    parser.add_argument("--dry-run", action="store_true", help="décoder sans écrire dans InfluxDB")
+    parser.add_argument("--verbose", action="store_true", help="journaux du décodage pour chaque message")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    # Lus à l'import par device_store / decoder_registry, y compris dans les processus de décodage
+    tmp_dir = None
+    if args.devices:
+        path = os.path.abspath(args.devices)
+        if path.endswith(".json"):
+            # Table au format devices.json : importée à la création d'un store temporaire
+            tmp_dir = tempfile.mkdtemp(prefix="replay-devices-")
+            os.environ["DEVICES_DB"] = os.path.join(tmp_dir, "devices.db")
+            os.environ["DEVICES_FILE"] = path
+        else:
+            os.environ["DEVICES_DB"] = path
+    if args.decoders_dir:
+        os.environ["DECODERS_DIR"] = os.path.abspath(args.decoders_dir)
+    try:
+        return replay(args)
+    finally:
+        if tmp_dir:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def replay(args):
+    # Même configuration que le listener (précision des horodatages, connexion InfluxDB)
+    load_dotenv("/opt/iot-infra/.env")
+    influx_precision = os.getenv("INFLUX_PRECISION", "ns")
+    device_table = load_decoding(influx_precision)
+    if not device_table.current().decoders:
+        logging.error(f"Aucun device utilisable dans {device_table.DEVICES_DB}")
+        return 1
+
+    writer = BatchWriter(influx_precision, args.batch_points, args.write_threads, args.dry_run)
+    messages = skipped = untimed = 0
+    start = last_report = time.time()
+
+    def report(final=False):
+        elapsed = max(time.time() - start, 1e-9)
+        logging.info(f"{'Terminé' if final else 'En cours'}: {messages} message(s) en {elapsed:.1f}s "
+                     f"({messages / elapsed:.0f} msg/s), ignorés {skipped}, sans horodatage {untimed}, "
+                     f"points écrits {writer.written}, en échec {writer.failed}")
+
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker,
+                             initargs=(influx_precision, args.verbose)) as pool:
+        pending = {}
+        chunks = iter_chunks(args.paths, args.chunk_size)
+        while True:
+            # Fenêtre glissante : les fichiers sont lus au rythme du décodage, jamais chargés en entier
+            while len(pending) < args.workers * 2:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                pending[pool.submit(decode_chunk, chunk)] = len(chunk)
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                messages += pending.pop(future)
+                bodies, counts, chunk_skipped, chunk_untimed = future.result()
+                skipped += chunk_skipped
+                untimed += chunk_untimed
+                for bucket, records in bodies.items():
+                    writer.add(bucket, records, counts[bucket])
+            if time.time() - last_report >= args.progress:
+                last_report = time.time()
+                report()
+
+    writer.close()
+    report(final=True)
+    return 1 if writer.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# Spool disque (write-ahead) des lots InfluxDB non écrits, rejoués dans l'ordre au retour d'InfluxDB
+import os
+import json
+import time
+import threading
+import logging
+
+SPOOL_DIR            = os.getenv("SPOOL_DIR", "/opt/iot-infra/spool/influx")
+SPOOL_SEGMENT_SIZE   = int(os.getenv("SPOOL_SEGMENT_SIZE", str(16 * 1024 * 1024)))   # octets
+SPOOL_MAX_BYTES      = int(os.getenv("SPOOL_MAX_BYTES", str(1024 * 1024 * 1024)))    # octets
+SPOOL_FSYNC_EVERY    = int(os.getenv("SPOOL_FSYNC_EVERY", "50"))          # lots
+SPOOL_FSYNC_INTERVAL = float(os.getenv("SPOOL_FSYNC_INTERVAL", "1"))      # secondes
+SPOOL_REPLAY_INTERVAL = float(os.getenv("SPOOL_REPLAY_INTERVAL", "10"))   # secondes
+SPOOL_REPLAY_RATE    = float(os.getenv("SPOOL_REPLAY_RATE", "20"))        # lots par seconde
+
+DEAD_LETTER_FILE = "dead-letter.ndjson"
+
+
+class PermanentWriteError(Exception):
+    """Lot refusé définitivement (ligne invalide, lot trop gros...) : le réessayer ne sert à rien."""
+
+
+class Spool:
+    """
+    Segments append-only `seg-<n>.ndjson`, un lot par ligne : {"b": bucket, "p": précision, "d": line protocol}.
+
+    Les écritures sont fsyncées par groupes (SPOOL_FSYNC_EVERY lots ou SPOOL_FSYNC_INTERVAL
+    secondes). Le segment actif est fermé au-delà de SPOOL_SEGMENT_SIZE ; au-delà de
+    SPOOL_MAX_BYTES les plus anciens segments sont supprimés. La position de rejeu d'un
+    segment est conservée dans `seg-<n>.pos`, le rejeu reprend donc après un redémarrage.
+
+    Les lots refusés définitivement au rejeu (PermanentWriteError) sont déplacés, au même format,
+    dans `dead-letter.ndjson` pour ne pas bloquer les suivants.
+    """
+
+    def __init__(self, directory=SPOOL_DIR, segment_size=SPOOL_SEGMENT_SIZE, max_bytes=SPOOL_MAX_BYTES):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._file = None
+        self._active = None
+        self._replaying = None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        os.makedirs(directory, exist_ok=True)
+        segments = self.segments()
+        self._seq = int(segments[-1][4:-7]) + 1 if segments else 0
+        if segments:
+            logging.info(f"Spool: {len(segments)} segment(s) en attente de rejeu dans {directory}")
+
+    def segments(self):
+        return sorted(f for f in os.listdir(self.directory) if f.startswith("seg-") and f.endswith(".ndjson"))
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _open_segment(self):
+        name = f"seg-{self._seq:010d}.ndjson"
+        self._seq += 1
+        self._file = open(self._path(name), "a")
+        self._active = name
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def append(self, bucket, precision, data):
+        """Ajoute un lot au segment actif (fsync groupé)."""
+        if isinstance(data, bytes):
+            data = data.decode("utf-8")
+        record = json.dumps({"b": bucket, "p": str(precision), "d": data}, ensure_ascii=False)
+        with self._lock:
+            if self._file is None:
+                self._open_segment()
+            self._file.write(record + "\n")
+            self._unsynced += 1
+            if self._unsynced >= SPOOL_FSYNC_EVERY or time.monotonic() - self._last_sync >= SPOOL_FSYNC_INTERVAL:
+                self._sync()
+            if self._file.tell() >= self.segment_size:
+                self._close_active()
+                self._enforce_cap()
+
+    def _close_active(self):
+        if self._file is not None:
+            self._sync()
+            self._file.close()
+            self._file = None
+            self._active = None
+
+    def _enforce_cap(self):
+        segments = self.segments()
+        total = sum(os.path.getsize(self._path(s)) for s in segments)
+        # Ni le dernier segment, ni celui en cours de rejeu (le rejeu réécrirait sa position)
+        for oldest in segments[:-1]:
+            if total <= self.max_bytes:
+                break
+            if oldest == self._replaying:
+                continue
+            total -= os.path.getsize(self._path(oldest))
+            self._remove(oldest)
+            logging.error(f"Spool plein ({self.max_bytes} octets): segment {oldest} supprimé, données perdues")
+
+    def _remove(self, name):
+        for path in (self._path(name), self._path(name[:-7] + ".pos")):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def rotate(self):
+        """Ferme le segment actif pour qu'il puisse être rejoué."""
+        with self._lock:
+            self._close_active()
+
+    def close(self):
+        self.rotate()
+
+    def pending(self):
+        return bool(self.segments())
+
+    def dead_letter(self, line, reason):
+        """Conserve un lot refusé définitivement dans le fichier dead-letter (fsync immédiat)."""
+        with open(self._path(DEAD_LETTER_FILE), "a") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        logging.error(f"Spool: lot refusé définitivement, déplacé dans {DEAD_LETTER_FILE}: {reason}")
+
+    def replay_once(self, write_fn, rate=SPOOL_REPLAY_RATE):
+        """
+        Rejoue les segments fermés dans l'ordre avec write_fn(bucket, precision, data).
+
+        Un lot pour lequel write_fn lève PermanentWriteError est mis de côté (dead_letter()) et le
+        rejeu continue ; toute autre exception est considérée comme transitoire (InfluxDB toujours
+        indisponible) : le rejeu s'arrête en conservant la position. Retourne le nombre de lots rejoués.
+        """
+        self.rotate()
+        replayed = 0
+        delay = 1 / rate if rate > 0 else 0
+        for name in self.segments():
+            with self._lock:
+                if name == self._active:
+                    # Segment rouvert par une écriture concurrente : il sera rejoué au prochain passage
+                    break
+                if not os.path.exists(self._path(name)):
+                    # Supprimé par le plafond SPOOL_MAX_BYTES depuis le listage
+                    continue
+                # Protégé du plafond SPOOL_MAX_BYTES jusqu'à la fin de son rejeu
+                self._replaying = name
+            try:
+                count, error = self._replay_segment(name, write_fn, delay)
+            finally:
+                with self._lock:
+                    self._replaying = None
+            replayed += count
+            if error is not None:
+                logging.warning(f"Spool: rejeu interrompu ({replayed} lot(s) rejoué(s)): {error}")
+                return replayed
+        if replayed:
+            logging.info(f"Spool: {replayed} lot(s) rejoué(s) dans InfluxDB")
+        return replayed
+
+    def _replay_segment(self, name, write_fn, delay):
+        """Rejoue un segment depuis sa position ; retourne (lots rejoués, erreur transitoire ou None)."""
+        replayed = 0
+        pos_path = self._path(name[:-7] + ".pos")
+        position = 0
+        if os.path.exists(pos_path):
+            with open(pos_path) as f:
+                position = int(f.read().strip() or 0)
+        with open(self._path(name), "r") as f:
+            f.seek(position)
+            while True:
+                line = f.readline()
+                if not line:
+                    break
+                if not line.endswith("\n"):
+                    # Ligne tronquée (arrêt brutal pendant l'écriture) : ignorée
+                    logging.warning(f"Spool: enregistrement incomplet ignoré dans {name}")
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError as e:
+                    logging.error(f"Spool: enregistrement illisible ignoré dans {name}: {e}")
+                else:
+                    try:
+                        write_fn(record["b"], record["p"], record["d"])
+                    except PermanentWriteError as e:
+                        self.dead_letter(line, e)
+                    except Exception as e:
+                        return replayed, e
+                    else:
+                        replayed += 1
+                with open(pos_path, "w") as pos_file:
+                    pos_file.write(str(f.tell()))
+                if delay:
+                    time.sleep(delay)
+        self._remove(name)
+        return replayed, None
+
+    def start_replayer(self, write_fn, interval=SPOOL_REPLAY_INTERVAL):
+        """Thread de rejeu périodique tant que des segments sont en attente."""
+        def loop():
+            while True:
+                time.sleep(interval)
+                if self.pending() or self._file is not None:
+                    try:
+                        self.replay_once(write_fn)
+                    except Exception as e:
+                        logging.error(f"Spool: erreur pendant le rejeu: {e}")
+
+        thread = threading.Thread(target=loop, name="spool-replay", daemon=True)
+        thread.start()
+        return thread
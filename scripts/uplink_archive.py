@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+# Archive des uplinks bruts reçus par le listener (rejeu après correction d'un décodeur, audit)
+#
+# Fichiers : <ARCHIVE_DIR>/uplinks-<AAAAMMJJTHH>.ndjson.gz, un par heure (ou par jour) de réception.
+# Chaque fichier est une suite de blocs gzip indépendants (un bloc par écriture groupée) : il se lit
+# tel quel avec gzip (et donc avec replay_uplinks.py), et l'index voisin <fichier>.idx (NDJSON,
+# une ligne par bloc : position, taille, intervalle de temps, DevEUI présents) permet de n'extraire
+# que les blocs d'un device sans tout décompresser.
+#
+# Formats (ARCHIVE_FORMAT) :
+#   raw     : message TTN complet, tel que reçu
+#   compact : enveloppe TTN réduite à dev_eui, received_at, f_port et frm_payload (toujours rejouable)
+#
+# append() ne fait que mettre le message en file (sans attente : file pleine -> message non archivé) ;
+# la compression et l'écriture se font sur un thread dédié. Au-delà de ARCHIVE_MAX_BYTES, les
+# partitions les plus anciennes sont supprimées.
+#
+# Extraction : python3 uplink_archive.py <DevEUI> [--since 2024-05-01T00:00:00Z] [--until ...] > device.ndjson
+import os
+import sys
+import gzip
+import json
+import time
+import glob
+import queue
+import logging
+import argparse
+import threading
+import uplink_parser
+
+ARCHIVE_ENABLED        = os.getenv("ARCHIVE_ENABLED", "0") == "1"
+ARCHIVE_DIR            = os.getenv("ARCHIVE_DIR", "/opt/iot-infra/archive")
+ARCHIVE_FORMAT         = os.getenv("ARCHIVE_FORMAT", "raw")
+ARCHIVE_PARTITION      = os.getenv("ARCHIVE_PARTITION", "hour")                       # hour ou day
+ARCHIVE_MAX_BYTES      = int(os.getenv("ARCHIVE_MAX_BYTES", str(10 * 1024 ** 3)))     # budget disque total
+ARCHIVE_QUEUE_SIZE     = int(os.getenv("ARCHIVE_QUEUE_SIZE", "20000"))
+ARCHIVE_BLOCK_RECORDS  = int(os.getenv("ARCHIVE_BLOCK_RECORDS", "2000"))              # messages par bloc gzip
+ARCHIVE_FLUSH_INTERVAL = float(os.getenv("ARCHIVE_FLUSH_INTERVAL", "10"))             # secondes
+ARCHIVE_COMPRESSLEVEL  = int(os.getenv("ARCHIVE_COMPRESSLEVEL", "6"))
+
+FORMATS = ("raw", "compact")
+PARTITIONS = {"hour": "%Y%m%dT%H", "day": "%Y%m%d"}
+PREFIX = "uplinks-"
+SUFFIX = ".ndjson.gz"
+INDEX_SUFFIX = ".idx"
+
+_STOP = object()
+
+
+def partition_path(directory, partition, timestamp):
+    return os.path.join(directory, f"{PREFIX}{time.strftime(PARTITIONS[partition], time.gmtime(timestamp))}{SUFFIX}")
+
+
+def compact_record(uplink):
+    """Enveloppe TTN minimale : relue par uplink_parser comme un message complet."""
+    return json.dumps({
+        "end_device_ids": {"dev_eui": uplink.dev_eui},
+        "uplink_message": {"f_port": uplink.f_port, "frm_payload": uplink.frm_payload,
+                           "received_at": uplink.received_at},
+    }, separators=(",", ":")).encode()
+
+
+class UplinkArchive:
+    def __init__(self, directory=ARCHIVE_DIR, fmt=ARCHIVE_FORMAT, partition=ARCHIVE_PARTITION,
+                 max_bytes=ARCHIVE_MAX_BYTES, queue_size=ARCHIVE_QUEUE_SIZE,
+                 block_records=ARCHIVE_BLOCK_RECORDS, flush_interval=ARCHIVE_FLUSH_INTERVAL):
+        if fmt not in FORMATS:
+            raise ValueError(f"Format d'archive inconnu: {fmt}")
+        if partition not in PARTITIONS:
+            raise ValueError(f"Partition d'archive inconnue: {partition}")
+        self.directory = directory
+        self.format = fmt
+        self.partition = partition
+        self.max_bytes = max_bytes
+        self.block_records = block_records
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self.archived = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._block = []      # lignes du bloc en cours
+        self._devices = {}    # dev_eui -> [premier, dernier horodatage ns] dans le bloc
+        self._block_path = None
+        self._block_start = 0.0
+        os.makedirs(directory, exist_ok=True)
+
+    def append(self, raw_payload):
+        """Appelé sur le chemin d'ingestion : ne bloque jamais."""
+        try:
+            self._queue.put_nowait((time.time(), raw_payload))
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                logging.warning(f"File d'archivage pleine, {self.dropped} message(s) non archivé(s)")
+
+    def qsize(self):
+        return self._queue.qsize()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="uplink-archive", daemon=True)
+        self._thread.start()
+        logging.info(f"Archivage des uplinks ({self.format}) dans {self.directory}, "
+                     f"budget {self.max_bytes / 1024 ** 2:.0f} Mo")
+
+    def close(self):
+        """Écrit les messages en file puis arrête le thread d'archivage."""
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+        logging.info(f"Archive fermée: {self.archived} message(s) archivé(s), {self.dropped} non archivé(s)")
+
+    def _run(self):
+        while True:
+            timeout = None
+            if self._block:
+                timeout = max(0.0, self._block_start + self.flush_interval - time.time())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                self._flush()
+                continue
+            if item is _STOP:
+                self._flush()
+                return
+            try:
+                self._add(*item)
+            except Exception as e:
+                logging.error(f"Erreur d'archivage: {e}")
+
+    def _add(self, arrival, raw_payload):
+        path = partition_path(self.directory, self.partition, arrival)
+        if path != self._block_path:
+            self._flush()
+            self._block_path = path
+        if not self._block:
+            self._block_start = arrival
+        try:
+            uplink = uplink_parser.parse_uplink(raw_payload)
+        except Exception:
+            # Message illisible : archivé brut, sans entrée d'index par device
+            uplink = None
+        dev_eui = uplink.dev_eui if uplink else ""
+        timestamp_ns = (uplink_parser.parse_time_ns(uplink.received_at) if uplink else None) or int(arrival * 1e9)
+        if self.format == "compact" and uplink is not None:
+            line = compact_record(uplink)
+        else:
+            # Une chaîne JSON ne contient pas de saut de ligne brut : seuls les blancs sont remplacés
+            line = raw_payload.strip().replace(b"\r", b" ").replace(b"\n", b" ")
+        self._block.append(line)
+        span = self._devices.get(dev_eui)
+        if span is None:
+            self._devices[dev_eui] = [timestamp_ns, timestamp_ns]
+        else:
+            span[0] = min(span[0], timestamp_ns)
+            span[1] = max(span[1], timestamp_ns)
+        if len(self._block) >= self.block_records:
+            self._flush()
+
+    def _flush(self):
+        if not self._block:
+            return
+        data = gzip.compress(b"\n".join(self._block) + b"\n", compresslevel=ARCHIVE_COMPRESSLEVEL)
+        path = self._block_path
+        with open(path, "ab") as f:
+            offset = f.tell()
+            f.write(data)
+        spans = self._devices.values()
+        entry = {
+            "offset": offset, "length": len(data), "records": len(self._block),
+            "t0": min(s[0] for s in spans), "t1": max(s[1] for s in spans),
+            "devices": self._devices,
+        }
+        with open(path + INDEX_SUFFIX, "a") as f:
+            f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+        self.archived += len(self._block)
+        self._block = []
+        self._devices = {}
+        self._enforce_budget()
+
+    def _enforce_budget(self):
+        """Supprime les partitions les plus anciennes tant que l'archive dépasse son budget."""
+        partitions = sorted(glob.glob(os.path.join(self.directory, f"{PREFIX}*{SUFFIX}")))
+        sizes = {}
+        for path in partitions:
+            size = 0
+            for name in (path, path + INDEX_SUFFIX):
+                try:
+                    size += os.path.getsize(name)
+                except OSError:
+                    pass
+            sizes[path] = size
+        total = sum(sizes.values())
+        # La partition courante (la plus récente) est toujours conservée
+        for path in partitions[:-1]:
+            if total <= self.max_bytes:
+                break
+            for name in (path, path + INDEX_SUFFIX):
+                try:
+                    os.remove(name)
+                except OSError:
+                    pass
+            total -= sizes[path]
+            logging.warning(f"Budget de l'archive dépassé, partition supprimée: {os.path.basename(path)}")
+
+
+def iter_device(directory, dev_eui, since_ns=None, until_ns=None):
+    """
+    Messages archivés d'un device (bytes, un uplink par élément), dans l'ordre des fichiers.
+
+    Seuls les blocs dont l'index mentionne le device dans l'intervalle demandé sont décompressés.
+    """
+    for path in sorted(glob.glob(os.path.join(directory, f"{PREFIX}*{SUFFIX}"))):
+        try:
+            with open(path + INDEX_SUFFIX, "r") as f:
+                blocks = [json.loads(line) for line in f if line.strip()]
+        except FileNotFoundError:
+            logging.warning(f"Index absent pour {path}, partition ignorée")
+            continue
+        with open(path, "rb") as data:
+            for block in blocks:
+                span = block["devices"].get(dev_eui)
+                if span is None:
+                    continue
+                if (since_ns is not None and span[1] < since_ns) or (until_ns is not None and span[0] > until_ns):
+                    continue
+                data.seek(block["offset"])
+                for line in gzip.decompress(data.read(block["length"])).splitlines():
+                    if not line:
+                        continue
+                    try:
+                        uplink = uplink_parser.parse_uplink(line)
+                    except Exception:
+                        continue
+                    if uplink.dev_eui != dev_eui:
+                        continue
+                    timestamp_ns = uplink_parser.parse_time_ns(uplink.received_at)
+                    if timestamp_ns is not None and (
+                            (since_ns is not None and timestamp_ns < since_ns)
+                            or (until_ns is not None and timestamp_ns > until_ns)):
+                        continue
+                    yield line
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extraction des uplinks archivés d'un device (NDJSON sur stdout)")
+    parser.add_argument("dev_eui")
+    parser.add_argument("--dir", default=ARCHIVE_DIR)
+    parser.add_argument("--since", help="horodatage RFC 3339, ex. 2024-05-01T00:00:00Z")
+    parser.add_argument("--until", help="horodatage RFC 3339")
+    args = parser.parse_args()
+
+    since_ns = uplink_parser.parse_time_ns(args.since) if args.since else None
+    until_ns = uplink_parser.parse_time_ns(args.until) if args.until else None
+    if (args.since and since_ns is None) or (args.until and until_ns is None):
+        parser.error("horodatage illisible (format attendu : 2024-05-01T00:00:00Z)")
+    count = 0
+    out = sys.stdout.buffer
+    for line in iter_device(args.dir, args.dev_eui, since_ns, until_ns):
+        out.write(line + b"\n")
+        count += 1
+    print(f"{count} message(s) extraits pour {args.dev_eui}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# Chaîne de décodage commune au listener (threads et asyncio) et au rejeu hors ligne :
+# uplink TTN brut -> device -> décodeur -> points horodatés -> enregistrement InfluxDB
+#
+# Sans effet de bord à l'import (ni .env, ni table des devices, ni état publié) : la table est celle
+# de device_table (chargée par l'appelant), le suivi des devices et l'encodage sont des paramètres.
+import time
+import logging
+from influxdb_client import Point
+import device_table
+import listener_log
+import uplink_parser
+import decoder_registry
+import line_protocol
+import metrics
+
+ENCODERS = ("line", "point")
+PRECISION_DIVISORS = {"ns": 1, "us": 1_000, "ms": 1_000_000, "s": 1_000_000_000}
+
+
+class UplinkDecoder:
+    """
+    Décodage des uplinks bruts avec la table courante de device_table.
+
+    on_decoded(dev_eui, decoder_name, points, rssi) : appelé pour chaque uplink décodé (résumé publié
+    par le listener, cf. device_state), None pour ne rien suivre.
+    require_time : un uplink sans horodatage TTN lisible est rejeté (compté dans untimed) au lieu
+    d'être daté à l'heure locale, qui n'a pas de sens pour un rejeu.
+    """
+
+    def __init__(self, on_decoded=None, require_time=False):
+        self.on_decoded = on_decoded
+        self.require_time = require_time
+        self.untimed = 0
+
+    # Préparation d'un message MQTT brut : parsing, recherche du device et de son décodeur
+    # Retourne (uplink, décodeur, détail) ou None si le message est ignoré
+    def prepare_message(self, topic, raw_payload):
+        try:
+            # Seuls dev_eui, frm_payload et f_port sont extraits (voir uplink_parser)
+            uplink = uplink_parser.parse_uplink(raw_payload)
+            dev_eui = uplink.dev_eui
+            frm_payload = uplink.frm_payload
+
+            # Lignes détaillées échantillonnées par device (formatage différé par logging)
+            detail = listener_log.detail_enabled(dev_eui)
+            if detail:
+                logging.info("Message MQTT reçu sur le topic '%s':\n%s", topic, raw_payload.decode())
+
+            # Filtrage par f_port (ici on traite uniquement les messages sur le port 1)
+            #fport = uplink.f_port or 0
+            #if fport != 1:
+            #    logging.info(f"Ignoré message sur le port {fport} pour {dev_eui}")
+            #    return
+
+            # Un seul accès à la table courante : un rechargement concurrent ne la modifie pas
+            table = device_table.current()
+            if dev_eui not in table.devices:
+                metrics.UNKNOWN_DEVEUI.inc()
+                logging.warning(f"DevEUI inconnu : {dev_eui}")
+                return
+
+            # Décodeur déjà résolu au chargement de la table par le registre
+            decoder = table.decoders.get(dev_eui)
+            if decoder is None:
+                logging.error(f"Aucun décodeur valide pour {dev_eui} ('{table.devices[dev_eui]}')")
+                return
+
+            if not frm_payload:
+                logging.warning(f"frm_payload vide ou manquant pour {dev_eui}")
+                return
+
+            if detail:
+                logging.info("frm_payload reçu pour %s: %s", dev_eui, frm_payload)
+
+            return uplink, decoder, detail
+
+        except Exception as e:
+            logging.error(f"Erreur dans prepare_message: {e}")
+
+    # Contrôle et journalisation du résultat d'un décodeur
+    # Retourne (dev_eui, [(timestamp_ns, {nom: float}), ...], type de capteur) ou None si rien n'est à écrire
+    def finish_message(self, uplink, decoder, decoded, detail):
+        if not decoded:
+            logging.warning(f"Aucun champ décodé pour {uplink.dev_eui}")
+            return
+
+        if detail:
+            logging.info("Données décodées pour %s → %s", uplink.dev_eui, decoded)
+        listener_log.summary(uplink.dev_eui, decoder.name, uplink.f_port, decoded)
+        metrics.MESSAGES_DECODED.labels(decoder.name).inc()
+
+        # Horodatage TTN (received_at ou passerelle) : un message rejoué ou retardé garde son heure
+        timestamp_ns = uplink_parser.parse_time_ns(uplink.received_at)
+        if timestamp_ns is None:
+            if self.require_time:
+                self.untimed += 1
+                logging.warning(f"Horodatage TTN absent ou illisible pour {uplink.dev_eui} "
+                                f"({uplink.received_at!r}), message rejeté")
+                return
+            logging.debug("Horodatage TTN absent ou illisible pour %s (%r), heure locale utilisée",
+                          uplink.dev_eui, uplink.received_at)
+            timestamp_ns = time.time_ns()
+
+        # Validation contre le schéma FIELDS du décodeur : un message sans valeur numérique n'est pas écrit
+        points = decoder.points(decoded, timestamp_ns)
+        if not points:
+            logging.warning(f"Aucun champ numérique à écrire pour {uplink.dev_eui} ({decoder.name})")
+            return
+
+        if self.on_decoded is not None:
+            self.on_decoded(uplink.dev_eui, decoder.name, points, uplink.rssi)
+
+        return uplink.dev_eui, points, decoder.name
+
+    def run_decoder(self, uplink, decoder):
+        # Ici, on ne fait **pas** de décodage Base64 : on passe la chaîne directement au décodeur
+        try:
+            return decoder.decode(uplink.frm_payload)
+        except Exception as e:
+            metrics.DECODER_FAILURES.labels(decoder.name).inc()
+            logging.error(f"Erreur lors de l'exécution du décodeur '{decoder.name}' pour {uplink.dev_eui}: {e}")
+
+    # Décodage d'un message MQTT brut
+    def decode_message(self, topic, raw_payload):
+        prepared = self.prepare_message(topic, raw_payload)
+        if prepared is None:
+            return
+        uplink, decoder, detail = prepared
+        decoded = self.run_decoder(uplink, decoder)
+        if decoded is None:
+            return
+        return self.finish_message(uplink, decoder, decoded, detail)
+
+    # Décodage d'un lot de messages bruts [(topic, payload), ...] -> liste de résultats (ou None)
+    # Les messages d'un même décodeur sont décodés ensemble par decode_many()
+    def decode_messages(self, items):
+        prepared = [self.prepare_message(topic, raw_payload) for topic, raw_payload in items]
+        groups = {}
+        for i, entry in enumerate(prepared):
+            if entry is not None:
+                groups.setdefault(entry[1].name, []).append(i)
+        results = [None] * len(items)
+        for indices in groups.values():
+            decoder = prepared[indices[0]][1]
+            if len(indices) == 1:
+                decoded_rows = [self.run_decoder(prepared[indices[0]][0], decoder)]
+            else:
+                decoded_rows = decoder_registry.decode_rows(decoder, [prepared[i][0].frm_payload for i in indices])
+            for i, decoded in zip(indices, decoded_rows):
+                uplink, decoder, detail = prepared[i]
+                if decoded is None and len(indices) > 1:
+                    # Échec dans le lot : on relance ce payload seul pour journaliser l'erreur du décodeur
+                    decoded = self.run_decoder(uplink, decoder)
+                if decoded is not None:
+                    results[i] = self.finish_message(uplink, decoder, decoded, detail)
+        return results
+
+
+# Construction du point InfluxDB à partir de champs déjà validés par Decoder.coerce() ({nom: float})
+# timestamp : horodatage de l'uplink, déjà ramené à precision
+def build_point(dev_eui, fields, timestamp, precision="ns"):
+    point = Point("iot").tag("dev_eui", dev_eui)
+    point.time(timestamp, precision)
+    for key, value in fields.items():
+        point.field(key, value)
+    return point
+
+
+# Enregistrement à passer à la write API pour tous les points d'un uplink, en une seule écriture :
+# lignes encodées jointes (bytes, encoder="line") ou liste de Point (encoder="point")
+# points : [(timestamp_ns, {nom: float}), ...] ; retourne None si aucun champ n'est écrivable
+def encode_record(dev_eui, points, encoder="line", precision="ns"):
+    divisor = PRECISION_DIVISORS[precision]
+    if encoder == "point":
+        return [build_point(dev_eui, fields, timestamp_ns // divisor, precision)
+                for timestamp_ns, fields in points] or None
+    return line_protocol.encode_batch(
+        (dev_eui, fields, timestamp_ns // divisor) for timestamp_ns, fields in points
+    ) or None
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# Parsing des uplinks TTN v3 : on n'extrait que les champs utilisés par le listener
+#
+# Backends (UPLINK_PARSER) :
+#   msgspec : schéma typé limité à nos champs, le reste du message (rx_metadata, settings...) est sauté
+#   orjson  : parsing complet, mais bien plus rapide que json
+#   json    : bibliothèque standard (toujours disponible)
+#   auto    : le plus rapide des backends installés (par défaut)
+#
+# Horodatage (UPLINK_TIME_SOURCE) :
+#   received_at : réception par le network server (uplink_message.received_at, sinon received_at du message)
+#   gateway     : heure de la première passerelle qui la fournit (rx_metadata[].time), sinon received_at
+#
+# RSSI : meilleur rssi (ou channel_rssi) parmi les passerelles qui ont reçu le message, None sans rx_metadata
+import os
+import json
+import time
+import logging
+import calendar
+import functools
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+UPLINK_PARSER = os.getenv("UPLINK_PARSER", "auto")
+UPLINK_TIME_SOURCE = os.getenv("UPLINK_TIME_SOURCE", "received_at")
+
+TIME_SOURCES = ("received_at", "gateway")
+
+
+class Uplink(NamedTuple):
+    dev_eui: str
+    frm_payload: Optional[str]
+    f_port: Optional[int]
+    received_at: Optional[str] = None  # horodatage RFC 3339 selon UPLINK_TIME_SOURCE
+    rssi: Optional[float] = None       # meilleur RSSI des passerelles (dBm)
+
+
+def _gateway_time(rx_metadata):
+    for rx in rx_metadata or ():
+        gateway_time = rx.get("time")
+        if gateway_time:
+            return gateway_time
+
+
+def _best_rssi(rx_metadata):
+    best = None
+    for rx in rx_metadata or ():
+        rssi = rx.get("rssi", rx.get("channel_rssi"))
+        if rssi is not None and (best is None or rssi > best):
+            best = rssi
+    return best
+
+
+def _from_dict(payload, gateway=False):
+    uplink = payload["uplink_message"]
+    rx_metadata = uplink.get("rx_metadata")
+    received_at = uplink.get("received_at") or payload.get("received_at")
+    if gateway:
+        received_at = _gateway_time(rx_metadata) or received_at
+    return Uplink(payload["end_device_ids"]["dev_eui"], uplink.get("frm_payload"), uplink.get("f_port"),
+                  received_at, _best_rssi(rx_metadata))
+
+
+@functools.lru_cache(maxsize=1024)
+def _minute_epoch(prefix):
+    return calendar.timegm(time.strptime(prefix, "%Y-%m-%dT%H:%M"))
+
+
+def parse_time_ns(text):
+    """
+    Horodatage RFC 3339 (ex. "2024-05-01T12:00:00.123456789Z") -> nanosecondes depuis l'epoch.
+
+    Le cas courant (UTC, suffixe Z) est découpé à la main avec un cache par minute ;
+    les autres formes passent par datetime. Retourne None si le texte est absent ou illisible.
+    """
+    if not text:
+        return None
+    try:
+        if text.endswith("Z") and len(text) >= 20 and text[19] in ".Z":
+            fraction = text[20:-1]
+            nanos = int(fraction[:9].ljust(9, "0")) if fraction else 0
+            return (_minute_epoch(text[:16]) + int(text[17:19])) * 1_000_000_000 + nanos
+        parsed = datetime.fromisoformat(text)
+        if parsed.tzinfo is None:
+            return None
+        return calendar.timegm(parsed.utctimetuple()) * 1_000_000_000 + parsed.microsecond * 1000
+    except ValueError:
+        return None
+
+
+def _make_json_parser(gateway=False):
+    def parse(raw):
+        return _from_dict(json.loads(raw), gateway)
+    return parse
+
+
+def _make_orjson_parser(gateway=False):
+    import orjson
+
+    def parse(raw):
+        return _from_dict(orjson.loads(raw), gateway)
+    return parse
+
+
+def _make_msgspec_parser(gateway=False):
+    import msgspec
+
+    class EndDeviceIds(msgspec.Struct):
+        dev_eui: str
+
+    # Seuls l'heure et le RSSI de chaque passerelle sont décodés, le reste de rx_metadata est sauté
+    class RxMetadata(msgspec.Struct):
+        time: Optional[str] = None
+        rssi: Optional[float] = None
+        channel_rssi: Optional[float] = None
+
+    class UplinkMessage(msgspec.Struct):
+        frm_payload: Optional[str] = None
+        f_port: Optional[int] = None
+        received_at: Optional[str] = None
+        rx_metadata: Optional[list[RxMetadata]] = None
+
+    class Envelope(msgspec.Struct):
+        end_device_ids: EndDeviceIds
+        uplink_message: UplinkMessage
+        received_at: Optional[str] = None
+
+    decoder = msgspec.json.Decoder(Envelope)
+
+    def parse(raw):
+        msg = decoder.decode(raw)
+        uplink = msg.uplink_message
+        received_at = uplink.received_at or msg.received_at
+        rx_metadata = uplink.rx_metadata or ()
+        if gateway:
+            for rx in rx_metadata:
+                if rx.time:
+                    received_at = rx.time
+                    break
+        rssi = None
+        for rx in rx_metadata:
+            value = rx.rssi if rx.rssi is not None else rx.channel_rssi
+            if value is not None and (rssi is None or value > rssi):
+                rssi = value
+        return Uplink(msg.end_device_ids.dev_eui, uplink.frm_payload, uplink.f_port, received_at, rssi)
+    return parse
+
+
+BACKENDS = {
+    "msgspec": _make_msgspec_parser,
+    "orjson": _make_orjson_parser,
+    "json": _make_json_parser,
+}
+
+
+def available_backends():
+    """Noms des backends importables dans cet environnement, du plus rapide au plus lent."""
+    names = []
+    for name, factory in BACKENDS.items():
+        try:
+            factory()
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+def get_parser(backend: str = UPLINK_PARSER, time_source: str = UPLINK_TIME_SOURCE):
+    """
+    Retourne (nom du backend, fonction parse(raw: bytes) -> Uplink).
+
+    La fonction lève une exception (KeyError, ValueError...) si le message est mal formé.
+    """
+    if backend == "auto":
+        backend = available_backends()[0]
+    if backend not in BACKENDS:
+        raise ValueError(f"Parser d'uplink inconnu: {backend}")
+    if time_source not in TIME_SOURCES:
+        raise ValueError(f"Source d'horodatage inconnue: {time_source}")
+    gateway = time_source == "gateway"
+    try:
+        return backend, BACKENDS[backend](gateway)
+    except ImportError as e:
+        logging.warning(f"Parser '{backend}' indisponible ({e}), repli sur json")
+        return "json", _make_json_parser(gateway)
+
+
+PARSER_NAME, parse_uplink = get_parser()
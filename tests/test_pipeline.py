@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# File d'entrée du pipeline : débordement disque (ordre, relecture, reprise après redémarrage)
+# et repli sur le décodage message par message quand le décodage groupé échoue
+#
+# Usage : python3 -m pytest tests/  (ou python3 -m unittest discover tests)
+import os
+import sys
+import queue
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+
+import metrics    # noqa: E402
+import pipeline   # noqa: E402
+
+
+class SpillQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.spill_file = os.path.join(self.directory, "spill.ndjson")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def make_queue(self):
+        return pipeline.BoundedQueue("test", 4, "spill", self.spill_file, encode=lambda item: item,
+                                     decode=lambda record: record)
+
+    def fill(self, q, count=10):
+        for n in range(count):
+            q.put(n)
+
+    def test_spill_keeps_arrival_order(self):
+        q = self.make_queue()
+        self.fill(q)
+        self.assertEqual(q.qsize(), 4)
+        self.assertEqual(q.spilled, 6)
+        # Une place libre en mémoire ne doit pas doubler les messages encore sur disque
+        q.get()
+        q.put(10)
+        self.assertEqual(q.spilled, 7)
+        self.assertEqual([q.get(block=False) for _ in range(10)], list(range(1, 11)))
+        self.assertRaises(queue.Empty, q.get, False)
+
+    def test_refill_below_half_and_reset_when_drained(self):
+        q = self.make_queue()
+        self.fill(q)
+        self.assertEqual([q.get(), q.get(), q.get()], [0, 1, 2])
+        # File encore à moitié pleine : le disque n'est pas relu
+        self.assertEqual(q.spilled, 6)
+        self.assertEqual(q.get(), 3)
+        # Relecture jusqu'à remplir la file (1 + 3 places)
+        self.assertEqual(q.spilled, 3)
+        self.assertEqual(q.qsize(), 3)
+        self.assertEqual([q.get() for _ in range(6)], list(range(4, 10)))
+        self.assertEqual(q.spilled, 0)
+        self.assertEqual(os.path.getsize(self.spill_file), 0)
+        self.assertFalse(os.path.exists(self.spill_file + ".pos"))
+
+    def test_position_survives_restart(self):
+        q = self.make_queue()
+        self.fill(q)
+        self.assertEqual([q.get() for _ in range(4)], [0, 1, 2, 3])
+        self.assertTrue(os.path.exists(self.spill_file + ".pos"))
+
+        # Redémarrage : seuls les messages encore sur disque sont repris (4 à 6 étaient en mémoire)
+        restarted = self.make_queue()
+        self.assertEqual(restarted.spilled, 3)
+        self.assertEqual([restarted.get() for _ in range(3)], [7, 8, 9])
+        self.assertEqual(restarted.spilled, 0)
+
+
+class BatchDecodeFallbackTest(unittest.TestCase):
+    def test_failed_batch_is_decoded_one_by_one(self):
+        written = []
+
+        def batch_decode(items):
+            raise RuntimeError("décodage groupé impossible")
+
+        def decode(topic, payload):
+            if payload == b"illisible":
+                raise ValueError("trame invalide")
+            return topic, payload
+
+        p = pipeline.Pipeline(decode, written.append, workers=1, policy="block", stats_interval=0,
+                              batch_decode_fn=batch_decode)
+        # Messages en file avant le démarrage du worker : décodés en un seul lot
+        for payload in (b"a", b"illisible", b"b"):
+            p.submit("up", payload)
+        failures = metrics.PIPELINE_BATCH_FAILURES.labels().value
+        p.start()
+        p.stop()
+        self.assertEqual(written, [("up", b"a"), ("up", b"b")])
+        self.assertEqual(metrics.PIPELINE_BATCH_FAILURES.labels().value, failures + 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
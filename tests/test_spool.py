@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# Rejeu du spool : erreurs transitoires (rejeu interrompu) et refus définitifs (dead-letter)
+#
+# Usage : python3 -m pytest tests/  (ou python3 -m unittest discover tests)
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+
+from influxdb_client.rest import ApiException   # noqa: E402
+import spool                                    # noqa: E402
+import influx_writer                            # noqa: E402
+
+
+class SpoolReplayTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.spool = spool.Spool(self.directory)
+        for n in range(3):
+            self.spool.append("bucket", "ns", f"m v={n}i {n}")
+        self.spool.rotate()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def dead_letters(self):
+        path = os.path.join(self.directory, spool.DEAD_LETTER_FILE)
+        if not os.path.exists(path):
+            return []
+        with open(path) as f:
+            return [json.loads(line)["d"] for line in f]
+
+    def test_transient_error_keeps_position(self):
+        written = []
+
+        def write_fn(bucket, precision, data):
+            if len(written) == 1:
+                raise ConnectionError("InfluxDB indisponible")
+            written.append(data)
+
+        self.assertEqual(self.spool.replay_once(write_fn, rate=0), 1)
+        self.assertTrue(self.spool.pending())
+        self.assertEqual(self.dead_letters(), [])
+
+        # InfluxDB revenu : le rejeu reprend au lot en échec, sans doublon
+        self.assertEqual(self.spool.replay_once(lambda b, p, d: written.append(d), rate=0), 2)
+        self.assertEqual(written, ["m v=0i 0", "m v=1i 1", "m v=2i 2"])
+        self.assertFalse(self.spool.pending())
+
+    def test_permanent_error_moves_batch_to_dead_letter(self):
+        written = []
+
+        def write_fn(bucket, precision, data):
+            if data == "m v=1i 1":
+                raise spool.PermanentWriteError("HTTP 400")
+            written.append(data)
+
+        self.assertEqual(self.spool.replay_once(write_fn, rate=0), 2)
+        self.assertEqual(written, ["m v=0i 0", "m v=2i 2"])
+        self.assertEqual(self.dead_letters(), ["m v=1i 1"])
+        self.assertFalse(self.spool.pending())
+
+    def test_cap_keeps_segment_being_replayed(self):
+        # Un segment par lot, plafond déjà dépassé par le segment rejoué
+        capped = spool.Spool(self.directory, segment_size=1, max_bytes=100)
+        replaying = capped.segments()[0]
+        written = []
+
+        def write_fn(bucket, precision, data):
+            if written:
+                raise ConnectionError("InfluxDB indisponible")
+            written.append(data)
+            # Écritures en échec pendant le rejeu : le plafond s'applique aux autres segments
+            for n in range(3):
+                capped.append("bucket", "ns", f"m v={n}i 1{n}")
+
+        self.assertEqual(capped.replay_once(write_fn, rate=0), 1)
+        segments = capped.segments()
+        self.assertEqual(segments[0], replaying)
+        # Aucune position orpheline : chaque .pos correspond à un segment présent
+        for name in os.listdir(self.directory):
+            if name.endswith(".pos"):
+                self.assertIn(name[:-4] + ".ndjson", segments)
+
+        # Le rejeu reprend au lot suivant du segment conservé
+        written.clear()
+        capped.replay_once(lambda b, p, d: written.append(d), rate=0)
+        self.assertEqual(written[:2], ["m v=1i 1", "m v=2i 2"])
+
+
+class ReplayWriteClassificationTest(unittest.TestCase):
+    def replay_write(self, exception):
+        with mock.patch.object(influx_writer, "write_now", side_effect=exception), \
+                mock.patch.object(influx_writer, "invalidate_bucket") as invalidate:
+            with self.assertRaises(Exception) as raised:
+                influx_writer._replay_write("bucket", "ns", "m v=1i 1")
+        return raised.exception, invalidate
+
+    def test_client_errors_are_permanent(self):
+        for status in (400, 413, 422):
+            error, _ = self.replay_write(ApiException(status=status, reason="refusé"))
+            self.assertIsInstance(error, spool.PermanentWriteError, status)
+
+    def test_transient_errors_are_retried(self):
+        for exception in (ApiException(status=429), ApiException(status=503), ConnectionError("refusée")):
+            error, _ = self.replay_write(exception)
+            self.assertNotIsInstance(error, spool.PermanentWriteError, exception)
+
+    def test_missing_bucket_is_retried_after_invalidation(self):
+        error, invalidate = self.replay_write(ApiException(status=404, reason="bucket not found"))
+        self.assertNotIsInstance(error, spool.PermanentWriteError)
+        invalidate.assert_called_once_with("bucket")
+
+
+if __name__ == "__main__":
+    unittest.main()